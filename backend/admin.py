@@ -6,12 +6,17 @@ Script de administración para gestionar licencias
 
 import sys
 import os
+import io
+import csv
+import json
+import argparse
 from datetime import datetime
 
 # Añadir path del módulo
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'api'))
 
 from api.database import db
+from api.company_profiles import validar_perfil
 
 def print_header():
     print("=" * 60)
@@ -62,18 +67,7 @@ def list_licenses():
     print("\n📋 ALL LICENSES")
     print("-" * 120)
     
-    conn = db.get_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        SELECT license_key, email, company_name, credits_total, credits_used, 
-               active, created_at, last_used
-        FROM licenses
-        ORDER BY created_at DESC
-    ''')
-    
-    licenses = cursor.fetchall()
-    conn.close()
+    licenses = db.list_licenses()
     
     if not licenses:
         print("No licenses found.")
@@ -149,15 +143,7 @@ def reset_credits():
     confirm = input("⚠️  Reset credits for this license? (yes/no): ").lower()
     
     if confirm == 'yes':
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            UPDATE licenses SET credits_used = 0 WHERE license_key = ?
-        ''', (key,))
-        
-        conn.commit()
-        conn.close()
+        db.reset_credits_bulk([key])
         
         print("✅ Credits reset successfully!")
     else:
@@ -177,15 +163,8 @@ def deactivate_license():
     confirm = input("⚠️  Are you sure? This will block access. (yes/no): ").lower()
     
     if confirm == 'yes':
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            UPDATE licenses SET active = 0 WHERE license_key = ?
-        ''', (key,))
-        
-        conn.commit()
-        conn.close()
+        # Desactiva y sube el epoch de revocación (los tokens de sesión dejan de valer)
+        db.deactivate_license(key)
         
         print("✅ License deactivated!")
     else:
@@ -205,16 +184,8 @@ def reset_devices():
     confirm = input("⚠️  Remove all registered devices? (yes/no): ").lower()
     
     if confirm == 'yes':
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            DELETE FROM devices WHERE license_key = ?
-        ''', (key,))
-        
-        affected = cursor.rowcount
-        conn.commit()
-        conn.close()
+        # Borra dispositivos y revoca los tokens emitidos para ellos
+        affected = db.reset_devices_bulk([key])
         
         print(f"✅ Removed {affected} device(s)!")
     else:
@@ -255,7 +226,236 @@ def main_menu():
         
         input("\nPress ENTER to continue...")
 
+# ============================================
+# CLI NO INTERACTIVA (scripts / operaciones en lote)
+# ============================================
+
+def read_records(path):
+    """Leer registros desde CSV (con cabecera) o JSON (lista u objeto con 'licenses')"""
+    if path == '-':
+        content = sys.stdin.read()
+    else:
+        with open(path, 'r', encoding='utf-8') as f:
+            content = f.read()
+    
+    stripped = content.lstrip()
+    if stripped.startswith('[') or stripped.startswith('{'):
+        data = json.loads(content)
+        return data.get('licenses', []) if isinstance(data, dict) else data
+    
+    return list(csv.DictReader(io.StringIO(content)))
+
+def read_keys(args):
+    """Claves de licencia desde argumentos y/o --file (una por línea, CSV o JSON: claves u objetos)"""
+    keys = list(args.keys)
+    if args.file:
+        records = read_records(args.file)
+        if records and all(isinstance(r, str) for r in records):
+            # JSON: lista de claves
+            keys.extend(r.strip() for r in records if r.strip())
+        elif records and isinstance(records[0], dict) and 'license_key' in records[0]:
+            keys.extend(r['license_key'] for r in records)
+        else:
+            # Texto plano: una clave por línea
+            with open(args.file, 'r', encoding='utf-8') as f:
+                keys.extend(line.strip() for line in f if line.strip())
+    return keys
+
+def print_progress(done, total):
+    """Progreso en stderr para no mezclarlo con la salida"""
+    percent = (done * 100 // total) if total else 100
+    sys.stderr.write(f"\r⏳ {done}/{total} ({percent}%)")
+    if done >= total:
+        sys.stderr.write("\n")
+    sys.stderr.flush()
+
+def write_results(results, output):
+    """Escribir resultados por fila como CSV (archivo o stdout)"""
+    fields = ['row', 'email', 'license_key', 'credits', 'reset_date', 'success', 'error']
+    handle = open(output, 'w', newline='', encoding='utf-8') if output else sys.stdout
+    writer = csv.DictWriter(handle, fieldnames=fields, extrasaction='ignore')
+    writer.writeheader()
+    writer.writerows(results)
+    if output:
+        handle.close()
+
+def cmd_create(args):
+    records = read_records(args.file) if args.file else [{
+        'email': args.email,
+        'company_name': args.company,
+        'credits': args.credits,
+        'months': args.months
+    }]
+    if not args.file and not args.email:
+        print("❌ --email or --file is required", file=sys.stderr)
+        return 1
+    
+    results = db.create_licenses_bulk(records, progress=print_progress)
+    write_results(results, args.output)
+    
+    created = sum(1 for r in results if r.get('success'))
+    print(f"✅ Created {created}/{len(results)} license(s)", file=sys.stderr)
+    return 0 if created == len(results) else 2
+
+def cmd_reset_credits(args):
+    affected = db.reset_credits_bulk(read_keys(args), progress=print_progress)
+    print(f"✅ Credits reset for {affected} license(s)", file=sys.stderr)
+    return 0
+
+def cmd_deactivate(args):
+    affected = db.deactivate_licenses_bulk(read_keys(args), progress=print_progress)
+    print(f"✅ Deactivated {affected} license(s)", file=sys.stderr)
+    return 0
+
+def cmd_reset_devices(args):
+    affected = db.reset_devices_bulk(read_keys(args), progress=print_progress)
+    print(f"✅ Removed {affected} device(s)", file=sys.stderr)
+    return 0
+
+def cmd_grant(args):
+    if not db.grant_credits(args.key, args.amount, note=args.note):
+        print("❌ License not found", file=sys.stderr)
+        return 1
+    print(f"✅ Granted {args.amount} credit(s)", file=sys.stderr)
+    return 0
+
+def cmd_usage(args):
+    report = {
+        'license_key': args.key,
+        'balance': db.credit_summary(args.key, args.until),
+        'history': db.credit_history(args.key, args.since, args.until, limit=args.limit)
+    }
+    if args.since:
+        report['used'] = db.credit_usage(args.key, args.since, args.until)
+    print(json.dumps(report, indent=2))
+    return 0
+
+def cmd_profile(args):
+    if args.set:
+        with (sys.stdin if args.set == '-' else open(args.set, 'r', encoding='utf-8')) as f:
+            profile = json.load(f)
+        try:
+            validar_perfil(profile)
+        except ValueError as e:
+            print(f"❌ {e}", file=sys.stderr)
+            return 1
+    elif not args.clear:
+        stored = db.get_company_profile(args.key)
+        if not stored:
+            print("❌ No company profile (using config.json)", file=sys.stderr)
+            return 1
+        print(json.dumps({'profile': stored[0], 'version': stored[1]}, indent=2))
+        return 0
+    
+    version = db.set_company_profile(args.key, None if args.clear else profile)
+    if version is None:
+        print("❌ License not found", file=sys.stderr)
+        return 1
+    print(f"✅ Company profile {'cleared' if args.clear else 'saved'} (version {version})", file=sys.stderr)
+    return 0
+
+def cmd_warm_cache(args):
+    from api.cache_warmer import cache_warmer
+    if args.if_quiet and not cache_warmer.trafico_bajo():
+        print("⏭️  Traffic too high, skipping", file=sys.stderr)
+        return 0
+    summary = cache_warmer.ejecutar(args.budget)
+    print(json.dumps(summary, indent=2))
+    return 0
+
+def cmd_snapshot(args):
+    taken = db.snapshot_credit_balances()
+    print(f"✅ Snapshot taken for {taken} license(s)", file=sys.stderr)
+    return 0
+
+def cmd_list(args):
+    licenses = db.list_licenses()
+    if args.format == 'json':
+        print(json.dumps(licenses, indent=2))
+    else:
+        writer = csv.DictWriter(sys.stdout, fieldnames=list(licenses[0].keys()) if licenses else ['license_key'])
+        writer.writeheader()
+        writer.writerows(licenses)
+    return 0
+
+def cmd_stats(args):
+    print(json.dumps(db.get_stats(), indent=2))
+    return 0
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="FDNY Auto-Filer license manager (run without arguments for the interactive menu)"
+    )
+    sub = parser.add_subparsers(dest='command', required=True)
+    
+    p = sub.add_parser('create', help='Create one license, or many from --file')
+    p.add_argument('--email')
+    p.add_argument('--company', default='')
+    p.add_argument('--credits', type=int, default=50)
+    p.add_argument('--months', type=int, default=1)
+    p.add_argument('--file', help='CSV/JSON with email, company_name, credits, months ("-" for stdin)')
+    p.add_argument('--output', help='Write per-row results as CSV to this file')
+    p.set_defaults(func=cmd_create)
+    
+    p = sub.add_parser('import', help='Bulk-create licenses from a CSV/JSON file')
+    p.add_argument('file', help='CSV/JSON with email, company_name, credits, months ("-" for stdin)')
+    p.add_argument('--output', help='Write per-row results as CSV to this file')
+    p.set_defaults(func=cmd_create, email=None)
+    
+    for name, func, help_text in [
+        ('reset-credits', cmd_reset_credits, 'Reset used credits'),
+        ('deactivate', cmd_deactivate, 'Deactivate licenses and revoke their sessions'),
+        ('reset-devices', cmd_reset_devices, 'Remove registered devices')
+    ]:
+        p = sub.add_parser(name, help=help_text)
+        p.add_argument('keys', nargs='*', help='License keys')
+        p.add_argument('--file', help='File with license keys (one per line, a JSON list of keys, or CSV/JSON with license_key)')
+        p.set_defaults(func=func)
+    
+    p = sub.add_parser('grant', help='Add credits to a license')
+    p.add_argument('key')
+    p.add_argument('amount', type=int)
+    p.add_argument('--note')
+    p.set_defaults(func=cmd_grant)
+    
+    p = sub.add_parser('usage', help='Credit balance and ledger history of a license')
+    p.add_argument('key')
+    p.add_argument('--since', help='Start date, inclusive (YYYY-MM-DD)')
+    p.add_argument('--until', help='End date, exclusive (YYYY-MM-DD)')
+    p.add_argument('--limit', type=int, default=50)
+    p.set_defaults(func=cmd_usage)
+    
+    p = sub.add_parser('profile', help="Show, set or clear a license's company profile")
+    p.add_argument('key')
+    group = p.add_mutually_exclusive_group()
+    group.add_argument('--set', metavar='FILE',
+                       help='JSON with fire_alarm_company, architect_applicant, '
+                            'electrical_contractor and/or central_station ("-" for stdin)')
+    group.add_argument('--clear', action='store_true', help='Remove the profile (use config.json)')
+    p.set_defaults(func=cmd_profile)
+    
+    p = sub.add_parser('warm-cache', help='Refresh BIN cache entries of frequently used buildings (run periodically)')
+    p.add_argument('--budget', type=int, help='Maximum Socrata requests for this run')
+    p.add_argument('--if-quiet', action='store_true', help='Only run if recent traffic is low')
+    p.set_defaults(func=cmd_warm_cache)
+    
+    p = sub.add_parser('snapshot', help='Snapshot credit balances (run periodically)')
+    p.set_defaults(func=cmd_snapshot)
+    
+    p = sub.add_parser('list', help='List all licenses')
+    p.add_argument('--format', choices=['csv', 'json'], default='csv')
+    p.set_defaults(func=cmd_list)
+    
+    p = sub.add_parser('stats', help='Show global statistics')
+    p.set_defaults(func=cmd_stats)
+    
+    return parser
+
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        args = build_parser().parse_args()
+        sys.exit(args.func(args))
+    
     try:
         main_menu()
     except KeyboardInterrupt:
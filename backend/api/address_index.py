@@ -0,0 +1,490 @@
+"""
+Búsqueda de BINs por dirección con un índice en memoria
+El índice se construye con los datos de edificio guardados localmente (bin_cache,
+que llenan las consultas y el pre-calentamiento, más un CSV semilla opcional, p. ej.
+una exportación de PAD o Building Footprints con bin/house/street/borough/zip).
+
+    clave exacta:  (borough, calle normalizada, número) -> documentos
+    trigramas:     trigrama -> ids de calle, para tolerar erratas en el nombre
+
+Calles y números se guardan una sola vez (internados, los documentos solo llevan
+sus ids), la clave exacta es un entero y las listas son array('I'). Cada
+ADDRESS_INDEX_REFRESH segundos se leen solo las filas de bin_cache nuevas desde la
+última marca: un BIN que cambia de dirección deja su documento anterior como borrado y se
+compacta cuando los borrados pasan de una cuarta parte.
+"""
+import csv
+import heapq
+import os
+import re
+import sys
+import threading
+import time
+from array import array
+
+from api.database import db
+from api.enrichment import fusionar
+
+# CSV con los edificios de partida ('' para usar solo bin_cache)
+ADDRESS_INDEX_SEED = os.environ.get('ADDRESS_INDEX_SEED', '')
+# Segundos entre lecturas incrementales de bin_cache
+ADDRESS_INDEX_REFRESH = float(os.environ.get('ADDRESS_INDEX_REFRESH', '60'))
+# Similitud mínima (Dice sobre trigramas) para considerar una calle
+ADDRESS_SEARCH_MIN_SIMILARITY = float(os.environ.get('ADDRESS_SEARCH_MIN_SIMILARITY', '0.5'))
+# Calles parecidas que se revisan por búsqueda
+ADDRESS_SEARCH_MAX_STREETS = int(os.environ.get('ADDRESS_SEARCH_MAX_STREETS', '20'))
+
+BOROUGHS = {1: 'MANHATTAN', 2: 'BRONX', 3: 'BROOKLYN', 4: 'QUEENS', 5: 'STATEN ISLAND'}
+_CODIGOS_BOROUGH = {
+    'MANHATTAN': 1, 'MN': 1, 'NEW YORK': 1, 'NEW YORK CITY': 1,
+    'BRONX': 2, 'THE BRONX': 2, 'BX': 2,
+    'BROOKLYN': 3, 'BK': 3, 'KINGS': 3,
+    'QUEENS': 4, 'QN': 4,
+    'STATEN ISLAND': 5, 'SI': 5, 'RICHMOND': 5,
+}
+_ABREVIATURAS = {
+    'STREET': 'ST', 'STR': 'ST', 'AVENUE': 'AVE', 'AV': 'AVE', 'BOULEVARD': 'BLVD',
+    'PLACE': 'PL', 'ROAD': 'RD', 'DRIVE': 'DR', 'PARKWAY': 'PKWY', 'LANE': 'LN',
+    'COURT': 'CT', 'TERRACE': 'TER', 'HIGHWAY': 'HWY', 'EXPRESSWAY': 'EXPY',
+    'SQUARE': 'SQ', 'PLAZA': 'PLZ', 'SAINT': 'ST', 'FORT': 'FT', 'MOUNT': 'MT',
+    'EAST': 'E', 'WEST': 'W', 'NORTH': 'N', 'SOUTH': 'S',
+    'FIRST': '1', 'SECOND': '2', 'THIRD': '3', 'FOURTH': '4', 'FIFTH': '5',
+    'SIXTH': '6', 'SEVENTH': '7', 'EIGHTH': '8', 'NINTH': '9', 'TENTH': '10',
+}
+_ORDINAL = re.compile(r'^(\d+)(ST|ND|RD|TH)$')
+_NO_ALFANUMERICO = re.compile(r'[^A-Z0-9 -]+')
+# Columnas aceptadas en el CSV semilla
+_COLUMNAS_SEMILLA = {
+    'bin': ('bin', 'bin_number'),
+    'house': ('house', 'house_number', 'housenumber', 'h_no'),
+    'street': ('street', 'street_name', 'streetname', 'st_name'),
+    'borough': ('borough', 'boro', 'boroid', 'boro_code'),
+    'zip': ('zip', 'zipcode', 'postcode', 'zip_code'),
+}
+
+
+# ==========================================
+# NORMALIZACIÓN
+# ==========================================
+
+def normalizar_calle(calle):
+    """'West 42nd Street' -> 'W 42 ST'"""
+    tokens = _NO_ALFANUMERICO.sub(' ', str(calle or '').upper().replace('.', '')).split()
+    normalizados = []
+    for token in tokens:
+        ordinal = _ORDINAL.match(token)
+        normalizados.append(ordinal.group(1) if ordinal else _ABREVIATURAS.get(token, token))
+    return ' '.join(normalizados)
+
+
+def normalizar_casa(casa):
+    """'12 - 34a' -> '12-34A'"""
+    return re.sub(r'\s*-\s*', '-', ' '.join(str(casa or '').upper().split())).replace(' ', '')
+
+
+def codigo_borough(borough):
+    """Código 1-5 a partir de código o nombre (0 si no se reconoce)"""
+    valor = ' '.join(str(borough or '').upper().split())
+    if valor in _CODIGOS_BOROUGH:
+        return _CODIGOS_BOROUGH[valor]
+    try:
+        codigo = int(valor)
+    except ValueError:
+        return 0
+    return codigo if codigo in BOROUGHS else 0
+
+
+def normalizar_zip(zip_code):
+    digitos = re.sub(r'\D', '', str(zip_code or ''))[:5]
+    return int(digitos) if len(digitos) == 5 else 0
+
+
+def trigramas(texto):
+    relleno = f"  {texto} "
+    return {relleno[i:i + 3] for i in range(len(relleno) - 2)}
+
+
+def _numero_casa(casa):
+    """Valor numérico del número de casa ('12-34' -> 1234, '12A' -> 12)"""
+    digitos = re.match(r'[\d-]+', casa or '')
+    digitos = digitos.group(0).replace('-', '') if digitos else ''
+    return int(digitos) if digitos else None
+
+
+def _puntuar_casa(buscada, casa):
+    if buscada == casa:
+        return 1.0
+    a, b = _numero_casa(buscada), _numero_casa(casa)
+    if a is None or b is None:
+        return 0.0
+    if a == b:
+        return 0.8
+    # Edificios cercanos en la misma calle
+    return max(0.0, 0.5 - abs(a - b) / 200)
+
+
+def separar_direccion(texto):
+    """
+    '123 W 42nd St, Manhattan NY 10036' -> {house, street, borough, zip}
+    El número es el primer token con dígitos; borough, estado y zip se quitan del final.
+    """
+    partes = [p.strip() for p in str(texto or '').upper().split(',') if p.strip()]
+    if not partes:
+        return {'house': '', 'street': '', 'borough': '', 'zip': ''}
+
+    resto = ' '.join(partes[1:]).split()
+    tokens = partes[0].split()
+    # Sin comas, borough y zip pueden venir al final de la misma parte
+    if len(partes) == 1:
+        resto = []
+        while tokens:
+            if re.fullmatch(r'\d{5}(-\d{4})?', tokens[-1]) or tokens[-1] == 'NY':
+                resto.insert(0, tokens.pop())
+                continue
+            dos = ' '.join(tokens[-2:])
+            if len(tokens) > 2 and dos in _CODIGOS_BOROUGH:
+                resto[:0] = tokens[-2:]
+                del tokens[-2:]
+            elif len(tokens) > 1 and tokens[-1] in _CODIGOS_BOROUGH and len(tokens[-1]) > 2:
+                resto.insert(0, tokens.pop())
+            else:
+                break
+
+    casa = ''
+    if tokens and re.match(r'^\d', tokens[0]) and len(tokens) > 1:
+        casa = tokens.pop(0)
+        # Queens: '12 - 34 JUNCTION BLVD'
+        if len(tokens) > 2 and tokens[0] == '-' and tokens[1][:1].isdigit():
+            casa += '-' + tokens[1]
+            del tokens[:2]
+
+    borough = zip_code = ''
+    resto_texto = ' '.join(resto)
+    for nombre in sorted(_CODIGOS_BOROUGH, key=len, reverse=True):
+        if re.search(rf'\b{nombre}\b', resto_texto):
+            borough = nombre
+            break
+    codigo_postal = re.search(r'\b\d{5}\b', resto_texto)
+    if codigo_postal:
+        zip_code = codigo_postal.group(0)
+    return {'house': casa, 'street': ' '.join(tokens), 'borough': borough, 'zip': zip_code}
+
+
+def direccion_de_cache(fuentes):
+    """(house, street, borough, zip) de un BIN a partir de sus datasets cacheados"""
+    datos = fusionar({f: r for f, r in fuentes.items() if isinstance(r, dict) and 'campos' in r})
+    borough = codigo_borough(datos['borough'])
+    if not borough and datos['bbl'][:1].isdigit():
+        borough = codigo_borough(datos['bbl'][:1])
+    return datos['house'], datos['street'], borough, datos['zip']
+
+
+# ==========================================
+# ÍNDICE
+# ==========================================
+
+class AddressIndex:
+    """Índice de direcciones -> BIN, en memoria y actualizable por incrementos"""
+
+    def __init__(self, db, semilla=ADDRESS_INDEX_SEED, actualizacion=ADDRESS_INDEX_REFRESH):
+        self.db = db
+        self.semilla = semilla
+        self.actualizacion = actualizacion
+        self._lock = threading.RLock()
+        self._construido = False
+        self._marca = None
+        self._comprobado = 0.0
+        self._firma_semilla = None
+        self._vaciar()
+
+    def _vaciar(self):
+        # Calles internadas: id -> nombre, y sus trigramas
+        self.calles = []
+        self._id_calle = {}
+        self._ntrigramas = array('H')
+        self._por_trigrama = {}
+        self._docs_calle = []
+        # Números de casa internados: id -> número
+        self.casas = []
+        self._id_casa = {}
+        # Un documento por edificio, en arrays paralelos
+        self.doc_bin = array('I')
+        self.doc_calle = array('I')
+        self.doc_borough = array('B')
+        self.doc_zip = array('I')
+        self.doc_casa = array('I')
+        self._vivo = bytearray()
+        self.borrados = 0
+        self._doc_de_bin = {}
+        # clave(borough, id de calle, id de número) -> doc, o array('I') si hay varios
+        self._exactas = {}
+
+    def _calle(self, nombre):
+        id_calle = self._id_calle.get(nombre)
+        if id_calle is None:
+            nombre = sys.intern(nombre)
+            id_calle = len(self.calles)
+            self.calles.append(nombre)
+            self._id_calle[nombre] = id_calle
+            self._docs_calle.append(array('I'))
+            tris = trigramas(nombre)
+            self._ntrigramas.append(min(len(tris), 0xFFFF))
+            for tri in tris:
+                lista = self._por_trigrama.get(tri)
+                if lista is None:
+                    lista = self._por_trigrama[sys.intern(tri)] = array('I')
+                lista.append(id_calle)
+        return id_calle
+
+    def _casa(self, casa):
+        id_casa = self._id_casa.get(casa)
+        if id_casa is None:
+            id_casa = self._id_casa[casa] = len(self.casas)
+            self.casas.append(sys.intern(casa))
+        return id_casa
+
+    @staticmethod
+    def _clave(borough, id_calle, id_casa):
+        return (id_casa << 24 | id_calle) << 3 | borough
+
+    def anadir(self, bin_number, casa, calle, borough, zip_code):
+        """Indexar (o reindexar) un edificio; False si no cambia o no es indexable"""
+        bin_number = str(bin_number or '').strip()
+        calle = normalizar_calle(calle)
+        if not bin_number.isdigit() or not calle:
+            return False
+        bin_int = int(bin_number)
+        casa = normalizar_casa(casa)
+        borough = codigo_borough(borough)
+        zip_code = normalizar_zip(zip_code)
+
+        with self._lock:
+            anterior = self._doc_de_bin.get(bin_int)
+            if anterior is not None:
+                if (self.calles[self.doc_calle[anterior]] == calle and self.casas[self.doc_casa[anterior]] == casa
+                        and self.doc_borough[anterior] == borough and self.doc_zip[anterior] == zip_code):
+                    return False
+                self._vivo[anterior] = 0
+                self.borrados += 1
+
+            id_calle = self._calle(calle)
+            id_casa = self._casa(casa)
+            doc = len(self.doc_bin)
+            self.doc_bin.append(bin_int)
+            self.doc_calle.append(id_calle)
+            self.doc_borough.append(borough)
+            self.doc_zip.append(zip_code)
+            self.doc_casa.append(id_casa)
+            self._vivo.append(1)
+            self._docs_calle[id_calle].append(doc)
+            self._doc_de_bin[bin_int] = doc
+
+            clave = self._clave(borough, id_calle, id_casa)
+            actual = self._exactas.get(clave)
+            if actual is None:
+                self._exactas[clave] = doc
+            elif isinstance(actual, int):
+                self._exactas[clave] = array('I', [actual, doc])
+            else:
+                actual.append(doc)
+            return True
+
+    def _compactar(self):
+        """Reconstruir sin los documentos borrados (las listas solo crecen)"""
+        vivos = [(self.doc_bin[d], self.casas[self.doc_casa[d]], self.calles[self.doc_calle[d]],
+                  self.doc_borough[d], self.doc_zip[d])
+                 for d in range(len(self.doc_bin)) if self._vivo[d]]
+        self._vaciar()
+        for bin_int, casa, calle, borough, zip_code in vivos:
+            self.anadir(bin_int, casa, calle, borough, zip_code)
+
+    # ==========================================
+    # CONSTRUCCIÓN Y ACTUALIZACIÓN
+    # ==========================================
+
+    def _cargar_semilla(self):
+        self._firma_semilla = self._firma(self.semilla)
+        if not self._firma_semilla:
+            return 0
+        indexados = 0
+        with open(self.semilla, newline='', encoding='utf-8-sig') as f:
+            lector = csv.DictReader(f)
+            columnas = {c.strip().lower(): c for c in lector.fieldnames or []}
+            origen = {campo: next((columnas[a] for a in alias if a in columnas), None)
+                      for campo, alias in _COLUMNAS_SEMILLA.items()}
+            for fila in lector:
+                valores = {campo: fila.get(columna, '') if columna else '' for campo, columna in origen.items()}
+                indexados += self.anadir(valores['bin'], valores['house'], valores['street'],
+                                         valores['borough'], valores['zip'])
+        return indexados
+
+    @staticmethod
+    def _firma(path):
+        try:
+            st = os.stat(path) if path else None
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size) if st else None
+
+    def _aplicar_cache(self, filas):
+        """Reindexar los BINs de unas filas de bin_cache; devuelve los que cambiaron"""
+        por_bin = {}
+        for fila in filas:
+            por_bin.setdefault(fila['bin'], {})[fila['source']] = fila['data']
+            if self._marca is None or fila['fetched_at'] > self._marca:
+                self._marca = fila['fetched_at']
+        return sum(self.anadir(bin_number, *direccion_de_cache(fuentes))
+                   for bin_number, fuentes in por_bin.items())
+
+    def construir(self):
+        """Construcción completa: semilla + todo bin_cache"""
+        inicio = time.perf_counter()
+        with self._lock:
+            self._vaciar()
+            self._marca = None
+            self._cargar_semilla()
+            self._aplicar_cache(self.db.bin_cache_changes())
+            self._construido = True
+            self._comprobado = time.monotonic()
+            stats = self.stats()
+        print(f"🔎 Address index built: {stats['buildings']} building(s), {stats['streets']} street(s) "
+              f"in {(time.perf_counter() - inicio) * 1000:.0f} ms")
+        return stats
+
+    def actualizar(self):
+        """Incremento: solo los BINs guardados en bin_cache desde la última marca"""
+        with self._lock:
+            if not self._construido or self._firma(self.semilla) != self._firma_semilla:
+                self.construir()
+                return None
+            # >= marca: lo guardado en el mismo segundo que la marca se relee (es idempotente)
+            cambiados = self._aplicar_cache(self.db.bin_cache_changes(self._marca))
+            if self.borrados > 1000 and self.borrados * 4 > len(self.doc_bin):
+                self._compactar()
+            self._comprobado = time.monotonic()
+            return cambiados
+
+    def asegurar_al_dia(self):
+        """Construir en el primer uso y actualizar cada `actualizacion` segundos"""
+        if self._construido and time.monotonic() - self._comprobado < self.actualizacion:
+            return
+        with self._lock:
+            if self._construido and time.monotonic() - self._comprobado < self.actualizacion:
+                return
+            if self._construido:
+                self.actualizar()
+            else:
+                self.construir()
+
+    def stats(self):
+        with self._lock:
+            memoria = sum(a.itemsize * len(a) for a in (self.doc_bin, self.doc_calle, self.doc_casa,
+                                                         self.doc_borough, self.doc_zip, self._ntrigramas))
+            memoria += sum(a.itemsize * len(a) for a in self._docs_calle)
+            memoria += sum(a.itemsize * len(a) for a in self._por_trigrama.values())
+            return {
+                'buildings': len(self.doc_bin) - self.borrados,
+                'deleted': self.borrados,
+                'streets': len(self.calles),
+                'house_numbers': len(self.casas),
+                'trigrams': len(self._por_trigrama),
+                'postings_bytes': memoria,
+                'watermark': self._marca,
+            }
+
+    # ==========================================
+    # BÚSQUEDA
+    # ==========================================
+
+    def _docs_exactos(self, clave):
+        docs = self._exactas.get(clave)
+        if docs is None:
+            return []
+        return [docs] if isinstance(docs, int) else list(docs)
+
+    def _calles_parecidas(self, calle, maximo):
+        """[(similitud, id de calle)] por coeficiente de Dice sobre trigramas"""
+        tris = trigramas(calle)
+        # Los trigramas muy comunes (' ST', 'AVE') no discriminan: solo se usan para puntuar
+        comun = max(2000, len(self.calles) // 5)
+        coincidencias = {}
+        for tri in tris:
+            lista = self._por_trigrama.get(tri)
+            if lista is None or len(lista) > comun:
+                continue
+            for id_calle in lista:
+                coincidencias[id_calle] = coincidencias.get(id_calle, 0) + 1
+
+        parecidas = []
+        for _, id_calle in heapq.nlargest(maximo * 10, ((n, c) for c, n in coincidencias.items())):
+            similitud = 2 * len(tris & trigramas(self.calles[id_calle])) / (len(tris) + self._ntrigramas[id_calle])
+            if similitud >= ADDRESS_SEARCH_MIN_SIMILARITY:
+                parecidas.append((similitud, id_calle))
+        return heapq.nlargest(maximo, parecidas)
+
+    def _candidato(self, doc, puntuacion, coincidencia):
+        return {
+            'bin': str(self.doc_bin[doc]),
+            'house': self.casas[self.doc_casa[doc]],
+            'street': self.calles[self.doc_calle[doc]],
+            'borough': BOROUGHS.get(self.doc_borough[doc], ''),
+            'zip': f"{self.doc_zip[doc]:05d}" if self.doc_zip[doc] else '',
+            'score': round(puntuacion, 3),
+            'match': coincidencia,
+        }
+
+    def buscar(self, house='', street='', borough='', zip_code='', limite=10):
+        """
+        Candidatos ordenados de más a menos probable: [{bin, house, street, borough, zip, score, match}]
+        Una dirección exacta (número + calle normalizada + borough) se resuelve con
+        una consulta al diccionario; si no, se buscan calles parecidas y se puntúan
+        similitud de calle, cercanía del número, borough y zip.
+        """
+        calle = normalizar_calle(street)
+        casa = normalizar_casa(house)
+        borough = codigo_borough(borough)
+        zip_code = normalizar_zip(zip_code)
+        if not calle:
+            return []
+
+        with self._lock:
+            # 1. Clave exacta
+            id_calle = self._id_calle.get(calle)
+            id_casa = self._id_casa.get(casa)
+            if id_calle is not None and id_casa is not None:
+                boroughs = [borough, 0] if borough else list(BOROUGHS) + [0]
+                docs = [d for b in boroughs for d in self._docs_exactos(self._clave(b, id_calle, id_casa))
+                        if self._vivo[d]]
+                if docs:
+                    return [self._candidato(d, 1.0, 'exact') for d in docs[:limite]]
+
+            # 2. Calles parecidas (erratas, abreviaturas distintas)
+            puntuados = {}
+            for similitud, id_calle in self._calles_parecidas(calle, ADDRESS_SEARCH_MAX_STREETS):
+                for doc in self._docs_calle[id_calle]:
+                    if not self._vivo[doc]:
+                        continue
+                    # La calle pesa más que el número: mismo número en otra calle es otro edificio
+                    puntuacion = 2 * similitud
+                    if casa:
+                        puntuacion_casa = _puntuar_casa(casa, self.casas[self.doc_casa[doc]])
+                        if not puntuacion_casa:
+                            continue
+                        puntuacion += puntuacion_casa
+                    if borough and self.doc_borough[doc]:
+                        puntuacion += 0.2 if self.doc_borough[doc] == borough else -0.5
+                    if zip_code and self.doc_zip[doc] == zip_code:
+                        puntuacion += 0.1
+                    bin_int = self.doc_bin[doc]
+                    if puntuacion > puntuados.get(bin_int, (-1, 0))[0]:
+                        puntuados[bin_int] = (puntuacion, doc)
+
+            # Puntuación máxima posible: calle 2 + número 1 + borough 0.2 + zip 0.1
+            maximo = 2 + (1 if casa else 0) + (0.2 if borough else 0) + (0.1 if zip_code else 0)
+            mejores = heapq.nlargest(limite, puntuados.items(), key=lambda item: (item[1][0], -item[0]))
+            return [self._candidato(doc, max(puntuacion, 0) / maximo, 'fuzzy')
+                    for _, (puntuacion, doc) in mejores]
+
+
+# Instancia global
+address_index = AddressIndex(db)
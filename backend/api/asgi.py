@@ -0,0 +1,243 @@
+"""
+Modo de servicio ASGI
+/api/bin/<bin> se atiende en el event loop: las consultas a Socrata usan un cliente
+HTTP asíncrono con concurrencia acotada y no ocupan un hilo mientras esperan.
+/api/auth/verify y /api/search (base de datos e índice en memoria) van al pool de
+hilos de consultas, y el resto de la app Flask (la generación de PDFs, que es CPU)
+a un pool aparte: un render no deja sin hilos a las búsquedas.
+
+    uvicorn asgi:app --workers 4
+
+Las rutas asíncronas pasan por los hooks de Flask (CORS, compresión), pero no por
+el middleware de perfilado: para perfilarlas, usar el modo WSGI.
+"""
+import asyncio
+import io
+import os
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import jsonify
+
+from api import enrichment, main
+
+# Hilos para la base de datos de las rutas asíncronas (executor por defecto del loop)
+ASGI_LOOKUP_THREADS = int(os.environ.get('ASGI_LOOKUP_THREADS', '16'))
+# Requests simultáneos del resto de rutas Flask (generación de PDFs incluida)
+ASGI_RENDER_THREADS = int(os.environ.get('ASGI_RENDER_THREADS', '4'))
+
+
+def construir_environ(scope, body):
+    """Environ WSGI a partir del scope ASGI y el cuerpo ya leído"""
+    script_name = scope.get('root_path', '')
+    path = scope['path']
+    if script_name and path.startswith(script_name):
+        path = path[len(script_name):]
+    servidor = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': script_name.encode('utf-8').decode('latin-1'),
+        'PATH_INFO': path.encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': servidor[0],
+        'SERVER_PORT': str(servidor[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': scope['client'][0] if scope.get('client') else '',
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for nombre, valor in scope.get('headers', []):
+        nombre = nombre.decode('latin-1').upper().replace('-', '_')
+        if nombre == 'CONTENT_LENGTH':
+            continue
+        clave = nombre if nombre == 'CONTENT_TYPE' else f'HTTP_{nombre}'
+        valor = valor.decode('latin-1')
+        environ[clave] = f"{environ[clave]},{valor}" if clave in environ else valor
+    return environ
+
+
+def _cabeceras(headers):
+    return [(nombre.lower().encode('latin-1'), valor.encode('latin-1')) for nombre, valor in headers]
+
+
+async def _leer_cuerpo(receive):
+    partes = []
+    while True:
+        mensaje = await receive()
+        if mensaje['type'] != 'http.request':
+            break
+        partes.append(mensaje.get('body', b''))
+        if not mensaje.get('more_body'):
+            break
+    return b''.join(partes)
+
+
+def _ejecutar_wsgi(wsgi_app, environ, enviar):
+    """Ejecutar la app WSGI en un hilo del pool, enviando la respuesta al loop"""
+    estado = {}
+
+    def start_response(status, headers, exc_info=None):
+        if exc_info and estado.get('enviado'):
+            raise exc_info[1].with_traceback(exc_info[2])
+        estado['inicio'] = {
+            'type': 'http.response.start',
+            'status': int(status.split(' ', 1)[0]),
+            'headers': _cabeceras(headers)
+        }
+
+    respuesta = wsgi_app(environ, start_response)
+    try:
+        # Las respuestas en streaming (NDJSON) se envían según se generan
+        for trozo in respuesta:
+            if not trozo:
+                continue
+            if not estado.get('enviado'):
+                enviar(estado['inicio'])
+                estado['enviado'] = True
+            enviar({'type': 'http.response.body', 'body': trozo, 'more_body': True})
+    finally:
+        if hasattr(respuesta, 'close'):
+            respuesta.close()
+    if not estado.get('enviado'):
+        enviar(estado['inicio'])
+    enviar({'type': 'http.response.body', 'body': b''})
+
+
+class AsgiApp:
+    """Aplicación ASGI: rutas de consulta asíncronas y el resto de Flask en un pool de hilos"""
+
+    def __init__(self, flask_app, lookup_threads=ASGI_LOOKUP_THREADS, render_threads=ASGI_RENDER_THREADS):
+        self.flask_app = flask_app
+        self.lookup_threads = lookup_threads
+        self.render_threads = render_threads
+        self._render = None
+        self._rutas = [
+            ('GET', re.compile(r'^/api/bin/(?P<bin_number>[^/]+)$'), self._bin),
+            ('POST', re.compile(r'^/api/auth/verify$'), self._verify),
+            ('GET', re.compile(r'^/api/search$'), self._search),
+        ]
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        if scope['type'] != 'http':
+            return
+
+        self._iniciar()
+        for metodo, patron, vista in self._rutas:
+            coincidencia = patron.match(scope['path'])
+            if coincidencia and scope['method'] == metodo:
+                return await self._nativa(vista, coincidencia.groupdict(), scope, receive, send)
+        await self._wsgi(scope, receive, send)
+
+    # ==========================================
+    # CICLO DE VIDA
+    # ==========================================
+
+    def _iniciar(self):
+        """Pools y cliente HTTP del event loop (en lifespan, o con el primer request)"""
+        if self._render is not None:
+            return
+        # asyncio.to_thread (base de datos desde las rutas asíncronas) usa el pool de consultas
+        asyncio.get_running_loop().set_default_executor(
+            ThreadPoolExecutor(self.lookup_threads, thread_name_prefix='lookup')
+        )
+        self._render = ThreadPoolExecutor(self.render_threads, thread_name_prefix='render')
+        enrichment.bin_enricher.iniciar_async()
+
+    async def _cerrar(self):
+        await enrichment.bin_enricher.cerrar_async()
+        if self._render is not None:
+            self._render.shutdown(wait=False)
+            self._render = None
+
+    async def _lifespan(self, receive, send):
+        while True:
+            mensaje = await receive()
+            if mensaje['type'] == 'lifespan.startup':
+                self._iniciar()
+                await send({'type': 'lifespan.startup.complete'})
+            elif mensaje['type'] == 'lifespan.shutdown':
+                await self._cerrar()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    # ==========================================
+    # RUTAS
+    # ==========================================
+
+    async def _nativa(self, vista, kwargs, scope, receive, send):
+        """
+        Ejecutar una vista asíncrona dentro del contexto de request de Flask
+        Los errores siguen el mismo camino que en Flask: los HTTP (400, 415...) y los
+        que tienen errorhandler pasan por handle_user_exception; el resto es un 500.
+        """
+        app = self.flask_app
+        environ = construir_environ(scope, await _leer_cuerpo(receive))
+        with app.request_context(environ):
+            try:
+                try:
+                    rv = app.preprocess_request()
+                    if rv is None:
+                        rv = await vista(**kwargs)
+                except Exception as e:
+                    rv = app.handle_user_exception(e)
+                response = app.finalize_request(rv)
+            except Exception as e:
+                response = app.handle_exception(e)
+
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': _cabeceras(response.headers.items())
+        })
+        await send({'type': 'http.response.body', 'body': response.get_data()})
+
+    async def _wsgi(self, scope, receive, send):
+        """Cualquier otra ruta: la app Flask tal cual, en el pool de render"""
+        environ = construir_environ(scope, await _leer_cuerpo(receive))
+        loop = asyncio.get_running_loop()
+
+        def enviar(mensaje):
+            asyncio.run_coroutine_threadsafe(send(mensaje), loop).result()
+
+        await loop.run_in_executor(self._render, _ejecutar_wsgi, self.flask_app, environ, enviar)
+
+    async def _bin(self, bin_number):
+        """/api/bin/<bin>: mismo flujo que main.get_bin_data, esperando a Socrata sin hilo"""
+        # Validar un token puede leer el epoch de revocación de la base de datos
+        license_key, from_token = await asyncio.to_thread(main.resolve_license)
+        error = await asyncio.to_thread(main.autorizar_bin, license_key, from_token)
+        if error:
+            return error
+
+        try:
+            not_modified = await asyncio.to_thread(main.bin_no_modificado, bin_number)
+            if not_modified:
+                return not_modified
+
+            data = await enrichment.obtener_datos_completos_async(bin_number)
+            return await asyncio.to_thread(main.respuesta_bin, license_key, bin_number, data)
+
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+
+    async def _verify(self):
+        """/api/auth/verify solo espera a la base de datos: en el pool de consultas"""
+        return await asyncio.to_thread(main.verify_license)
+
+    async def _search(self):
+        """/api/search: índice en memoria, sin esperar detrás de los renders"""
+        return await asyncio.to_thread(main.search_address)
+
+
+def create_asgi_app(config=None):
+    """App ASGI sobre create_app() (mismas opciones de configuración)"""
+    return AsgiApp(main.create_app(config))
@@ -0,0 +1,153 @@
+"""
+Pre-calentamiento de la caché de BINs según el uso
+usage_log dice qué edificios consulta o presenta cada cliente una y otra vez. En
+momentos de poco tráfico se refrescan las fuentes de esos BINs que van a caducar
+pronto, sin pasar de un presupuesto de peticiones a Socrata por pasada: la primera
+consulta del día de un edificio habitual sale de caché en lugar de la red.
+
+    python3 admin.py warm-cache            # una pasada (cron)
+    ENRICHMENT_WARM_INTERVAL=900           # o un hilo por proceso, cada 15 minutos
+"""
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from api.enrichment import bin_enricher
+
+# Segundos entre pasadas del hilo de fondo (0: desactivado, usar cron)
+ENRICHMENT_WARM_INTERVAL = int(os.environ.get('ENRICHMENT_WARM_INTERVAL', '0'))
+# Peticiones a Socrata como máximo por pasada
+ENRICHMENT_WARM_BUDGET = int(os.environ.get('ENRICHMENT_WARM_BUDGET', '100'))
+# Refrescar lo que caduca en menos de esto (segundos)
+ENRICHMENT_WARM_AHEAD = int(os.environ.get('ENRICHMENT_WARM_AHEAD', str(6 * 3600)))
+# Historial de uso que se mira y usos mínimos para considerar un BIN habitual
+ENRICHMENT_WARM_WINDOW_DAYS = int(os.environ.get('ENRICHMENT_WARM_WINDOW_DAYS', '14'))
+ENRICHMENT_WARM_MIN_USES = int(os.environ.get('ENRICHMENT_WARM_MIN_USES', '2'))
+ENRICHMENT_WARM_MAX_BINS = int(os.environ.get('ENRICHMENT_WARM_MAX_BINS', '500'))
+# Un uso de hace HALF_LIFE horas pesa la mitad que uno de ahora
+ENRICHMENT_WARM_HALF_LIFE_HOURS = float(os.environ.get('ENRICHMENT_WARM_HALF_LIFE_HOURS', '72'))
+# Poco tráfico: como mucho QUIET_MAX acciones en los últimos QUIET_MINUTES minutos
+ENRICHMENT_WARM_QUIET_MINUTES = int(os.environ.get('ENRICHMENT_WARM_QUIET_MINUTES', '10'))
+ENRICHMENT_WARM_QUIET_MAX = int(os.environ.get('ENRICHMENT_WARM_QUIET_MAX', '20'))
+# Solo un proceso por máquina calienta a la vez
+ENRICHMENT_WARM_LOCK = os.environ.get(
+    'ENRICHMENT_WARM_LOCK', os.path.join(tempfile.gettempdir(), 'fdny_cache_warmer.lock')
+)
+
+
+def _horas_desde(timestamp):
+    """Horas desde un timestamp de SQLite ('YYYY-MM-DD HH:MM:SS', UTC)"""
+    try:
+        cuando = datetime.strptime(str(timestamp)[:19], "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc)
+    except ValueError:
+        return float('inf')
+    return max((datetime.now(timezone.utc) - cuando).total_seconds() / 3600, 0)
+
+
+class CacheWarmer:
+    """Refresca por adelantado los BINs habituales dentro de un presupuesto de peticiones"""
+
+    def __init__(self, db, enricher, presupuesto=ENRICHMENT_WARM_BUDGET, antelacion=ENRICHMENT_WARM_AHEAD,
+                 intervalo=ENRICHMENT_WARM_INTERVAL):
+        self.db = db
+        self.enricher = enricher
+        self.presupuesto = presupuesto
+        self.antelacion = antelacion
+        self.intervalo = intervalo
+        self._lock = threading.Lock()
+        self._pid = None
+        self._parar = threading.Event()
+
+    def candidatos(self):
+        """BINs habituales ordenados por frecuencia con decaimiento por antigüedad del último uso"""
+        bins = self.db.frequent_bins(ENRICHMENT_WARM_WINDOW_DAYS, ENRICHMENT_WARM_MIN_USES,
+                                     ENRICHMENT_WARM_MAX_BINS)
+        for candidato in bins:
+            horas = _horas_desde(candidato['last_used'])
+            candidato['score'] = candidato['uses'] * 0.5 ** (horas / ENRICHMENT_WARM_HALF_LIFE_HOURS)
+        return sorted(bins, key=lambda c: c['score'], reverse=True)
+
+    def trafico_bajo(self):
+        return self.db.recent_usage_count(ENRICHMENT_WARM_QUIET_MINUTES,
+                                          ENRICHMENT_WARM_QUIET_MAX + 1) <= ENRICHMENT_WARM_QUIET_MAX
+
+    def ejecutar(self, presupuesto=None):
+        """
+        Una pasada: refrescar los candidatos en orden hasta agotar el presupuesto
+        Los BINs con todas sus fuentes frescas no gastan peticiones.
+        """
+        presupuesto = self.presupuesto if presupuesto is None else presupuesto
+        resumen = {'candidates': 0, 'refreshed': 0, 'fresh': 0, 'requests': 0, 'budget': presupuesto,
+                   'budget_exhausted': False}
+
+        candidatos = self.candidatos()
+        resumen['candidates'] = len(candidatos)
+        for candidato in candidatos:
+            restante = presupuesto - resumen['requests']
+            if restante <= 0:
+                resumen['budget_exhausted'] = True
+                break
+            hechas = self.enricher.refrescar(candidato['bin'], self.antelacion, restante)
+            resumen['requests'] += hechas
+            resumen['refreshed' if hechas else 'fresh'] += 1
+        return resumen
+
+    # ==========================================
+    # HILO DE FONDO
+    # ==========================================
+
+    @contextmanager
+    def _exclusivo(self):
+        """Lock de fichero no bloqueante: True si esta pasada le toca a este proceso"""
+        try:
+            import fcntl
+        except ImportError:
+            yield True
+            return
+        with open(ENRICHMENT_WARM_LOCK, 'a') as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _bucle(self):
+        while not self._parar.wait(self.intervalo):
+            try:
+                if not self.trafico_bajo():
+                    continue
+                with self._exclusivo() as toca:
+                    if toca:
+                        resumen = self.ejecutar()
+                        if resumen['requests']:
+                            print(f"🔥 BIN cache warmed: {resumen['refreshed']} BIN(s), "
+                                  f"{resumen['requests']}/{resumen['budget']} requests")
+            except Exception as e:
+                print(f"⚠️  BIN cache warmer failed: {e}")
+
+    def asegurar_en_marcha(self):
+        """
+        before_request: arrancar el hilo en este proceso si aún no lo tiene
+        (bajo un servidor pre-fork cada worker lo arranca con su primer request)
+        """
+        if self._pid == os.getpid() or self.intervalo <= 0:
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._parar = threading.Event()
+            threading.Thread(target=self._bucle, name='bin-cache-warmer', daemon=True).start()
+
+    def detener(self):
+        self._parar.set()
+
+
+# Instancia global
+cache_warmer = CacheWarmer(bin_enricher.db, bin_enricher)
@@ -0,0 +1,217 @@
+"""
+Cortacircuitos para las consultas a servicios externos (datasets de Socrata)
+Cuenta errores y llamadas lentas en una ventana deslizante. Si superan el umbral,
+el circuito se abre y durante el enfriamiento las llamadas fallan al instante (el
+enriquecimiento sirve la caché aunque esté caducada). Después se deja pasar una
+sola sonda: si va bien se cierra, si no vuelve a abrirse.
+Además limita las llamadas en vuelo por dependencia: las que no caben esperan un
+hueco (dentro del plazo de quien llama) en vez de acumular conexiones lentas.
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+
+# Ventana (segundos) y llamadas mínimas en ella antes de poder abrir el circuito
+ENRICHMENT_BREAKER_WINDOW = float(os.environ.get('ENRICHMENT_BREAKER_WINDOW', '60'))
+ENRICHMENT_BREAKER_MIN_CALLS = int(os.environ.get('ENRICHMENT_BREAKER_MIN_CALLS', '10'))
+# Proporción de errores, o de llamadas más lentas que SLOW_MS, que abre el circuito
+ENRICHMENT_BREAKER_ERROR_RATE = float(os.environ.get('ENRICHMENT_BREAKER_ERROR_RATE', '0.5'))
+ENRICHMENT_BREAKER_SLOW_MS = float(os.environ.get('ENRICHMENT_BREAKER_SLOW_MS', '2000'))
+ENRICHMENT_BREAKER_SLOW_RATE = float(os.environ.get('ENRICHMENT_BREAKER_SLOW_RATE', '0.5'))
+# Segundos abierto antes de probar de nuevo
+ENRICHMENT_BREAKER_COOLDOWN = float(os.environ.get('ENRICHMENT_BREAKER_COOLDOWN', '30'))
+# Llamadas simultáneas por fuente (0: sin límite)
+ENRICHMENT_BREAKER_MAX_INFLIGHT = int(os.environ.get('ENRICHMENT_BREAKER_MAX_INFLIGHT', '8'))
+
+CERRADO = 'closed'
+ABIERTO = 'open'
+SEMIABIERTO = 'half_open'
+
+# Resultado interno de _admitir(): circuito cerrado pero sin hueco libre
+_LLENO = object()
+
+
+class CircuitoAbierto(Exception):
+    """El circuito no deja pasar la llamada (abierto o con la sonda en curso)"""
+
+
+class SinHueco(Exception):
+    """No quedó ninguna llamada libre dentro del plazo de espera"""
+
+
+def _despertar(futuro):
+    if not futuro.done():
+        futuro.set_result(None)
+
+
+class CircuitBreaker:
+    """
+    Cortacircuitos de una dependencia
+    entrar() devuelve un ticket (o None si la llamada no debe hacerse) y cada
+    ticket se cierra con registrar(ticket, segundos, error) o liberar(ticket).
+    Sin hueco libre, entrar(espera) y entrar_async(espera) esperan a que se cierre
+    otro ticket y lanzan SinHueco si se acaba la espera.
+    """
+
+    def __init__(self, nombre, ventana=ENRICHMENT_BREAKER_WINDOW, minimo=ENRICHMENT_BREAKER_MIN_CALLS,
+                 tasa_error=ENRICHMENT_BREAKER_ERROR_RATE, lenta_ms=ENRICHMENT_BREAKER_SLOW_MS,
+                 tasa_lentas=ENRICHMENT_BREAKER_SLOW_RATE, enfriamiento=ENRICHMENT_BREAKER_COOLDOWN,
+                 max_en_vuelo=ENRICHMENT_BREAKER_MAX_INFLIGHT):
+        self.nombre = nombre
+        self.ventana = ventana
+        self.minimo = minimo
+        self.tasa_error = tasa_error
+        self.lenta = lenta_ms / 1000
+        self.tasa_lentas = tasa_lentas
+        self.enfriamiento = enfriamiento
+        self.max_en_vuelo = max_en_vuelo
+        self._lock = threading.Lock()
+        self._hueco = threading.Condition(self._lock)
+        # (loop, futuro) de las tareas asíncronas esperando un hueco
+        self._esperando = []
+        self._llamadas = deque()  # (instante, error, lenta)
+        self.estado = CERRADO
+        self.en_vuelo = 0
+        self._abierto_hasta = 0.0
+        self._sonda = False
+        # Cambia con cada transición: los resultados de antes no cuentan
+        self._generacion = 0
+
+    def _cambiar(self, estado, ahora):
+        self.estado = estado
+        self._generacion += 1
+        self._llamadas.clear()
+        self._sonda = False
+        if estado == ABIERTO:
+            self._abierto_hasta = ahora + self.enfriamiento
+            print(f"🔌 Circuit open for {self.nombre} ({self.enfriamiento:.0f}s)")
+        elif estado == CERRADO:
+            print(f"🔌 Circuit closed for {self.nombre}")
+        # Quien espera hueco vuelve a mirar: con el circuito abierto ya no debe esperar
+        self._avisar(todos=True)
+
+    def _avisar(self, todos=False):
+        """Con el lock: despertar a quien espera un hueco (hilos y tareas asíncronas)"""
+        if todos:
+            self._hueco.notify_all()
+        else:
+            self._hueco.notify()
+        for loop, futuro in self._esperando:
+            loop.call_soon_threadsafe(_despertar, futuro)
+        self._esperando.clear()
+
+    def _cerrar_ticket(self):
+        self.en_vuelo -= 1
+        self._avisar()
+
+    def _admitir(self, ahora):
+        """Con el lock: ticket, None (el circuito no deja pasar) o _LLENO"""
+        if self.estado == ABIERTO:
+            if ahora < self._abierto_hasta:
+                return None
+            self._cambiar(SEMIABIERTO, ahora)
+        if self.estado == SEMIABIERTO:
+            if self._sonda:
+                return None
+            self._sonda = True
+        elif self.max_en_vuelo and self.en_vuelo >= self.max_en_vuelo:
+            return _LLENO
+        self.en_vuelo += 1
+        return (self._generacion, self.estado == SEMIABIERTO)
+
+    def rechaza(self):
+        """¿Rechazaría ahora una llamada? (abierto o sonda en curso; no toma hueco)"""
+        with self._lock:
+            if self.estado == ABIERTO:
+                return time.monotonic() < self._abierto_hasta
+            return self.estado == SEMIABIERTO and self._sonda
+
+    def entrar(self, espera=0):
+        """
+        Ticket para hacer la llamada, o None si el circuito no la deja pasar
+        Sin hueco libre espera hasta `espera` segundos a que se cierre otro ticket.
+        """
+        limite = time.monotonic() + espera
+        with self._hueco:
+            while True:
+                ticket = self._admitir(time.monotonic())
+                if ticket is not _LLENO:
+                    return ticket
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    raise SinHueco(self.nombre)
+                self._hueco.wait(restante)
+
+    async def entrar_async(self, espera=0):
+        """entrar() sin bloquear el event loop mientras se espera un hueco"""
+        limite = time.monotonic() + espera
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._lock:
+                ticket = self._admitir(time.monotonic())
+                if ticket is not _LLENO:
+                    return ticket
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    raise SinHueco(self.nombre)
+                futuro = loop.create_future()
+                self._esperando.append((loop, futuro))
+            try:
+                await asyncio.wait_for(futuro, restante)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                with self._lock:
+                    if (loop, futuro) in self._esperando:
+                        self._esperando.remove((loop, futuro))
+
+    def registrar(self, ticket, segundos, error):
+        """Resultado de una llamada hecha con un ticket de entrar()"""
+        generacion, sonda = ticket
+        with self._lock:
+            self._cerrar_ticket()
+            if generacion != self._generacion:
+                return
+            ahora = time.monotonic()
+            lenta = segundos >= self.lenta
+            if sonda:
+                self._cambiar(ABIERTO if error or lenta else CERRADO, ahora)
+                return
+
+            self._llamadas.append((ahora, error, lenta))
+            while self._llamadas and self._llamadas[0][0] < ahora - self.ventana:
+                self._llamadas.popleft()
+            total = len(self._llamadas)
+            if total < self.minimo:
+                return
+            errores = sum(1 for _, e, _ in self._llamadas if e)
+            lentas = sum(1 for _, _, l in self._llamadas if l)
+            if errores >= total * self.tasa_error or lentas >= total * self.tasa_lentas:
+                self._cambiar(ABIERTO, ahora)
+
+    def liberar(self, ticket):
+        """Llamada abandonada sin resultado (cancelada): solo devuelve el hueco"""
+        generacion, sonda = ticket
+        with self._lock:
+            self._cerrar_ticket()
+            if sonda and generacion == self._generacion:
+                self._sonda = False
+                self._avisar(todos=True)
+
+    def reintentar_en(self):
+        """Segundos hasta la próxima sonda (0 si el circuito no está abierto)"""
+        if self.estado != ABIERTO:
+            return 0
+        return max(self._abierto_hasta - time.monotonic(), 0)
+
+    def resumen(self):
+        with self._lock:
+            return {
+                'state': self.estado,
+                'in_flight': self.en_vuelo,
+                'calls': len(self._llamadas),
+                'errors': sum(1 for _, e, _ in self._llamadas if e),
+                'retry_in': round(self.reintentar_en(), 1),
+            }
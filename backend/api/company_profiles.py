@@ -0,0 +1,85 @@
+"""
+Perfiles de empresa por licencia
+Cada licencia puede tener su propia empresa, contratistas y central de monitoreo
+(las mismas secciones de config.json); lo que el perfil no define sale de config.json.
+El perfil se combina una vez con la configuración global en una Configuracion propia
+(sus campos fijos se mapean una sola vez por versión) y las configuraciones
+compiladas se guardan en una caché LRU por (licencia, versión del perfil, versión
+de config.json): generar no vuelve a leer ni a mapear el perfil.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+from api.config_provider import Configuracion
+
+# Perfiles compilados en memoria por proceso
+PROFILE_CACHE_SIZE = int(os.environ.get('PROFILE_CACHE_SIZE', '256'))
+
+# Secciones de config.json que un perfil puede sustituir
+SECCIONES_PERFIL = ('fire_alarm_company', 'architect_applicant', 'electrical_contractor', 'central_station')
+
+
+def validar_perfil(perfil):
+    """Comprobar la forma de un perfil (ValueError con el primer problema)"""
+    if not isinstance(perfil, dict) or not perfil:
+        raise ValueError("Profile must be a non-empty object")
+    for seccion, campos in perfil.items():
+        if seccion not in SECCIONES_PERFIL:
+            raise ValueError(f"Unknown profile section: {seccion} (allowed: {', '.join(SECCIONES_PERFIL)})")
+        if not isinstance(campos, dict):
+            raise ValueError(f"Profile section {seccion} must be an object")
+        for campo, valor in campos.items():
+            if valor is not None and not isinstance(valor, str):
+                raise ValueError(f"{seccion}.{campo} must be a string")
+
+
+def combinar(config, perfil):
+    """Configuración efectiva: las secciones del perfil sustituyen a las de config.json"""
+    return Configuracion({**config.datos, **perfil})
+
+
+class PerfilesCompilados:
+    """Caché LRU acotada de configuraciones efectivas por licencia"""
+
+    def __init__(self, db, max_entradas=PROFILE_CACHE_SIZE):
+        self.db = db
+        self.max_entradas = max_entradas
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def config_licencia(self, license_key, profile_version, config):
+        """
+        Configuración con la que genera una licencia
+        profile_version: licenses.profile_version (0: sin perfil, se usa config tal cual)
+        """
+        if not profile_version:
+            return config
+
+        clave = (license_key, profile_version, config.version)
+        with self._lock:
+            compilada = self._cache.get(clave)
+            if compilada is not None:
+                self._cache.move_to_end(clave)
+                return compilada
+
+        guardado = self.db.get_company_profile(license_key)
+        if guardado is None:
+            # Perfil borrado: la licencia vuelve a config.json
+            compilada = config
+        else:
+            perfil, version = guardado
+            compilada = combinar(config, perfil)
+            # Si el perfil cambió después de leer la licencia, vale lo último guardado
+            clave = (license_key, version, config.version)
+
+        with self._lock:
+            self._cache[clave] = compilada
+            self._cache.move_to_end(clave)
+            while len(self._cache) > self.max_entradas:
+                self._cache.popitem(last=False)
+        return compilada
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._cache), "max_entries": self.max_entradas}
@@ -0,0 +1,151 @@
+"""
+Configuración de la empresa (config.json) recargable sin reiniciar
+Cada versión es una instantánea inmutable identificada por el hash de su contenido:
+las cachés derivadas (overlays de datos fijos, clave de filings) se indexan por esa
+versión, así que un cambio solo invalida lo que depende de la configuración.
+Se recarga al cambiar el fichero o al recibir CONFIG_RELOAD_SIGNAL.
+"""
+import hashlib
+import json
+import os
+import signal
+import threading
+import time
+
+CONFIG_PATH = os.environ.get(
+    'CONFIG_PATH', os.path.join(os.path.dirname(__file__), '../config.json')
+)
+# Segundos entre comprobaciones del fichero (0: en cada acceso)
+CONFIG_CHECK_INTERVAL = float(os.environ.get('CONFIG_CHECK_INTERVAL', '2'))
+# Señal que fuerza la recarga ('' para no instalarla)
+CONFIG_RELOAD_SIGNAL = os.environ.get('CONFIG_RELOAD_SIGNAL', 'SIGHUP')
+
+
+def version_config(datos):
+    """Hash estable del contenido (no cambia si se reescribe el mismo JSON)"""
+    return hashlib.sha256(json.dumps(datos, sort_keys=True).encode()).hexdigest()[:16]
+
+
+class Configuracion:
+    """Instantánea de config.json; no se modifica, una recarga crea otra"""
+
+    def __init__(self, datos):
+        self.datos = datos
+        self.version = version_config(datos)
+        self._derivados = {}
+
+    def seccion(self, nombre):
+        return self.datos.get(nombre, {})
+
+    def derivado(self, nombre, construir):
+        """Valor calculado a partir de esta versión, una sola vez (muere con la instantánea)"""
+        valor = self._derivados.get(nombre)
+        if valor is None:
+            valor = self._derivados[nombre] = construir(self)
+        return valor
+
+    @property
+    def company(self):
+        return self.seccion("fire_alarm_company")
+
+    @property
+    def architect(self):
+        return self.seccion("architect_applicant")
+
+    @property
+    def electrician(self):
+        return self.seccion("electrical_contractor")
+
+    @property
+    def tech_defaults(self):
+        return self.seccion("technical_defaults")
+
+    @property
+    def central_station(self):
+        return self.seccion("central_station")
+
+    @property
+    def pdf_output(self):
+        return self.seccion("pdf_output")
+
+
+class ConfigProvider:
+    """
+    Versión vigente de la configuración
+    actual() es barato: como mucho un stat() del fichero cada CONFIG_CHECK_INTERVAL.
+    Un request toma la instantánea una vez y la usa de principio a fin.
+    """
+
+    def __init__(self, path=CONFIG_PATH, intervalo=CONFIG_CHECK_INTERVAL):
+        self.path = path
+        self.intervalo = intervalo
+        self._lock = threading.Lock()
+        self._pendiente = False
+        self._firma = self._firma_fichero()
+        self._actual = Configuracion(self._leer())
+        self._comprobado = time.monotonic()
+
+    def _firma_fichero(self):
+        try:
+            st = os.stat(self.path)
+            return (st.st_mtime_ns, st.st_size, st.st_ino)
+        except OSError:
+            return None
+
+    def _leer(self):
+        """Contenido del fichero ({} si no existe)"""
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, 'r') as f:
+            return json.load(f)
+
+    def actual(self):
+        """Instantánea vigente (recargando antes si el fichero cambió)"""
+        if self._pendiente or time.monotonic() - self._comprobado >= self.intervalo:
+            self._comprobar()
+        return self._actual
+
+    def _comprobar(self):
+        with self._lock:
+            forzar, self._pendiente = self._pendiente, False
+            self._comprobado = time.monotonic()
+            firma = self._firma_fichero()
+            if firma == self._firma and not forzar:
+                return
+            self._firma = firma
+            try:
+                datos = self._leer()
+            except (OSError, ValueError) as e:
+                # JSON a medio escribir o inválido: se sigue sirviendo la versión anterior
+                print(f"⚠️ Config not reloaded, keeping {self._actual.version}: {e}")
+                return
+            nueva = Configuracion(datos)
+            if nueva.version != self._actual.version:
+                print(f"🔄 Config reloaded: {self._actual.version} -> {nueva.version}")
+                self._actual = nueva
+
+    def recargar(self):
+        """Releer el fichero ya (devuelve la instantánea resultante)"""
+        self._pendiente = True
+        return self.actual()
+
+    def solicitar_recarga(self, *_):
+        """Manejador de señal: solo marca; la recarga la hace el siguiente actual()"""
+        self._pendiente = True
+
+    def instalar_senal(self, nombre=CONFIG_RELOAD_SIGNAL):
+        """
+        Recargar al recibir la señal (solo desde el hilo principal y si nadie
+        más la maneja: bajo gunicorn el maestro usa SIGHUP para reiniciar workers)
+        """
+        senal = getattr(signal, nombre, None) if nombre else None
+        if senal is None or threading.current_thread() is not threading.main_thread():
+            return False
+        if signal.getsignal(senal) not in (signal.SIG_DFL, None):
+            return False
+        signal.signal(senal, self.solicitar_recarga)
+        return True
+
+
+# Instancia global
+config_provider = ConfigProvider()
@@ -0,0 +1,237 @@
+"""
+Agregación de dispositivos por piso y categoría
+Una sola pasada sobre la lista de dispositivos; los pisos se ordenan con un
+rango precalculado y se resumen en rangos compactos ("2nd–40th Floor").
+"""
+import re
+
+# Pisos numerados soportados por el formulario A-433
+PISOS_NUMERADOS = 120
+
+
+def ordinal(n):
+    """1 -> '1st', 2 -> '2nd', 11 -> '11th', 22 -> '22nd'"""
+    if 10 <= n % 100 <= 20:
+        sufijo = "th"
+    else:
+        sufijo = {1: "st", 2: "nd", 3: "rd"}.get(n % 10, "th")
+    return f"{n}{sufijo}"
+
+
+# Listas maestras (orden de abajo hacia arriba del edificio)
+FULL_FLOOR_LIST = (
+    ["Sub Cellar", "Cellar", "Basement", "Ground Floor"]
+    + [f"{ordinal(n)} Floor" for n in range(1, PISOS_NUMERADOS + 1)]
+    + ["Roof", "Penthouse", "Mechanical Floor"]
+)
+
+MASTER_DEVICE_LIST = {
+    "Initiating": ["Manual Pull Station", "Smoke Detector", "Heat Detector"],
+    "Supervisory": ["Valve Tamper Switch", "Pump Running"],
+    "Control": ["Fire Door Holder", "HVAC Shut Down"],
+    "Signals": ["Horn", "Strobe", "Horn Strobe"],
+    "Communication": ["Warden Telephone"],
+    "Firepanel": ["Fire Alarm Control"]
+}
+
+# Columnas de la tabla de dispositivos del A-433 (página 2): categoría -> (primera columna rN, cantidad)
+COLUMNAS_A433 = {
+    "Initiating": (1, 10),
+    "Supervisory": (11, 10),
+    "Control": (21, 5),
+    "Signals": (26, 5),
+    "Communication": (31, 5),
+    "Firepanel": (36, 5),
+}
+FILAS_PISOS_A433 = 31      # floors1..floors31 / rNc1..rNc31
+FILA_TOTAL_A433 = 32       # rNc32: total de la columna en la hoja
+
+SEPARADOR_RANGO = "–"
+
+_RE_NUMERADO = re.compile(r"^(\d+)\s*(?:st|nd|rd|th)?\s+(floor|fl|flr)\b(.*)$", re.IGNORECASE)
+
+# Rangos: pisos bajo rasante < numerados (por número) < superiores < desconocidos
+_BASE_NUMERADOS = 1000
+_BASE_SUPERIORES = 10 ** 7
+_BASE_DESCONOCIDOS = 10 ** 8
+
+
+def _rango_fijo():
+    rangos = {}
+    posicion_numerados = FULL_FLOOR_LIST.index("1st Floor")
+    for i, piso in enumerate(FULL_FLOOR_LIST):
+        m = _RE_NUMERADO.match(piso)
+        if m:
+            rangos[piso.lower()] = (_BASE_NUMERADOS + int(m.group(1)) * 10, int(m.group(1)))
+        elif i < posicion_numerados:
+            rangos[piso.lower()] = (i, None)
+        else:
+            rangos[piso.lower()] = (_BASE_SUPERIORES + i, None)
+    return rangos
+
+
+# {nombre en minúsculas: (rango, número de piso o None)}
+RANGO_PISOS = _rango_fijo()
+# Nombres fuera de la lista ya vistos (memo acotado para mantener O(1) por dispositivo)
+_RANGO_EXTRA = {}
+_MAX_RANGO_EXTRA = 4096
+
+
+def rango_piso(piso):
+    """(rango, número) de un piso; los desconocidos comparten rango al final"""
+    clave = " ".join(str(piso).split()).lower()
+    if clave in RANGO_PISOS:
+        return RANGO_PISOS[clave]
+    if clave not in _RANGO_EXTRA:
+        if len(_RANGO_EXTRA) >= _MAX_RANGO_EXTRA:
+            _RANGO_EXTRA.clear()
+        m = _RE_NUMERADO.match(clave)
+        if m and not m.group(3).strip():
+            _RANGO_EXTRA[clave] = (_BASE_NUMERADOS + int(m.group(1)) * 10, int(m.group(1)))
+        elif m:
+            # "2nd Floor Mezzanine": entre el 2º y el 3er piso, no entra en rangos
+            _RANGO_EXTRA[clave] = (_BASE_NUMERADOS + int(m.group(1)) * 10 + 5, None)
+        else:
+            _RANGO_EXTRA[clave] = (_BASE_DESCONOCIDOS, None)
+    return _RANGO_EXTRA[clave]
+
+
+def _categoria_de(dispositivo):
+    for categoria, nombres in MASTER_DEVICE_LIST.items():
+        if dispositivo in nombres:
+            return categoria
+    return None
+
+
+def agregar_dispositivos(dispositivos):
+    """
+    Agrupar dispositivos por categoría, tipo y piso en una sola pasada
+    dispositivos: [{floor, category, device, qty}, ...]
+
+    Devuelve {
+        'floors': [pisos ordenados],
+        'categories': {categoría: [tipos en orden de aparición]},
+        'counts': {(categoría, tipo): {piso: cantidad}},
+        'totals': {(categoría, tipo): total},
+        'category_totals': {categoría: total},
+        'total': total general
+    }
+    """
+    conteos = {}
+    categorias = {categoria: [] for categoria in MASTER_DEVICE_LIST}
+    pisos = {}
+
+    for d in dispositivos:
+        piso = " ".join(str(d.get("floor") or "").split())
+        tipo = " ".join(str(d.get("device") or "").split())
+        if not piso or not tipo:
+            continue
+        categoria = d.get("category") or _categoria_de(tipo) or "Other"
+        try:
+            cantidad = int(d.get("qty", 1))
+        except (TypeError, ValueError):
+            cantidad = 1
+        if cantidad <= 0:
+            continue
+
+        clave = (categoria, tipo)
+        por_piso = conteos.get(clave)
+        if por_piso is None:
+            por_piso = conteos[clave] = {}
+            categorias.setdefault(categoria, []).append(tipo)
+        por_piso[piso] = por_piso.get(piso, 0) + cantidad
+        if piso not in pisos:
+            pisos[piso] = (rango_piso(piso)[0], piso.lower())
+
+    totales = {clave: sum(por_piso.values()) for clave, por_piso in conteos.items()}
+    totales_categoria = {}
+    for (categoria, _), total in totales.items():
+        totales_categoria[categoria] = totales_categoria.get(categoria, 0) + total
+
+    return {
+        "floors": sorted(pisos, key=pisos.get),
+        "categories": {c: tipos for c, tipos in categorias.items() if tipos},
+        "counts": conteos,
+        "totals": totales,
+        "category_totals": totales_categoria,
+        "total": sum(totales.values())
+    }
+
+
+def rangos_pisos(pisos):
+    """
+    Resumir pisos ordenados en rangos compactos
+    ['Cellar', '2nd Floor', ..., '40th Floor', 'Roof'] -> 'Cellar, 2nd–40th Floor, Roof'
+    """
+    partes = []
+    tramo = []  # números consecutivos del tramo actual
+
+    def cerrar():
+        if len(tramo) >= 3:
+            partes.append(f"{ordinal(tramo[0])}{SEPARADOR_RANGO}{ordinal(tramo[-1])} Floor")
+        else:
+            partes.extend(f"{ordinal(n)} Floor" for n in tramo)
+        tramo.clear()
+
+    for piso in pisos:
+        numero = rango_piso(piso)[1]
+        if numero is not None and tramo and numero == tramo[-1] + 1:
+            tramo.append(numero)
+            continue
+        cerrar()
+        if numero is not None:
+            tramo.append(numero)
+        else:
+            partes.append(piso)
+    cerrar()
+
+    return ", ".join(partes)
+
+
+def hojas_a433(agregado):
+    """
+    Campos de la tabla de dispositivos del A-433, una hoja por página
+    Si hay más pisos o tipos de los que caben, se generan hojas de continuación.
+    Devuelve [ {campo: valor}, ... ] (la primera es la del formulario principal)
+    """
+    pisos = agregado["floors"]
+    bloques_pisos = [pisos[i:i + FILAS_PISOS_A433] for i in range(0, len(pisos), FILAS_PISOS_A433)] or [[]]
+
+    # Tipos por categoría repartidos en bloques del ancho de columnas disponible
+    bloques_columnas = []
+    for categoria, tipos in agregado["categories"].items():
+        if categoria not in COLUMNAS_A433:
+            continue
+        ancho = COLUMNAS_A433[categoria][1]
+        for n, i in enumerate(range(0, len(tipos), ancho)):
+            while len(bloques_columnas) <= n:
+                bloques_columnas.append({})
+            bloques_columnas[n][categoria] = tipos[i:i + ancho]
+    bloques_columnas = bloques_columnas or [{}]
+
+    hojas = []
+    for columnas in bloques_columnas:
+        for bloque in bloques_pisos:
+            campos = {}
+            con_conteos = False
+            for m, piso in enumerate(bloque, start=1):
+                campos[f"floors{m}"] = piso
+            for categoria, tipos in columnas.items():
+                primera = COLUMNAS_A433[categoria][0]
+                for k, tipo in enumerate(tipos):
+                    r = primera + k
+                    campos[f"{categoria}{k + 1}"] = tipo
+                    por_piso = agregado["counts"][(categoria, tipo)]
+                    total = 0
+                    for m, piso in enumerate(bloque, start=1):
+                        cantidad = por_piso.get(piso)
+                        if cantidad:
+                            campos[f"r{r}c{m}"] = str(cantidad)
+                            total += cantidad
+                            con_conteos = True
+                    if total:
+                        campos[f"r{r}c{FILA_TOTAL_A433}"] = str(total)
+            # Las hojas de continuación sin ningún conteo no aportan nada
+            if not hojas or con_conteos:
+                hojas.append(campos)
+    return hojas
@@ -0,0 +1,684 @@
+"""
+Enriquecimiento de datos de edificio desde varios datasets de NYC Open Data
+Las fuentes se consultan en paralelo con un presupuesto de tiempo por request;
+lo que no termina a tiempo se devuelve desde caché o se marca como pendiente.
+Cada fuente tiene un cortacircuitos: con Socrata degradado se sirve la caché
+caducada ('_freshness': 'stale') sin esperar, y si no hay nada que servir la
+respuesta es 'unavailable' (no "BIN no encontrado").
+En modo ASGI las mismas fuentes se consultan con un cliente HTTP asíncrono.
+"""
+import asyncio
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import requests
+
+from api.circuit_breaker import CircuitBreaker, CircuitoAbierto, SinHueco
+from api.database import db
+from api.pdf_generator import APP_TOKEN_SOCRATA
+
+# Permite apuntar a un servidor local en pruebas
+ENRICHMENT_BASE_URL = os.environ.get('ENRICHMENT_BASE_URL', 'https://data.cityofnewyork.us').rstrip('/')
+ENRICHMENT_BUDGET = float(os.environ.get('ENRICHMENT_BUDGET_MS', '2500')) / 1000
+ENRICHMENT_WORKERS = int(os.environ.get('ENRICHMENT_WORKERS', '8'))
+# Consultas simultáneas a Socrata por proceso en modo ASGI (cliente asíncrono)
+ENRICHMENT_MAX_CONCURRENCY = int(os.environ.get('ENRICHMENT_MAX_CONCURRENCY', '32'))
+# Un resultado cacheado más reciente que esto se usa sin volver a consultar
+ENRICHMENT_CACHE_TTL = int(os.environ.get('ENRICHMENT_CACHE_TTL', str(24 * 3600)))
+# Segundos tras caducar en los que un resultado aún se sirve al instante mientras
+# se refresca en segundo plano (0: esperar a Socrata dentro del presupuesto)
+ENRICHMENT_STALE_MAX = int(os.environ.get('ENRICHMENT_STALE_MAX', str(7 * 24 * 3600)))
+
+# Estados por fuente en la respuesta
+ESTADO_OK = 'ok'
+ESTADO_VACIO = 'empty'
+ESTADO_CACHE = 'cached'
+ESTADO_PENDIENTE = 'pending'
+ESTADO_ERROR = 'error'
+ESTADO_OMITIDO = 'skipped'
+ESTADO_OBSOLETO = 'stale'
+ESTADO_NO_DISPONIBLE = 'unavailable'
+
+# Frescura de la respuesta completa ('_freshness')
+FRESCURA_FRESCA = 'fresh'
+FRESCURA_OBSOLETA = 'stale'
+FRESCURA_NO_DISPONIBLE = 'unavailable'
+
+# Campos que devuelve siempre la búsqueda de BIN (el frontend los espera)
+# construction_class queda vacío: ningún dataset trae la clasificación de construcción
+# (cnstrct_yr es el año de construcción y va a year_built)
+CAMPOS_BASE = [
+    "house", "street", "borough", "zip", "construction_class", "occupancy_group",
+    "owner_first", "owner_last", "owner_business", "owner_address", "owner_city",
+    "owner_state", "owner_zip", "owner_phone", "owner_email",
+    "building_class", "stories", "year_built", "bbl"
+]
+
+
+def _bbl(borough, block, lot):
+    """BBL de 10 dígitos a partir de borough (código o nombre), block y lot"""
+    codigos = {"MANHATTAN": "1", "BRONX": "2", "BROOKLYN": "3", "QUEENS": "4", "STATEN ISLAND": "5"}
+    borough = codigos.get(str(borough or "").strip().upper(), str(borough or "").strip())
+    try:
+        return f"{int(borough)}{int(block):05d}{int(lot):04d}"
+    except (TypeError, ValueError):
+        return None
+
+
+def _contacto_propietario(filas):
+    """Elegir el contacto de propietario más relevante de un registro HPD"""
+    orden = ["CorporateOwner", "IndividualOwner", "JointOwner", "HeadOfficer", "Agent"]
+    candidatos = [f for f in filas if f.get("type") in orden]
+    if not candidatos:
+        return {}
+    return min(candidatos, key=lambda f: orden.index(f["type"]))
+
+
+# Fuentes de datos
+#   consulta: parámetros SoQL a partir del contexto (bin + claves provistas por otras fuentes)
+#   requiere: clave de contexto necesaria antes de lanzar la consulta
+#   campos:   {campo_salida: campo_dataset}
+#   provee:   claves de contexto que se extraen de la fila para fuentes dependientes
+FUENTES = [
+    {
+        "nombre": "bis",
+        "dataset": "ipu4-2q9a",
+        "timeout": 2.5,
+        "consulta": lambda ctx: {"bin": ctx["bin"]},
+        "campos": {
+            "house": "house",
+            "street": "street_name",
+            "borough": "boro",
+            "zip": "postcode",
+            "year_built": "cnstrct_yr",
+            "occupancy_group": "occupancy",
+            "owner_business": "owner_name",
+            "owner_address": "owner_stname",
+            "owner_city": "owner_city",
+            "owner_state": "owner_state",
+            "owner_zip": "owner_zip",
+            "owner_phone": "owner_phone",
+        },
+    },
+    {
+        "nombre": "dob_jobs",
+        "dataset": "ic3t-wcy2",
+        "timeout": 2.5,
+        "consulta": lambda ctx: {"bin__": ctx["bin"], "$order": "latest_action_date DESC", "$limit": 1},
+        "campos": {
+            "house": "house__",
+            "street": "street_name",
+            "borough": "borough",
+            "zip": "zip",
+            "occupancy_group": "existing_occupancy",
+            "stories": "existingno_of_stories",
+            "building_class": "building_class",
+            "owner_first": "owner_s_first_name",
+            "owner_last": "owner_s_last_name",
+            "owner_business": "owner_s_business_name",
+            "owner_phone": "owner_sphone__",
+        },
+        "provee": lambda fila: {"bbl": _bbl(fila.get("borough"), fila.get("block"), fila.get("lot"))},
+    },
+    {
+        "nombre": "hpd_registrations",
+        "dataset": "tesw-yqqr",
+        "timeout": 2.0,
+        "consulta": lambda ctx: {"bin": ctx["bin"], "$order": "lastregistrationdate DESC", "$limit": 1},
+        "campos": {
+            "house": "housenumber",
+            "street": "streetname",
+            "zip": "zip",
+        },
+        "provee": lambda fila: {
+            "registrationid": fila.get("registrationid"),
+            "bbl": _bbl(fila.get("boroid"), fila.get("block"), fila.get("lot")),
+        },
+    },
+    {
+        "nombre": "hpd_contacts",
+        "dataset": "feu5-w2e2",
+        "timeout": 2.0,
+        "requiere": "registrationid",
+        "consulta": lambda ctx: {"registrationid": ctx["registrationid"]},
+        "seleccionar": _contacto_propietario,
+        "campos": {
+            "owner_first": "firstname",
+            "owner_last": "lastname",
+            "owner_business": "corporationname",
+            "owner_address": "businessstreetname",
+            "owner_city": "businesscity",
+            "owner_state": "businessstate",
+            "owner_zip": "businesszip",
+        },
+    },
+    {
+        "nombre": "pluto",
+        "dataset": "64uk-42ks",
+        "timeout": 2.0,
+        "requiere": "bbl",
+        "consulta": lambda ctx: {"bbl": ctx["bbl"]},
+        "campos": {
+            "building_class": "bldgclass",
+            "stories": "numfloors",
+            "year_built": "yearbuilt",
+            "owner_business": "ownername",
+            "bbl": "bbl",
+        },
+    },
+]
+
+# Orden de preferencia al fusionar: gana el primer valor no vacío
+PRIORIDAD_FUENTES = ["bis", "hpd_registrations", "dob_jobs", "pluto", "hpd_contacts"]
+# Los datos de propietario son más fiables en los registros HPD y las solicitudes DOB
+PRIORIDAD_CAMPOS = {
+    campo: ["hpd_contacts", "dob_jobs", "pluto", "bis"]
+    for campo in ["owner_first", "owner_last", "owner_business", "owner_address",
+                  "owner_city", "owner_state", "owner_zip", "owner_phone"]
+}
+
+
+def _limpiar(valor):
+    if valor is None:
+        return ""
+    return " ".join(str(valor).split())
+
+
+def fusionar(resultados):
+    """Fusionar los campos de cada fuente según la prioridad configurada"""
+    datos = {}
+    for campo in CAMPOS_BASE:
+        orden = PRIORIDAD_CAMPOS.get(campo, PRIORIDAD_FUENTES)
+        datos[campo] = next(
+            (resultados[f]["campos"][campo] for f in orden
+             if f in resultados and resultados[f]["campos"].get(campo)),
+            ""
+        )
+    return datos
+
+
+def _resultado(fuente, filas):
+    """Resultado cacheable de una fuente a partir de las filas del dataset"""
+    fila = {}
+    if filas:
+        fila = fuente["seleccionar"](filas) if "seleccionar" in fuente else filas[0]
+    return {
+        "campos": {k: _limpiar(fila.get(v)) for k, v in fuente["campos"].items()},
+        "provee": {k: v for k, v in fuente["provee"](fila).items() if v} if fila and "provee" in fuente else {},
+        "vacio": not fila
+    }
+
+
+class _Ronda:
+    """Estado de un enriquecimiento: contexto, resultados y estado por fuente"""
+
+    def __init__(self, bin_number, fuentes, cache, cache_ttl, stale_max=0):
+        self.bin = bin_number
+        self.cache = cache
+        self.cache_ttl = cache_ttl
+        self.stale_max = stale_max
+        # Fuentes servidas caducadas que hay que refrescar en segundo plano
+        self.revalidar = []
+        self.inicio = time.monotonic()
+        self.ctx = {"bin": bin_number}
+        self.resultados = {}
+        self.estados = {}
+        self.por_lanzar = list(fuentes)
+
+    def _ms(self):
+        return int((time.monotonic() - self.inicio) * 1000)
+
+    def usar(self, fuente, resultado, estado, edad=None):
+        self.resultados[fuente["nombre"]] = resultado
+        self.ctx.update(resultado.get("provee", {}))
+        self.estados[fuente["nombre"]] = {"status": ESTADO_VACIO if resultado.get("vacio") else estado,
+                                          "ms": self._ms()}
+        if edad is not None:
+            self.estados[fuente["nombre"]]["age"] = int(edad)
+
+    def _desde_cache(self, fuente):
+        cacheado = self.cache.get(fuente["nombre"])
+        if cacheado:
+            estado = ESTADO_CACHE if cacheado[1] < self.cache_ttl else ESTADO_OBSOLETO
+            self.usar(fuente, cacheado[0], estado, cacheado[1])
+        return bool(cacheado)
+
+    def lanzables(self):
+        """
+        Fuentes con dependencias resueltas que hay que consultar (las frescas salen de caché)
+        Las caducadas hace menos de stale_max se sirven ya y quedan en self.revalidar.
+        """
+        lanzar = []
+        for fuente in list(self.por_lanzar):
+            if fuente.get("requiere") and fuente["requiere"] not in self.ctx:
+                continue
+            self.por_lanzar.remove(fuente)
+            cacheado = self.cache.get(fuente["nombre"])
+            if cacheado and cacheado[1] < self.cache_ttl:
+                self.usar(fuente, cacheado[0], ESTADO_CACHE, cacheado[1])
+            elif cacheado and cacheado[1] < self.cache_ttl + self.stale_max:
+                self.usar(fuente, cacheado[0], ESTADO_OBSOLETO, cacheado[1])
+                self.revalidar.append(fuente)
+            else:
+                lanzar.append(fuente)
+        return lanzar
+
+    def fallo(self, fuente, error):
+        print(f"⚠️  Enrichment source {fuente['nombre']} failed: {error}")
+        if not self._desde_cache(fuente):
+            self.estados[fuente["nombre"]] = {"status": ESTADO_ERROR, "ms": self._ms()}
+
+    def no_disponible(self, fuente):
+        """Circuito abierto: la caché, aunque esté caducada, o nada"""
+        if not self._desde_cache(fuente):
+            self.estados[fuente["nombre"]] = {"status": ESTADO_NO_DISPONIBLE}
+
+    def cerrar(self, en_curso):
+        """
+        Respuesta final; en_curso son las fuentes que no terminaron dentro del plazo
+        Fuera de plazo: dato cacheado (aunque sea antiguo) o pendiente; la consulta
+        sigue en segundo plano y su resultado queda en caché para la próxima vez
+        """
+        en_curso = list(en_curso)
+        for fuente in en_curso:
+            if not self._desde_cache(fuente):
+                self.estados[fuente["nombre"]] = {"status": ESTADO_PENDIENTE}
+        for fuente in self.por_lanzar:
+            if not self._desde_cache(fuente):
+                self.estados[fuente["nombre"]] = {"status": ESTADO_PENDIENTE if en_curso else ESTADO_OMITIDO}
+
+        pendientes = [n for n, e in self.estados.items() if e["status"] == ESTADO_PENDIENTE]
+        degradadas = [n for n, e in self.estados.items()
+                      if e["status"] in (ESTADO_OBSOLETO, ESTADO_ERROR, ESTADO_NO_DISPONIBLE)]
+        if not any(not r.get("vacio") for r in self.resultados.values()):
+            # Sin datos y alguna fuente caída: no se sabe si el BIN existe
+            if any(self.estados[n]["status"] != ESTADO_OBSOLETO for n in degradadas):
+                return no_disponible(self.bin, self.estados)
+            if not pendientes:
+                return None
+
+        return {
+            "bin": self.bin,
+            **fusionar(self.resultados),
+            "_freshness": FRESCURA_OBSOLETA if degradadas else FRESCURA_FRESCA,
+            "_sources": self.estados,
+            "_pending": pendientes
+        }
+
+
+def no_disponible(bin_number, estados=None):
+    """Respuesta sin datos porque las fuentes no respondieron (distinta de 'no encontrado')"""
+    return {
+        "bin": bin_number,
+        "_freshness": FRESCURA_NO_DISPONIBLE,
+        "_sources": estados or {},
+        "_pending": []
+    }
+
+
+class BinEnricher:
+    """Consulta concurrente de fuentes con plazo por request y caché en la base de datos"""
+
+    def __init__(self, db, fuentes=FUENTES, presupuesto=ENRICHMENT_BUDGET,
+                 cache_ttl=ENRICHMENT_CACHE_TTL, workers=ENRICHMENT_WORKERS, stale_max=ENRICHMENT_STALE_MAX):
+        self.db = db
+        self.fuentes = fuentes
+        self.presupuesto = presupuesto
+        self.cache_ttl = cache_ttl
+        self.workers = workers
+        self.stale_max = stale_max
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="enrich")
+        self._session = threading.local()
+        self.breakers = {fuente["nombre"]: CircuitBreaker(fuente["nombre"]) for fuente in fuentes}
+        # (bin, fuente) con un refresco en segundo plano en curso
+        self._revalidando = set()
+        self._lock_revalidar = threading.Lock()
+
+    def reiniciar_tras_fork(self):
+        """
+        Pool, sesiones y cortacircuitos propios en el proceso hijo
+        Los hilos y sockets del padre no sobreviven al fork (servidores pre-fork).
+        """
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="enrich")
+        self._session = threading.local()
+        self.breakers = {fuente["nombre"]: CircuitBreaker(fuente["nombre"]) for fuente in self.fuentes}
+        self._revalidando = set()
+        self._lock_revalidar = threading.Lock()
+
+    def _http(self):
+        """Una sesión HTTP por hilo (reutiliza conexiones keep-alive)"""
+        if not hasattr(self._session, "s"):
+            self._session.s = requests.Session()
+            self._session.s.headers["X-App-Token"] = APP_TOKEN_SOCRATA
+        return self._session.s
+
+    def _registrar(self, fuente, ticket, inicio, error):
+        """Resultado de la petición HTTP para el cortacircuitos de la fuente"""
+        if ticket is not None:
+            self.breakers[fuente["nombre"]].registrar(ticket, time.monotonic() - inicio, error)
+
+    def _consultar(self, fuente, bin_number, ctx, timeout, ticket=None):
+        """Consultar una fuente y guardar el resultado en caché (también si llega tarde)"""
+        url = f"{ENRICHMENT_BASE_URL}/resource/{fuente['dataset']}.json"
+        inicio = time.monotonic()
+        try:
+            response = self._http().get(url, params=fuente["consulta"](ctx), timeout=timeout)
+            response.raise_for_status()
+            filas = response.json()
+        except Exception:
+            self._registrar(fuente, ticket, inicio, True)
+            raise
+        self._registrar(fuente, ticket, inicio, False)
+        resultado = _resultado(fuente, filas)
+        if self.db:
+            self.db.put_bin_cache(bin_number, fuente["nombre"], resultado)
+        return resultado
+
+    def _espera(self, fuente, limite):
+        """Espera máxima por un hueco del cortacircuitos: hasta el plazo, o el timeout de la fuente"""
+        return fuente["timeout"] if limite is None else max(limite - time.monotonic(), 0)
+
+    def _consultar_con_hueco(self, fuente, bin_number, ctx, timeout, limite):
+        """
+        _consultar() con un ticket del cortacircuitos tomado ya en el hilo del pool
+        Lo que espera en la cola del pool no ocupa hueco; sin hueco antes del plazo
+        lanza SinHueco, y CircuitoAbierto si el circuito no deja pasar la llamada.
+        """
+        ticket = self.breakers[fuente["nombre"]].entrar(self._espera(fuente, limite))
+        if ticket is None:
+            raise CircuitoAbierto(fuente["nombre"])
+        return self._consultar(fuente, bin_number, ctx, timeout, ticket)
+
+    def _lanzar(self, ronda, fuente, bin_number, limite=None):
+        """Futuro de la consulta, o None si el circuito está abierto (falla al instante)"""
+        if self.breakers[fuente["nombre"]].rechaza():
+            ronda.no_disponible(fuente)
+            return None
+        return self._pool.submit(self._consultar_con_hueco, fuente, bin_number, dict(ronda.ctx),
+                                 fuente["timeout"], limite)
+
+    @staticmethod
+    def _recoger(ronda, fuente, futuro, sin_hueco):
+        """Anotar en la ronda el resultado de una consulta terminada"""
+        try:
+            ronda.usar(fuente, futuro.result(), ESTADO_OK)
+        except CircuitoAbierto:
+            ronda.no_disponible(fuente)
+        except SinHueco:
+            # Se acabó el plazo esperando turno: igual que si siguiera en curso
+            sin_hueco.append(fuente)
+        except Exception as e:
+            ronda.fallo(fuente, e)
+
+    def _pendiente_revalidar(self, ronda, bin_number):
+        """
+        (fuente, ticket) de las fuentes servidas caducadas que hay que refrescar
+        Un solo refresco por BIN y fuente a la vez, y solo si el circuito lo permite
+        y hay hueco (si no, lo intentará el siguiente request que sirva el dato caducado).
+        """
+        lanzar = []
+        for fuente in ronda.revalidar:
+            clave = (bin_number, fuente["nombre"])
+            with self._lock_revalidar:
+                if clave in self._revalidando:
+                    continue
+                try:
+                    ticket = self.breakers[fuente["nombre"]].entrar()
+                except SinHueco:
+                    continue
+                if ticket is None:
+                    continue
+                self._revalidando.add(clave)
+            lanzar.append((fuente, ticket))
+        ronda.revalidar = []
+        return lanzar
+
+    def _revalidado(self, clave, error):
+        with self._lock_revalidar:
+            self._revalidando.discard(clave)
+        if error:
+            print(f"⚠️  Background refresh of {clave[1]} for BIN {clave[0]} failed: {error!r}")
+
+    def _revalidar(self, ronda, bin_number):
+        for fuente, ticket in self._pendiente_revalidar(ronda, bin_number):
+            clave = (bin_number, fuente["nombre"])
+            futuro = self._pool.submit(self._consultar, fuente, bin_number, dict(ronda.ctx), fuente["timeout"], ticket)
+            futuro.add_done_callback(lambda f, clave=clave: self._revalidado(clave, f.exception()))
+
+    def reintentar_en(self):
+        """Segundos hasta que los circuitos abiertos vuelvan a probar (Retry-After)"""
+        return max(math.ceil(max((b.reintentar_en() for b in self.breakers.values()), default=0)), 1)
+
+    def estado_fuentes(self):
+        """Estado del cortacircuitos de cada fuente (health check)"""
+        return {nombre: breaker.resumen() for nombre, breaker in self.breakers.items()}
+
+    def version(self, bin_number):
+        """
+        Versión de la respuesta de un BIN si se serviría entera desde caché fresca
+        Devuelve (huella, fetched_at más reciente) o None si habría que consultar alguna
+        fuente (o el BIN no tiene datos). Sirve para responder 304 sin enriquecer.
+        """
+        if not self.db:
+            return None
+        cache = self.db.get_bin_cache(bin_number)
+        ctx = {"bin": bin_number}
+        usadas = []
+        por_revisar = list(self.fuentes)
+        avance = True
+        while avance:
+            avance = False
+            for fuente in list(por_revisar):
+                if fuente.get("requiere") and fuente["requiere"] not in ctx:
+                    continue
+                por_revisar.remove(fuente)
+                cacheado = cache.get(fuente["nombre"])
+                if not cacheado or cacheado[1] >= self.cache_ttl:
+                    return None
+                ctx.update(cacheado[0].get("provee", {}))
+                usadas.append((fuente["nombre"], cacheado[2], cacheado[0].get("vacio", False)))
+                avance = True
+
+        # Las fuentes que quedan sin dependencia se omiten también al enriquecer
+        if not any(not vacio for _, _, vacio in usadas):
+            return None
+        huella = "|".join(f"{nombre}@{fetched_at}" for nombre, fetched_at, _ in sorted(usadas))
+        return huella, max(fetched_at for _, fetched_at, _ in usadas)
+
+    def enriquecer(self, bin_number, presupuesto=None):
+        """
+        Datos del edificio fusionados desde todas las fuentes
+        Devuelve None si ninguna fuente conoce el BIN; '_sources' informa del estado de cada una.
+        """
+        limite = time.monotonic() + (presupuesto if presupuesto is not None else self.presupuesto)
+        ronda = _Ronda(bin_number, self.fuentes, self.db.get_bin_cache(bin_number) if self.db else {},
+                       self.cache_ttl, self.stale_max)
+        en_curso = {}
+        sin_hueco = []
+
+        while True:
+            # El plazo propio de la fuente puede superar el presupuesto: si llega
+            # tarde, su resultado igualmente se guarda en caché
+            for fuente in ronda.lanzables():
+                futuro = self._lanzar(ronda, fuente, bin_number, limite)
+                if futuro is not None:
+                    en_curso[futuro] = fuente
+            self._revalidar(ronda, bin_number)
+
+            restante = limite - time.monotonic()
+            if not en_curso or restante <= 0:
+                break
+
+            terminados, _ = wait(en_curso, timeout=restante, return_when=FIRST_COMPLETED)
+            for futuro in terminados:
+                self._recoger(ronda, en_curso.pop(futuro), futuro, sin_hueco)
+
+        return ronda.cerrar(list(en_curso.values()) + sin_hueco)
+
+    def refrescar(self, bin_number, antelacion, max_consultas):
+        """
+        Volver a consultar las fuentes de un BIN que caducan en menos de `antelacion` segundos
+        Para el pre-calentamiento: sin presupuesto de tiempo (cada fuente con su timeout)
+        y como mucho max_consultas peticiones a Socrata. Devuelve las peticiones hechas.
+        """
+        ronda = _Ronda(bin_number, self.fuentes, self.db.get_bin_cache(bin_number),
+                       max(self.cache_ttl - antelacion, 0))
+        consultas = 0
+        en_curso = {}
+
+        while True:
+            for fuente in ronda.lanzables():
+                if consultas >= max_consultas:
+                    break
+                futuro = self._lanzar(ronda, fuente, bin_number)
+                if futuro is not None:
+                    en_curso[futuro] = fuente
+                    consultas += 1
+
+            if not en_curso:
+                return consultas
+
+            terminados, _ = wait(en_curso, return_when=FIRST_COMPLETED)
+            for futuro in terminados:
+                self._recoger(ronda, en_curso.pop(futuro), futuro, [])
+
+    # ==========================================
+    # MODO ASÍNCRONO (ASGI)
+    # ==========================================
+
+    def iniciar_async(self, max_concurrencia=ENRICHMENT_MAX_CONCURRENCY):
+        """
+        Sesión HTTP asíncrona para el event loop actual (al arrancar el servidor ASGI)
+        Como mucho max_concurrencia consultas a la vez; el resto espera turno sin ocupar hilos.
+        """
+        import aiohttp
+        self._aiohttp = aiohttp
+        self._sesion = aiohttp.ClientSession(
+            headers={"X-App-Token": APP_TOKEN_SOCRATA},
+            connector=aiohttp.TCPConnector(limit=max_concurrencia)
+        )
+        self._semaforo = asyncio.Semaphore(max_concurrencia)
+        self._en_segundo_plano = set()
+
+    async def cerrar_async(self):
+        for tarea in list(getattr(self, "_en_segundo_plano", ())):
+            tarea.cancel()
+        sesion, self._sesion = getattr(self, "_sesion", None), None
+        if sesion is not None:
+            await sesion.close()
+
+    async def _consultar_con_hueco_async(self, fuente, bin_number, ctx, timeout, limite):
+        """_consultar_con_hueco() esperando el hueco sin bloquear el event loop"""
+        ticket = await self.breakers[fuente["nombre"]].entrar_async(self._espera(fuente, limite))
+        if ticket is None:
+            raise CircuitoAbierto(fuente["nombre"])
+        return await self._consultar_async(fuente, bin_number, ctx, timeout, ticket)
+
+    async def _consultar_async(self, fuente, bin_number, ctx, timeout, ticket=None):
+        url = f"{ENRICHMENT_BASE_URL}/resource/{fuente['dataset']}.json"
+        params = {k: str(v) for k, v in fuente["consulta"](ctx).items()}
+        async with self._semaforo:
+            inicio = time.monotonic()
+            try:
+                async with self._sesion.get(url, params=params,
+                                            timeout=self._aiohttp.ClientTimeout(total=timeout)) as response:
+                    response.raise_for_status()
+                    filas = await response.json(content_type=None)
+            except asyncio.CancelledError:
+                # Cancelada (apagado del servidor): no dice nada de Socrata
+                if ticket is not None:
+                    self.breakers[fuente["nombre"]].liberar(ticket)
+                raise
+            except Exception:
+                self._registrar(fuente, ticket, inicio, True)
+                raise
+        self._registrar(fuente, ticket, inicio, False)
+        resultado = _resultado(fuente, filas)
+        if self.db:
+            await asyncio.to_thread(self.db.put_bin_cache, bin_number, fuente["nombre"], resultado)
+        return resultado
+
+    def _terminada_en_segundo_plano(self, tarea):
+        self._en_segundo_plano.discard(tarea)
+        if tarea.cancelled() or not tarea.exception():
+            return
+        # Sin turno o con el circuito abierto no llegó a consultar: nada que avisar
+        if not isinstance(tarea.exception(), (SinHueco, CircuitoAbierto)):
+            print(f"⚠️  Late enrichment query failed: {tarea.exception()!r}")
+
+    def _en_segundo_plano_async(self, tarea):
+        self._en_segundo_plano.add(tarea)
+        tarea.add_done_callback(self._terminada_en_segundo_plano)
+
+    def _revalidar_async(self, ronda, bin_number):
+        for fuente, ticket in self._pendiente_revalidar(ronda, bin_number):
+            clave = (bin_number, fuente["nombre"])
+            tarea = asyncio.ensure_future(
+                self._consultar_async(fuente, bin_number, dict(ronda.ctx), fuente["timeout"], ticket)
+            )
+            tarea.add_done_callback(
+                lambda t, clave=clave: self._revalidado(clave, None if t.cancelled() else t.exception())
+            )
+            self._en_segundo_plano.add(tarea)
+            tarea.add_done_callback(self._en_segundo_plano.discard)
+
+    async def enriquecer_async(self, bin_number, presupuesto=None):
+        """Igual que enriquecer(), sin ocupar un hilo mientras se espera a Socrata"""
+        limite = time.monotonic() + (presupuesto if presupuesto is not None else self.presupuesto)
+        cache = await asyncio.to_thread(self.db.get_bin_cache, bin_number) if self.db else {}
+        ronda = _Ronda(bin_number, self.fuentes, cache, self.cache_ttl, self.stale_max)
+        en_curso = {}
+        sin_hueco = []
+
+        while True:
+            for fuente in ronda.lanzables():
+                if self.breakers[fuente["nombre"]].rechaza():
+                    ronda.no_disponible(fuente)
+                    continue
+                tarea = asyncio.ensure_future(
+                    self._consultar_con_hueco_async(fuente, bin_number, dict(ronda.ctx), fuente["timeout"], limite)
+                )
+                en_curso[tarea] = fuente
+            self._revalidar_async(ronda, bin_number)
+
+            restante = limite - time.monotonic()
+            if not en_curso or restante <= 0:
+                break
+
+            terminadas, _ = await asyncio.wait(en_curso, timeout=restante, return_when=asyncio.FIRST_COMPLETED)
+            for tarea in terminadas:
+                self._recoger(ronda, en_curso.pop(tarea), tarea, sin_hueco)
+
+        # Las consultas fuera de plazo terminan solas y dejan su resultado en caché
+        for tarea in en_curso:
+            self._en_segundo_plano_async(tarea)
+        return ronda.cerrar(list(en_curso.values()) + sin_hueco)
+
+
+# Instancia global
+bin_enricher = BinEnricher(db)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=bin_enricher.reiniciar_tras_fork)
+
+
+def obtener_datos_completos(bin_number):
+    """
+    Obtener datos completos del BIN desde NYC Open Data
+    """
+    try:
+        return bin_enricher.enriquecer(bin_number)
+    except Exception as e:
+        print(f"Error obteniendo datos BIN: {e}")
+        return no_disponible(bin_number)
+
+
+async def obtener_datos_completos_async(bin_number):
+    """obtener_datos_completos() para el modo ASGI"""
+    try:
+        return await bin_enricher.enriquecer_async(bin_number)
+    except Exception as e:
+        print(f"Error obteniendo datos BIN: {e}")
+        return no_disponible(bin_number)
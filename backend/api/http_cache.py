@@ -0,0 +1,108 @@
+"""
+GET condicionales (ETag / Last-Modified) y compresión negociada de respuestas JSON
+Las rutas calculan una versión barata (versión de fila, metadatos de caché) y
+responden 304 antes de construir el cuerpo si el cliente ya lo tiene.
+"""
+import gzip
+import hashlib
+import os
+from datetime import datetime, timezone
+
+from flask import Response, request
+from werkzeug.http import is_resource_modified
+
+# Tamaño mínimo del cuerpo para comprimir (por debajo no compensa)
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', '1024'))
+COMPRESS_GZIP_LEVEL = int(os.environ.get('COMPRESS_GZIP_LEVEL', '6'))
+COMPRESS_BROTLI_QUALITY = int(os.environ.get('COMPRESS_BROTLI_QUALITY', '5'))
+COMPRESS_MIMETYPES = ('application/json', 'application/x-ndjson', 'text/plain')
+
+# Respuestas por licencia: cacheables solo por el navegador y siempre revalidadas
+CACHE_CONTROL = 'private, no-cache'
+
+_brotli = None
+
+
+def _modulo_brotli():
+    """brotli es opcional: se importa la primera vez que un cliente lo acepta"""
+    global _brotli
+    if _brotli is None:
+        try:
+            import brotli
+            _brotli = brotli
+        except ImportError:
+            _brotli = False
+    return _brotli
+
+
+def etag(*partes):
+    """Valor de ETag (sin comillas) a partir de las partes de la versión"""
+    return hashlib.sha256("|".join(str(p) for p in partes).encode()).hexdigest()[:32]
+
+
+def _fecha(valor):
+    """Timestamp de SQLite ('YYYY-MM-DD HH:MM:SS', UTC) -> datetime"""
+    if not valor:
+        return None
+    try:
+        return datetime.strptime(valor[:19], "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc)
+    except ValueError:
+        return None
+
+
+def no_modificado(valor_etag, last_modified=None):
+    """
+    Respuesta 304 si el cliente ya tiene esta versión, si no None
+    If-None-Match tiene prioridad sobre If-Modified-Since (comparación débil).
+    """
+    fecha = _fecha(last_modified)
+    if is_resource_modified(request.environ, etag=valor_etag, last_modified=fecha):
+        return None
+    response = Response(status=304)
+    return marcar_version(response, valor_etag, last_modified)
+
+
+def marcar_version(response, valor_etag, last_modified=None):
+    """Añadir ETag (débil: el JSON es equivalente, no idéntico byte a byte) y Last-Modified"""
+    response.set_etag(valor_etag, weak=True)
+    fecha = _fecha(last_modified)
+    if fecha:
+        response.last_modified = fecha
+    response.headers['Cache-Control'] = CACHE_CONTROL
+    return response
+
+
+def _codificacion_aceptada():
+    """'br', 'gzip' o None según Accept-Encoding (brotli solo si está instalado)"""
+    aceptadas = request.accept_encodings
+    if aceptadas['br'] and _modulo_brotli():
+        return 'br'
+    if aceptadas['gzip']:
+        return 'gzip'
+    return None
+
+
+def comprimir_respuesta(response):
+    """after_request: comprimir cuerpos JSON grandes según lo que acepte el cliente"""
+    if (response.status_code < 200 or response.status_code in (204, 304)
+            or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESS_MIMETYPES):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    datos = response.get_data()
+    if len(datos) < COMPRESS_MIN_BYTES:
+        return response
+
+    codificacion = _codificacion_aceptada()
+    if codificacion == 'br':
+        comprimido = _modulo_brotli().compress(datos, quality=COMPRESS_BROTLI_QUALITY)
+    elif codificacion == 'gzip':
+        comprimido = gzip.compress(datos, compresslevel=COMPRESS_GZIP_LEVEL, mtime=0)
+    else:
+        return response
+
+    response.set_data(comprimido)
+    response.headers['Content-Encoding'] = codificacion
+    return response
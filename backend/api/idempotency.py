@@ -0,0 +1,74 @@
+"""
+Claves de idempotencia (header Idempotency-Key) para /api/generate
+Un reintento con la misma clave devuelve el resultado guardado sin re-renderizar
+ni volver a cobrar; un duplicado en curso espera al primero.
+"""
+import hashlib
+import os
+import time
+import zlib
+
+IDEMPOTENCY_TTL = int(os.environ.get('IDEMPOTENCY_TTL', '86400'))        # 24 horas
+IDEMPOTENCY_WAIT = float(os.environ.get('IDEMPOTENCY_WAIT', '60'))       # espera máxima de un duplicado
+IDEMPOTENCY_LEASE = int(os.environ.get('IDEMPOTENCY_LEASE', '300'))      # reserva abandonada tras este tiempo
+IDEMPOTENCY_MAX_KEY = 255
+
+# Intervalos de sondeo mientras el primer request sigue en curso
+_SONDEO_INICIAL = 0.05
+_SONDEO_MAXIMO = 0.5
+
+
+class IdempotencyConflict(Exception):
+    """La clave se usó con otro cuerpo, o el request original no terminó a tiempo"""
+
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def huella_request(body):
+    """Hash del cuerpo crudo del request (detecta reutilizar la clave con otros datos)"""
+    return hashlib.sha256(body or b'').hexdigest()
+
+
+class IdempotencyKeys:
+    def __init__(self, db, ttl=IDEMPOTENCY_TTL, wait=IDEMPOTENCY_WAIT, lease=IDEMPOTENCY_LEASE):
+        self.db = db
+        self.ttl = ttl
+        self.wait = wait
+        self.lease = lease
+
+    @staticmethod
+    def valid_key(key):
+        return bool(key) and len(key) <= IDEMPOTENCY_MAX_KEY
+
+    def begin(self, license_key, key, request_hash):
+        """
+        Reservar la clave o esperar al request que ya la tiene
+        Devuelve None si este request debe ejecutarse, o (status_code, body) guardado.
+        Lanza IdempotencyConflict si la clave no se puede usar.
+        """
+        limite = time.monotonic() + self.wait
+        pausa = _SONDEO_INICIAL
+        while True:
+            estado, status_code, response = self.db.claim_idempotency_key(
+                license_key, key, request_hash, self.ttl, self.lease
+            )
+            if estado == 'claimed':
+                return None
+            if estado == 'done':
+                return status_code, zlib.decompress(response)
+            if estado == 'mismatch':
+                raise IdempotencyConflict('Idempotency-Key already used with a different request', 422)
+            if time.monotonic() + pausa > limite:
+                raise IdempotencyConflict('A request with this Idempotency-Key is still in progress', 409)
+            time.sleep(pausa)
+            pausa = min(pausa * 2, _SONDEO_MAXIMO)
+
+    def finish(self, license_key, key, status_code, body):
+        """Guardar el resultado (comprimido) para servir los reintentos"""
+        self.db.complete_idempotency_key(license_key, key, status_code, zlib.compress(body, 6))
+
+    def abort(self, license_key, key):
+        """Liberar la clave sin resultado: el siguiente reintento se ejecuta de nuevo"""
+        self.db.release_idempotency_key(license_key, key)
@@ -1,9 +1,11 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Blueprint, current_app, request, jsonify, send_file, Response, stream_with_context
 from flask_cors import CORS
 import sys
 import os
-import io
 import base64
+import json
+import shutil
+import tempfile
 from datetime import datetime
 
 # Añadir directorio padre al path para importar módulos
@@ -11,16 +13,55 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 # Importar módulos locales
 from api.database import db, DATABASE_PATH
-from api import pdf_generator
+from api import pdf_generator, pdf_output, enrichment
+from api.output_cache import output_cache, clave_filing, OUTPUT_CACHE_CHARGE_ON_HIT
+from api.session_tokens import SessionTokens
+from api.idempotency import IdempotencyKeys, IdempotencyConflict, huella_request
+from api import profiling, http_cache
+from api.config_provider import config_provider
+from api.company_profiles import PerfilesCompilados, validar_perfil
+from api.cache_warmer import cache_warmer
+from api.address_index import address_index, separar_direccion
 
-app = Flask(__name__)
-CORS(app)  # Permitir CORS para GitHub Pages
+api = Blueprint('api', __name__)
+
+# Plantillas PDF por formulario (valor por defecto de la configuración TEMPLATES)
+TEMPLATES = {
+    'tm1': 'templates/tm-1.pdf',
+    'a433': 'templates/a-433.pdf',
+    'b45': 'templates/b45.pdf'
+}
+
+# Tokens de sesión firmados (validación en memoria para rutas de lectura)
+session_tokens = SessionTokens(db)
+
+# Claves de idempotencia de /api/generate
+idempotency_keys = IdempotencyKeys(db)
+
+# Perfiles de empresa por licencia, ya combinados con config.json
+company_profiles = PerfilesCompilados(db)
+
+def resolve_license():
+    """
+    Obtener la licencia del header Authorization
+    Acepta un token de sesión o la clave de licencia en crudo.
+    Un token solo vale con el X-Fingerprint del dispositivo al que se emitió.
+    Devuelve (license_key, from_token); license_key es None si el token no es válido.
+    """
+    auth_header = request.headers.get('Authorization', '')
+    credential = auth_header.replace('Bearer ', '').strip()
+    
+    if session_tokens.is_token(credential):
+        claims = session_tokens.validate(credential, request.headers.get('X-Fingerprint', ''))
+        return (claims['lk'] if claims else None), True
+    
+    return credential, False
 
 # ============================================
 # AUTHENTICATION ROUTES
 # ============================================
 
-@app.route('/api/auth/verify', methods=['POST'])
+@api.route('/api/auth/verify', methods=['POST'])
 def verify_license():
     """Verificar licencia y retornar información"""
     data = request.json
@@ -36,20 +77,27 @@ def verify_license():
     if not license_info:
         return jsonify({'error': 'Invalid or inactive license'}), 403
     
-    # Verificar límite de dispositivos
+    # Verificar límite de dispositivos (con el log de auditoría en la misma transacción)
     if fingerprint:
-        device_allowed = db.check_device_limit(license_key, fingerprint, max_devices=3)
-        if not device_allowed:
+        admitted = db.admit_device(license_key, fingerprint, max_devices=3,
+                                   action='LOGIN', ip_address=request.remote_addr)
+        if not admitted['allowed']:
             return jsonify({
                 'error': 'Device limit reached',
                 'message': 'Maximum 3 devices allowed per license. Contact support to reset.'
             }), 403
+    else:
+        # Log de auditoría
+        db.log_usage(license_key, fingerprint, request.remote_addr, 'LOGIN')
     
-    # Log de auditoría
-    db.log_usage(license_key, fingerprint, request.remote_addr, 'LOGIN')
+    token, token_expires = session_tokens.issue(
+        license_key, fingerprint, license_info['revocation_epoch']
+    )
     
     return jsonify({
         'success': True,
+        'token': token,
+        'token_expires': token_expires,
         'email': license_info['email'],
         'company': license_info['company_name'],
         'credits_total': license_info['credits_total'],
@@ -58,126 +106,345 @@ def verify_license():
         'reset_date': license_info['reset_date']
     }), 200
 
-@app.route('/api/auth/info', methods=['GET'])
+@api.route('/api/auth/info', methods=['GET'])
 def get_license_info():
     """Obtener información detallada de licencia"""
-    auth_header = request.headers.get('Authorization', '')
-    license_key = auth_header.replace('Bearer ', '').strip()
+    license_key, from_token = resolve_license()
+    
+    if from_token and not license_key:
+        return jsonify({'error': 'Session expired or revoked'}), 401
     
     if not license_key:
         return jsonify({'error': 'Authorization required'}), 401
     
+    # Versión de fila + último uso (recent_usage): si el cliente ya la tiene, 304 sin leer nada más
+    version = db.get_license_version(license_key)
+    if not version:
+        return jsonify({'error': 'Invalid license'}), 403
+    
+    row_version, updated_at, usage_id, usage_at = version
+    valor_etag = http_cache.etag('license', license_key, row_version, usage_id)
+    last_modified = max(filter(None, (updated_at, usage_at)), default=None)
+    not_modified = http_cache.no_modificado(valor_etag, last_modified)
+    if not_modified:
+        return not_modified
+    
     info = db.get_license_info(license_key)
     
     if not info:
         return jsonify({'error': 'Invalid license'}), 403
     
-    return jsonify(info), 200
+    return http_cache.marcar_version(jsonify(info), valor_etag, last_modified), 200
 
 # ============================================
 # BIN DATA ROUTE
 # ============================================
 
-@app.route('/api/bin/<bin_number>', methods=['GET'])
+def autorizar_bin(license_key, from_token):
+    """Respuesta de error si el request de BIN no está autorizado, si no None"""
+    # Con token: solo firma en memoria
+    if from_token:
+        if not license_key:
+            return jsonify({'error': 'Session expired or revoked'}), 401
+    elif not db.verify_license(license_key):
+        return jsonify({'error': 'Invalid license'}), 403
+    return None
+
+def bin_no_modificado(bin_number):
+    """304 si todo está en caché fresca y el cliente ya tiene esa versión (sin enriquecer)"""
+    version = enrichment.bin_enricher.version(bin_number)
+    if version:
+        valor_etag = http_cache.etag('bin', bin_number, version[0])
+        return http_cache.no_modificado(valor_etag, version[1])
+    return None
+
+def respuesta_bin(license_key, bin_number, data):
+    """Respuesta de /api/bin a partir de los datos enriquecidos"""
+    if not data:
+        return jsonify({'error': 'BIN not found'}), 404
+    
+    # Socrata no respondió y no hay nada en caché: no es un BIN inexistente
+    if data.get('_freshness') == enrichment.FRESCURA_NO_DISPONIBLE:
+        response = jsonify({
+            'error': 'NYC Open Data is not responding, please try again shortly',
+            '_freshness': data['_freshness'],
+            '_sources': data['_sources']
+        })
+        response.headers['Retry-After'] = str(enrichment.bin_enricher.reintentar_en())
+        return response, 503
+    
+    db.log_usage(license_key, '', request.remote_addr, f'BIN_LOOKUP:{bin_number}')
+    response = jsonify(data)
+    # Con fuentes pendientes la respuesta está incompleta: sin versión
+    version = enrichment.bin_enricher.version(bin_number)
+    if version:
+        http_cache.marcar_version(response, http_cache.etag('bin', bin_number, version[0]), version[1])
+    return response, 200
+
+@api.route('/api/bin/<bin_number>', methods=['GET'])
 def get_bin_data(bin_number):
     """Obtener datos de BIN desde NYC Open Data"""
-    auth_header = request.headers.get('Authorization', '')
-    license_key = auth_header.replace('Bearer ', '').strip()
+    license_key, from_token = resolve_license()
     
     # Verificar autenticación
-    if not db.verify_license(license_key):
-        return jsonify({'error': 'Invalid license'}), 403
+    error = autorizar_bin(license_key, from_token)
+    if error:
+        return error
     
     try:
-        # Usar función de tu main.py
-        data = pdf_generator.obtener_datos_completos(bin_number)
+        not_modified = bin_no_modificado(bin_number)
+        if not_modified:
+            return not_modified
         
-        if data:
-            db.log_usage(license_key, '', request.remote_addr, f'BIN_LOOKUP:{bin_number}')
-            return jsonify(data), 200
-        else:
-            return jsonify({'error': 'BIN not found or API error'}), 404
+        # Consulta concurrente de datasets dentro del presupuesto de tiempo
+        data = enrichment.obtener_datos_completos(bin_number)
+        return respuesta_bin(license_key, bin_number, data)
             
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@api.route('/api/search', methods=['GET'])
+def search_address():
+    """
+    Buscar BINs por dirección en el índice local (tolera erratas)
+    ?q=123 W 42nd St, Manhattan   o   ?house=123&street=W 42 St&borough=1&zip=10036
+    """
+    license_key, from_token = resolve_license()
+    
+    error = autorizar_bin(license_key, from_token)
+    if error:
+        return error
+    
+    consulta = separar_direccion(request.args.get('q', ''))
+    for campo in ('house', 'street', 'borough', 'zip'):
+        if request.args.get(campo):
+            consulta[campo] = request.args[campo]
+    if not consulta['street']:
+        return jsonify({'error': 'Missing street (q or street parameter)'}), 400
+    
+    try:
+        limite = min(max(int(request.args.get('limit', 10)), 1), 50)
+    except ValueError:
+        return jsonify({'error': 'Invalid limit'}), 400
+    
+    try:
+        address_index.asegurar_al_dia()
+        candidatos = address_index.buscar(consulta['house'], consulta['street'], consulta['borough'],
+                                          consulta['zip'], limite)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    
+    return jsonify({'query': consulta, 'results': candidatos}), 200
+
 # ============================================
 # DOCUMENT GENERATION ROUTE
 # ============================================
 
-@app.route('/api/generate', methods=['POST'])
+@api.route('/api/generate', methods=['POST'])
 def generate_documents():
     """Generar documentos FDNY"""
-    auth_header = request.headers.get('Authorization', '')
-    license_key = auth_header.replace('Bearer ', '').strip()
+    license_key, from_token = resolve_license()
     fingerprint = request.headers.get('X-Fingerprint', '')
     
-    # 1. Verificar licencia
+    # 1. Verificar licencia (consume créditos: siempre contra la base de datos)
+    if from_token and not license_key:
+        return jsonify({'error': 'Session expired or revoked'}), 401
+    
     license_info = db.verify_license(license_key)
     if not license_info:
         return jsonify({'error': 'Invalid license'}), 403
     
-    # 2. Verificar créditos
-    if not db.check_credits(license_key):
-        return jsonify({
-            'error': 'No credits remaining',
-            'credits_used': license_info['credits_used'],
-            'credits_total': license_info['credits_total'],
-            'reset_date': license_info['reset_date']
-        }), 429
-    
-    # 3. Verificar rate limit
-    if not db.check_rate_limit(license_key, max_per_hour=15):
-        return jsonify({
-            'error': 'Rate limit exceeded',
-            'message': 'Maximum 15 documents per hour. Please try again later.'
-        }), 429
-    
-    # 4. Obtener datos del request
+    # 2. Obtener datos del request (configuración de la licencia y fecha fijas para todo el filing)
+    contexto = pdf_generator.ContextoGeneracion(company_profiles.config_licencia(
+        license_key, license_info['profile_version'], config_provider.actual()
+    ))
     data = request.json
     bin_number = data.get('bin')
     devices = data.get('devices', [])
     bin_data = data.get('bin_data', {})
+    appearance_mode = data.get('appearance_mode')
+    output_profile = data.get('output_profile') or contexto.output_profile
+    packet = bool(data.get('packet', False))
     
     if not bin_number:
         return jsonify({'error': 'BIN number required'}), 400
     
+    if appearance_mode and appearance_mode not in pdf_generator.pdf_appearance.MODOS_APARIENCIA:
+        return jsonify({'error': f'Invalid appearance_mode: {appearance_mode}'}), 400
+    
+    if output_profile not in pdf_output.PERFILES_SALIDA:
+        return jsonify({'error': f'Invalid output_profile: {output_profile}'}), 400
+    
+    args = (license_key, license_info, fingerprint, bin_number, devices, bin_data,
+            appearance_mode, output_profile, packet, contexto)
+    
+    # 3. Idempotency-Key: un reintento devuelve el resultado guardado sin re-generar ni re-cobrar
+    idem_key = request.headers.get('Idempotency-Key', '').strip()
+    if not idem_key:
+        return _generar_documentos(*args)
+    
+    if not idempotency_keys.valid_key(idem_key):
+        return jsonify({'error': 'Invalid Idempotency-Key'}), 400
+    
+    try:
+        stored = idempotency_keys.begin(license_key, idem_key, huella_request(request.get_data()))
+    except IdempotencyConflict as e:
+        return jsonify({'error': str(e)}), e.status_code
+    
+    if stored:
+        status_code, body = stored
+        return Response(body, status=status_code, mimetype='application/json',
+                        headers={'Idempotent-Replayed': 'true'})
+    
     try:
-        # 5. Generar PDFs
+        response, status_code = _generar_documentos(*args)
+    except BaseException:
+        idempotency_keys.abort(license_key, idem_key)
+        raise
+    
+    # Solo se guardan los éxitos; los errores (sin créditos, fallos) se pueden reintentar
+    if status_code == 200:
+        idempotency_keys.finish(license_key, idem_key, status_code, response.get_data())
+    else:
+        idempotency_keys.abort(license_key, idem_key)
+    return response, status_code
+
+def _sin_creditos(license_key, license_info):
+    """429 de saldo agotado con el saldo actual (otro request pudo gastar el último crédito)"""
+    current = db.verify_license(license_key) or license_info
+    return jsonify({
+        'error': 'No credits remaining',
+        'credits_used': current['credits_used'],
+        'credits_total': current['credits_total'],
+        'reset_date': current['reset_date']
+    }), 429
+
+def _generar_documentos(license_key, license_info, fingerprint, bin_number, devices, bin_data,
+                        appearance_mode, output_profile, packet, contexto):
+    """Generar (o servir de caché) los documentos de un request ya validado"""
+    templates = current_app.config['TEMPLATES']
+    
+    # 4. Verificar créditos (también para servir de caché: sin saldo no hay documentos)
+    if not db.check_credits(license_key):
+        return _sin_creditos(license_key, license_info)
+    
+    # 5. Reservar hueco del rate limit (se libera si el request no se completa)
+    rate_slot = db.reserve_rate_limit(license_key, max_per_hour=15)
+    if rate_slot is None:
+        return jsonify({
+            'error': 'Rate limit exceeded',
+            'message': 'Maximum 15 documents per hour. Please try again later.'
+        }), 429
+    
+    # 6. Caché de filings idénticos (mismo edificio, dispositivos, plantillas, config y día)
+    cache_key = None
+    if output_cache:
+        cache_key = clave_filing(
+            license_key,
+            {
+                'bin': bin_number,
+                'devices': devices,
+                'bin_data': bin_data,
+                'appearance_mode': appearance_mode or contexto.appearance_mode,
+                'output_profile': output_profile,
+                'packet': packet
+            },
+            templates,
+            contexto.config.version,
+            contexto.fecha.isoformat()
+        )
+        cached = output_cache.get(cache_key)
+        
+        if cached:
+            if OUTPUT_CACHE_CHARGE_ON_HIT and not db.consume_credit(license_key, note=f'GENERATE_CACHED:{bin_number}'):
+                db.release_rate_limit(rate_slot)
+                return _sin_creditos(license_key, license_info)
+            db.log_usage(license_key, fingerprint, request.remote_addr, f'GENERATE_CACHED:{bin_number}')
+            
+            updated_license = db.verify_license(license_key)
+            
+            return jsonify({
+                **cached,
+                'success': True,
+                'cached': True,
+                'credits_used': updated_license['credits_used'],
+                'credits_total': updated_license['credits_total'],
+                'message': 'Documents served from cache'
+            }), 200
+    
+    temp_dir = None
+    try:
+        # 7. Generar PDFs
         full_data = {**bin_data, 'devices': devices}
         
-        # Paths temporales
-        temp_dir = '/tmp'
+        # Paths temporales en un directorio propio del request: un fallo no puede servir
+        # el PDF que dejó otro request del mismo BIN
+        temp_dir = tempfile.mkdtemp(prefix='fdny_generate_')
         tm1_path = os.path.join(temp_dir, f'TM1_{bin_number}.pdf')
         a433_path = os.path.join(temp_dir, f'A433_{bin_number}.pdf')
         b45_path = os.path.join(temp_dir, f'B45_{bin_number}.pdf')
         report_path = os.path.join(temp_dir, f'REPORT_{bin_number}.txt')
+        packet_path = os.path.join(temp_dir, f'PACKET_{bin_number}.pdf')
         
         # Generar documentos usando tu código
-        pdf_generator.generar_tm1(full_data, 'templates/tm-1.pdf', tm1_path)
-        pdf_generator.generar_a433(full_data, 'templates/a-433.pdf', a433_path)
-        pdf_generator.generar_b45(full_data, 'templates/b45.pdf', b45_path)
-        pdf_generator.generar_reporte_auditoria(full_data, report_path)
+        ok_tm1 = pdf_generator.generar_tm1(full_data, templates['tm1'], tm1_path, appearance_mode, contexto)
+        ok_a433 = pdf_generator.generar_a433(full_data, templates['a433'], a433_path, appearance_mode, contexto)
+        ok_b45 = pdf_generator.generar_b45(full_data, templates['b45'], b45_path, appearance_mode, contexto)
+        
+        if packet:
+            # Un solo PDF con marcadores; el reporte va como última página.
+            # El paquete va completo o no se entrega (ni se cobra)
+            formularios = [
+                (ok_tm1, 'TM1', 'TM-1', tm1_path),
+                (ok_a433, 'A433', 'A-433', a433_path),
+                (ok_b45, 'B45', 'B-45', b45_path)
+            ]
+            fallidos = [titulo for ok, _, titulo, _ in formularios if not ok]
+            if not fallidos:
+                documentos = [(prefijo, titulo, path) for _, prefijo, titulo, path in formularios]
+                if not pdf_generator.generar_paquete(documentos, full_data, packet_path, contexto):
+                    fallidos = ['Packet']
+            if fallidos:
+                db.release_rate_limit(rate_slot)
+                return jsonify({
+                    'error': f"Packet generation failed: {', '.join(fallidos)}",
+                    'failed': fallidos
+                }), 500
+            outputs = [('packet', packet_path)]
+        else:
+            pdf_generator.generar_reporte_auditoria(full_data, report_path, contexto)
+            outputs = [('tm1', tm1_path), ('a433', a433_path), ('b45', b45_path), ('report', report_path)]
         
-        # Convertir a base64 para enviar al frontend
+        # Optimizar PDFs y convertir a base64 para enviar al frontend
         files = {}
-        for key, path in [('tm1', tm1_path), ('a433', a433_path), ('b45', b45_path), ('report', report_path)]:
+        output_sizes = {}
+        for key, path in outputs:
             if os.path.exists(path):
                 with open(path, 'rb') as f:
                     content = f.read()
-                    files[key] = base64.b64encode(content).decode('utf-8')
+                if key != 'report':
+                    content, output_sizes[key] = pdf_output.optimizar_pdf(content, output_profile)
+                    print(f"   📦 {key}: {output_sizes[key]['size_before']} -> {output_sizes[key]['size_after']} bytes")
+                files[key] = base64.b64encode(content).decode('utf-8')
+        
+        # 8. Consumir crédito (atómico: otro nodo pudo gastar el último mientras tanto)
+        if not db.consume_credit(license_key, note=f'GENERATE:{bin_number}'):
+            db.release_rate_limit(rate_slot)
+            return _sin_creditos(license_key, license_info)
         
-        # 6. Consumir crédito
-        db.consume_credit(license_key)
-        db.log_request(license_key)
+        # Solo se cachea un filing ya cobrado
+        if cache_key:
+            output_cache.put(cache_key, {'files': files, 'output_sizes': output_sizes})
         db.log_usage(license_key, fingerprint, request.remote_addr, f'GENERATE:{bin_number}')
         
-        # 7. Actualizar info de licencia
+        # 9. Actualizar info de licencia
         updated_license = db.verify_license(license_key)
         
         return jsonify({
             'success': True,
             'files': files,
+            'output_sizes': output_sizes,
+            'cached': False,
             'credits_used': updated_license['credits_used'],
             'credits_total': updated_license['credits_total'],
             'message': 'Documents generated successfully'
@@ -185,13 +452,17 @@ def generate_documents():
         
     except Exception as e:
         print(f"Error generating documents: {e}")
+        db.release_rate_limit(rate_slot)
         return jsonify({'error': f'Generation failed: {str(e)}'}), 500
+    finally:
+        if temp_dir:
+            shutil.rmtree(temp_dir, ignore_errors=True)
 
 # ============================================
 # ADMIN ROUTES (Opcional)
 # ============================================
 
-@app.route('/api/admin/create-license', methods=['POST'])
+@api.route('/api/admin/create-license', methods=['POST'])
 def admin_create_license():
     """Crear nueva licencia (solo admin)"""
     # TODO: Agregar autenticación de admin
@@ -212,51 +483,188 @@ def admin_create_license():
     else:
         return jsonify(result), 400
 
-@app.route('/api/admin/list-licenses', methods=['GET'])
+@api.route('/api/admin/create-licenses', methods=['POST'])
+def admin_create_licenses_bulk():
+    """
+    Crear licencias en lote (solo admin, header X-Admin-Token)
+    Body: [{email, company_name, credits, months}, ...] o {"licenses": [...]}
+    Respuesta NDJSON: una línea por fila y una línea final de resumen
+    """
+    if not profiling.es_admin(request.headers.get('X-Admin-Token', ''), current_app.config['ADMIN_TOKEN']):
+        return jsonify({'error': 'Admin token required'}), 403
+    
+    data = request.get_json(silent=True)
+    records = data.get('licenses') if isinstance(data, dict) else data
+    
+    if not isinstance(records, list) or not records:
+        return jsonify({'error': 'A non-empty list of licenses is required'}), 400
+    if not all(isinstance(r, dict) for r in records):
+        return jsonify({'error': 'Each license must be an object'}), 400
+    
+    # Una sola transacción; las filas en conflicto se reportan sin abortar el lote
+    results = db.create_licenses_bulk(records)
+    
+    def stream():
+        created = 0
+        for row in results:
+            created += 1 if row.get('success') else 0
+            yield json.dumps(row) + '\n'
+        yield json.dumps({
+            'summary': True,
+            'total': len(results),
+            'created': created,
+            'failed': len(results) - created
+        }) + '\n'
+    
+    return Response(stream_with_context(stream()), status=200, mimetype='application/x-ndjson')
+
+@api.route('/api/admin/list-licenses', methods=['GET'])
 def admin_list_licenses():
     """Listar todas las licencias (solo admin)"""
     # TODO: Agregar autenticación de admin
     
-    conn = db.get_connection()
-    cursor = conn.cursor()
+    version = db.get_licenses_version()
+    valor_etag = http_cache.etag('licenses', *version[:3])
+    not_modified = http_cache.no_modificado(valor_etag, version[3])
+    if not_modified:
+        return not_modified
+    
+    licenses = db.list_licenses()
     
-    cursor.execute('''
-        SELECT license_key, email, company_name, credits_total, credits_used, 
-               active, created_at, last_used
-        FROM licenses
-        ORDER BY created_at DESC
-    ''')
+    return http_cache.marcar_version(jsonify(licenses), valor_etag, version[3]), 200
+
+@api.route('/api/admin/company-profile/<license_key>', methods=['GET', 'PUT', 'DELETE'])
+def admin_company_profile(license_key):
+    """
+    Perfil de empresa de una licencia (solo admin, header X-Admin-Token)
+    PUT: {"fire_alarm_company": {...}, "architect_applicant": {...}, ...}
+    DELETE: la licencia vuelve a usar config.json
+    """
+    if not profiling.es_admin(request.headers.get('X-Admin-Token', ''), current_app.config['ADMIN_TOKEN']):
+        return jsonify({'error': 'Admin token required'}), 403
     
-    licenses = [dict(row) for row in cursor.fetchall()]
-    conn.close()
+    if request.method == 'GET':
+        stored = db.get_company_profile(license_key)
+        if not stored:
+            return jsonify({'error': 'Profile not found'}), 404
+        return jsonify({'license_key': license_key, 'profile': stored[0], 'version': stored[1]}), 200
     
-    return jsonify(licenses), 200
+    profile = None
+    if request.method == 'PUT':
+        profile = request.get_json(silent=True)
+        try:
+            validar_perfil(profile)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+    
+    version = db.set_company_profile(license_key, profile)
+    if version is None:
+        return jsonify({'error': 'License not found'}), 404
+    return jsonify({'success': True, 'license_key': license_key, 'version': version}), 200
+
+@api.route('/api/admin/profiles/<request_id>', methods=['GET'])
+def admin_get_profile(request_id):
+    """
+    Descargar el perfil de un request (solo admin, header X-Admin-Token)
+    Por defecto el resumen JSON; ?format=pstats devuelve los datos para pstats/snakeviz
+    """
+    if not profiling.es_admin(request.headers.get('X-Admin-Token', ''), current_app.config['ADMIN_TOKEN']):
+        return jsonify({'error': 'Admin token required'}), 403
+    if not profiling.valid_request_id(request_id):
+        return jsonify({'error': 'Invalid request id'}), 400
+    
+    directorio = current_app.config['PROFILE_DIR']
+    if request.args.get('format') == 'pstats':
+        path = profiling.ruta_perfil(request_id, 'prof', directorio)
+        if not os.path.exists(path):
+            return jsonify({'error': 'Profile not found'}), 404
+        return send_file(path, mimetype='application/octet-stream',
+                         as_attachment=True, download_name=f'{request_id}.prof')
+    
+    path = profiling.ruta_perfil(request_id, 'json', directorio)
+    if not os.path.exists(path):
+        return jsonify({'error': 'Profile not found'}), 404
+    with open(path) as f:
+        return jsonify(json.load(f)), 200
 
 # ============================================
 # HEALTH CHECK
 # ============================================
 
-@app.route('/api/health', methods=['GET'])
+@api.route('/api/health', methods=['GET'])
 def health_check():
     """Verificar que la API está funcionando"""
     return jsonify({
         'status': 'healthy',
         'timestamp': datetime.now().isoformat(),
-        'version': '1.0.0'
+        'version': '1.0.0',
+        'config_version': config_provider.actual().version,
+        'upstream': enrichment.bin_enricher.estado_fuentes()
     }), 200
 
 # ============================================
 # ERROR HANDLERS
 # ============================================
 
-@app.errorhandler(404)
+@api.app_errorhandler(404)
 def not_found(error):
     return jsonify({'error': 'Endpoint not found'}), 404
 
-@app.errorhandler(500)
+@api.app_errorhandler(500)
 def internal_error(error):
     return jsonify({'error': 'Internal server error'}), 500
 
+# ============================================
+# APP FACTORY
+# ============================================
+
+def create_app(config=None):
+    """
+    Crear la aplicación Flask
+    config: dict opcional que se aplica sobre app.config (p. ej. TEMPLATES, PRELOAD, ADMIN_TOKEN)
+    
+    Con PRELOAD (por defecto) se cargan plantillas, métricas, overlays y el índice
+    de direcciones en memoria.
+    Bajo un servidor pre-fork con preload, esto ocurre una sola vez en el proceso
+    maestro y los workers comparten esas páginas por copy-on-write.
+    """
+    app = Flask(__name__)
+    app.config.update(
+        TEMPLATES=dict(TEMPLATES),
+        PRELOAD=True,
+        ADMIN_TOKEN=profiling.ADMIN_TOKEN,
+        PROFILE_DIR=profiling.PROFILE_DIR
+    )
+    app.config.update(config or {})
+    
+    CORS(app)  # Permitir CORS para GitHub Pages
+    
+    # Falla al arrancar si la base de datos no es usable (en vez de fallar en cada request)
+    db.health_check()
+    
+    if app.config['PRELOAD']:
+        pdf_generator.precargar_plantillas(app.config['TEMPLATES'])
+        address_index.construir()
+    
+    # config.json se recarga al cambiar el fichero; la señal fuerza la recarga
+    config_provider.instalar_senal()
+    
+    # Pre-calentamiento de la caché de BINs en segundo plano (ENRICHMENT_WARM_INTERVAL)
+    if cache_warmer.intervalo > 0:
+        app.before_request(cache_warmer.asegurar_en_marcha)
+    
+    app.register_blueprint(api)
+    
+    # Compresión gzip/brotli negociada para cuerpos JSON grandes
+    app.after_request(http_cache.comprimir_respuesta)
+    
+    # Perfilado por request (X-Profile + X-Admin-Token); sin token no se instala
+    if app.config['ADMIN_TOKEN']:
+        app.wsgi_app = profiling.RequestProfiler(
+            app.wsgi_app, app.config['ADMIN_TOKEN'], app.config['PROFILE_DIR']
+        )
+    return app
+
 # ============================================
 # DEVELOPMENT SERVER
 # ============================================
@@ -272,6 +680,8 @@ if __name__ == '__main__':
         create_test_license()
         create_admin_license()
     
+    app = create_app()
+    
     print("✅ Ready!")
     print("🌐 Server running on http://localhost:5000")
     
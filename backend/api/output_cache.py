@@ -0,0 +1,131 @@
+"""
+Caché de documentos generados direccionada por contenido
+Evita re-renderizar (y re-cobrar) filings idénticos
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+OUTPUT_CACHE_DIR = os.environ.get('OUTPUT_CACHE_DIR', '/tmp/fdny_output_cache')
+OUTPUT_CACHE_MAX_BYTES = int(os.environ.get('OUTPUT_CACHE_MAX_MB', '200')) * 1024 * 1024
+OUTPUT_CACHE_ENABLED = os.environ.get('OUTPUT_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+
+# Política de créditos: por defecto re-descargar un filing ya pagado no consume crédito
+OUTPUT_CACHE_CHARGE_ON_HIT = os.environ.get('OUTPUT_CACHE_CHARGE_ON_HIT', 'false').lower() in ('1', 'true', 'yes')
+
+
+def _sin_metadatos(valor):
+    """
+    Entradas tal cual se enviaron, sin los metadatos de la consulta
+    Los textos y el orden de los dispositivos se imprimen en los PDFs: no se normalizan.
+    """
+    if isinstance(valor, dict):
+        # Las claves "_" son metadatos de la consulta (estado de fuentes, tiempos)
+        return {str(k): _sin_metadatos(v) for k, v in valor.items() if not str(k).startswith("_")}
+    if isinstance(valor, (list, tuple)):
+        return [_sin_metadatos(v) for v in valor]
+    return valor
+
+
+def version_plantilla(ruta):
+    """Versión barata de una plantilla en disco (mtime + tamaño)"""
+    try:
+        st = os.stat(ruta)
+        return f"{int(st.st_mtime)}:{st.st_size}"
+    except OSError:
+        return "missing"
+
+
+def clave_filing(license_key, entradas, plantillas, config_version, fecha):
+    """
+    Clave de caché de un filing
+    entradas: datos del request que afectan al documento (bin, devices, opciones...)
+    plantillas: {formulario: ruta}
+    """
+    entradas = _sin_metadatos(entradas)
+    payload = json.dumps({
+        "license": license_key,
+        "inputs": entradas,
+        "templates": {k: version_plantilla(v) for k, v in sorted(plantillas.items())},
+        "config": config_version,
+        "date": fecha
+    }, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class OutputCache:
+    """Caché LRU en disco limitada por tamaño total"""
+
+    def __init__(self, directorio=OUTPUT_CACHE_DIR, max_bytes=OUTPUT_CACHE_MAX_BYTES):
+        self.directorio = directorio
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._indice = OrderedDict()  # clave -> tamaño, del menos al más reciente
+        self._total = 0
+        self._cargar_indice()
+
+    def _ruta(self, clave):
+        return os.path.join(self.directorio, f"{clave}.json")
+
+    def _cargar_indice(self):
+        """Reconstruir el orden LRU desde el disco (por mtime)"""
+        os.makedirs(self.directorio, exist_ok=True)
+        entradas = []
+        for nombre in os.listdir(self.directorio):
+            if not nombre.endswith(".json"):
+                continue
+            st = os.stat(os.path.join(self.directorio, nombre))
+            entradas.append((st.st_mtime, nombre[:-5], st.st_size))
+        for _, clave, tamano in sorted(entradas):
+            self._indice[clave] = tamano
+            self._total += tamano
+
+    def get(self, clave):
+        """Devolver el resultado cacheado o None"""
+        with self._lock:
+            if clave not in self._indice:
+                return None
+            self._indice.move_to_end(clave)
+        try:
+            with open(self._ruta(clave), "r", encoding="utf-8") as f:
+                resultado = json.load(f)
+            os.utime(self._ruta(clave))
+            return resultado
+        except (OSError, ValueError):
+            with self._lock:
+                self._total -= self._indice.pop(clave, 0)
+            return None
+
+    def put(self, clave, resultado):
+        """Guardar un resultado y expulsar los menos usados si se supera el límite"""
+        contenido = json.dumps(resultado).encode("utf-8")
+        if len(contenido) > self.max_bytes:
+            return
+
+        temporal = self._ruta(clave) + ".tmp"
+        with open(temporal, "wb") as f:
+            f.write(contenido)
+        os.replace(temporal, self._ruta(clave))
+
+        with self._lock:
+            self._total -= self._indice.pop(clave, 0)
+            self._indice[clave] = len(contenido)
+            self._total += len(contenido)
+
+            while self._total > self.max_bytes and self._indice:
+                antigua, tamano = self._indice.popitem(last=False)
+                self._total -= tamano
+                try:
+                    os.remove(self._ruta(antigua))
+                except OSError:
+                    pass
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._indice), "bytes": self._total, "max_bytes": self.max_bytes}
+
+
+# Instancia global
+output_cache = OutputCache() if OUTPUT_CACHE_ENABLED else None
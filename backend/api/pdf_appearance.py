@@ -0,0 +1,375 @@
+"""
+Generación de apariencias (/AP) para campos AcroForm
+Permite entregar formularios que se ven igual en cualquier visor sin
+depender de /NeedAppearances, y opcionalmente aplanarlos
+"""
+import re
+from pypdf.generic import (
+    ArrayObject,
+    BooleanObject,
+    DecodedStreamObject,
+    DictionaryObject,
+    FloatObject,
+    NameObject,
+    TextStringObject,
+)
+
+# Modos soportados por rellenar_campos
+MODO_NEED_APPEARANCES = 'need_appearances'
+MODO_GENERAR = 'generate'
+MODO_APLANAR = 'flatten'
+MODOS_APARIENCIA = (MODO_NEED_APPEARANCES, MODO_GENERAR, MODO_APLANAR)
+
+DA_POR_DEFECTO = "/Helv 0 Tf 0 g"
+
+# Anchos Helvetica (AFM estándar, 1/1000 em) para ASCII 32-126.
+# Las fuentes base-14 del /DR no traen /Widths, así que se usan estos.
+_ANCHOS_HELVETICA = [
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556,
+    1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556,
+    333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,
+    556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584,
+]
+_ANCHO_DEFECTO = 556
+
+# Caché de métricas: {plantilla: {nombre_fuente: (first_char, anchos, ancho_defecto)}}
+_METRICAS_POR_PLANTILLA = {}
+
+_FLAG_MULTILINEA = 1 << 12
+_FLAG_OCULTO = 1 << 1
+_RE_TF = re.compile(r"/([^\s/]+)\s+([\d.]+)\s+Tf")
+
+
+# ==========================================
+# MÉTRICAS DE FUENTES
+# ==========================================
+
+def _metricas_fuente(plantilla, nombre, fuente):
+    """Obtener (y cachear por plantilla) las métricas de una fuente del /DR"""
+    cache = _METRICAS_POR_PLANTILLA.setdefault(plantilla, {})
+    if nombre in cache:
+        return cache[nombre]
+
+    metricas = (32, _ANCHOS_HELVETICA, _ANCHO_DEFECTO)
+    if fuente is not None:
+        fuente = fuente.get_object()
+        if "/Widths" in fuente and "/FirstChar" in fuente:
+            anchos = [float(w) for w in fuente["/Widths"].get_object()]
+            descriptor = fuente.get("/FontDescriptor")
+            defecto = float(descriptor.get_object().get("/MissingWidth", 0)) if descriptor is not None else 0
+            metricas = (int(fuente["/FirstChar"]), anchos, defecto or _ANCHO_DEFECTO)
+
+    cache[nombre] = metricas
+    return metricas
+
+
+def _ancho_texto(texto, metricas, tamano):
+    """Ancho de un texto en puntos para un tamaño de fuente"""
+    first_char, anchos, defecto = metricas
+    total = 0
+    for ch in texto:
+        idx = ord(ch) - first_char
+        total += anchos[idx] if 0 <= idx < len(anchos) else defecto
+    return total * tamano / 1000.0
+
+
+def precalentar_metricas(writer, plantilla):
+    """Cargar de una vez las métricas de todas las fuentes del /DR de una plantilla"""
+    acroform = writer.root_object.get("/AcroForm")
+    if acroform is None:
+        return
+    fuentes = acroform.get_object().get("/DR", DictionaryObject()).get_object().get("/Font", DictionaryObject())
+    fuentes = fuentes.get_object()
+    for nombre in fuentes:
+        _metricas_fuente(plantilla, nombre[1:], fuentes[nombre])
+
+
+def limpiar_cache_metricas(plantilla=None):
+    """Vaciar la caché de métricas (toda o la de una plantilla)"""
+    if plantilla is None:
+        _METRICAS_POR_PLANTILLA.clear()
+    else:
+        _METRICAS_POR_PLANTILLA.pop(plantilla, None)
+
+
+# ==========================================
+# PLAN DE CAMPOS
+# ==========================================
+
+def _nombre_calificado(annot):
+    """Nombre completo del campo (partes /T unidas con puntos)"""
+    partes = []
+    nodo = annot
+    while nodo is not None:
+        if "/T" in nodo:
+            partes.append(str(nodo["/T"]))
+        nodo = nodo.get("/Parent")
+        nodo = nodo.get_object() if nodo is not None else None
+    return ".".join(reversed(partes))
+
+
+def _heredado(annot, clave, defecto=None):
+    """Leer una clave heredable (/FT, /DA, /Ff, /Q) subiendo por /Parent"""
+    nodo = annot
+    while nodo is not None:
+        if clave in nodo:
+            return nodo[clave]
+        nodo = nodo.get("/Parent")
+        nodo = nodo.get_object() if nodo is not None else None
+    return defecto
+
+
+def construir_plan_campos(writer):
+    """
+    Indexar los widgets del documento por nombre de campo
+    Devuelve {nombre: [(pagina, widget), ...]} recorriendo las anotaciones una vez
+    """
+    plan = {}
+    for pagina in writer.pages:
+        for ref in pagina.get("/Annots", []) or []:
+            annot = ref.get_object()
+            if annot.get("/Subtype") != "/Widget":
+                continue
+            nombre = _nombre_calificado(annot)
+            plan.setdefault(nombre, []).append((pagina, annot))
+            # Permitir también el /T corto del widget o de su padre
+            corto = annot.get("/T") or annot.get("/Parent", DictionaryObject()).get_object().get("/T")
+            if corto is not None and str(corto) != nombre:
+                plan.setdefault(str(corto), []).append((pagina, annot))
+    return plan
+
+
+# ==========================================
+# STREAMS DE APARIENCIA
+# ==========================================
+
+# Puntuación tipográfica sin código en Latin-1 (p. ej. rangos "2nd–40th Floor")
+_EQUIVALENTES_LATIN1 = str.maketrans({"–": "-", "—": "-", "‘": "'", "’": "'", "“": '"', "”": '"', "…": "..."})
+
+
+def escapar_texto_pdf(texto):
+    """Codificar texto para un string literal PDF"""
+    datos = texto.translate(_EQUIVALENTES_LATIN1).encode("latin-1", "replace")
+    return datos.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)")
+
+
+def _recursos_fuente(acroform, nombre):
+    """Diccionario /Resources con la fuente del /DR del AcroForm"""
+    fuentes = acroform.get("/DR", DictionaryObject()).get_object().get("/Font", DictionaryObject())
+    fuentes = fuentes.get_object()
+    fuente = fuentes.get("/" + nombre) if ("/" + nombre) in fuentes else None
+    recursos = DictionaryObject()
+    if fuente is not None:
+        recursos[NameObject("/Font")] = DictionaryObject({NameObject("/" + nombre): fuente})
+    return recursos, fuente
+
+
+def _lineas(texto, metricas, tamano, ancho):
+    """Partir texto en líneas que quepan en el ancho (campos multilínea)"""
+    lineas = []
+    for parrafo in texto.splitlines() or [""]:
+        actual = ""
+        for palabra in parrafo.split(" "):
+            candidata = f"{actual} {palabra}" if actual else palabra
+            if actual and _ancho_texto(candidata, metricas, tamano) > ancho:
+                lineas.append(actual)
+                actual = palabra
+            else:
+                actual = candidata
+        lineas.append(actual)
+    return lineas
+
+
+def _apariencia_texto(writer, annot, valor, acroform, plantilla):
+    """Construir el stream /AP /N de un campo de texto o combo"""
+    rect = [float(x) for x in annot["/Rect"]]
+    ancho, alto = abs(rect[2] - rect[0]), abs(rect[3] - rect[1])
+
+    da = str(_heredado(annot, "/DA", acroform.get("/DA", DA_POR_DEFECTO)))
+    m = _RE_TF.search(da)
+    nombre_fuente, tamano = (m.group(1), float(m.group(2))) if m else ("Helv", 0.0)
+    recursos, fuente = _recursos_fuente(acroform, nombre_fuente)
+    metricas = _metricas_fuente(plantilla, nombre_fuente, fuente)
+
+    multilinea = int(_heredado(annot, "/Ff", 0)) & _FLAG_MULTILINEA
+    alineacion = int(_heredado(annot, "/Q", 0))
+    margen = 2.0
+
+    if tamano == 0:
+        # Auto-size: ajustar a la altura y reducir hasta que quepa el texto
+        tamano = 12.0 if multilinea else max(min((alto - 2 * margen) * 0.8, 12.0), 4.0)
+        if not multilinea:
+            util = ancho - 2 * margen
+            while tamano > 4.0 and _ancho_texto(valor, metricas, tamano) > util:
+                tamano -= 0.5
+
+    lineas = _lineas(valor, metricas, tamano, ancho - 2 * margen) if multilinea else [valor]
+    color = _RE_TF.sub("", da).strip()
+
+    ops = [f"/Tx BMC q {margen / 2:g} {margen / 2:g} {ancho - margen:g} {alto - margen:g} re W n BT"]
+    ops.append(f"/{nombre_fuente} {tamano:g} Tf {color}")
+    interlinea = tamano * 1.15
+    if multilinea:
+        y = alto - margen - tamano
+    else:
+        y = (alto - tamano * 0.78) / 2
+    x_prev, y_prev = 0.0, 0.0
+    for linea in lineas:
+        ancho_linea = _ancho_texto(linea, metricas, tamano)
+        if alineacion == 1:
+            x = (ancho - ancho_linea) / 2
+        elif alineacion == 2:
+            x = ancho - margen - ancho_linea
+        else:
+            x = margen
+        ops.append(f"{x - x_prev:.2f} {y - y_prev:.2f} Td")
+        ops.append("(" + escapar_texto_pdf(linea).decode("latin-1") + ") Tj")
+        x_prev, y_prev = x, y
+        y -= interlinea
+    ops.append("ET Q EMC")
+
+    stream = DecodedStreamObject()
+    stream.set_data("\n".join(ops).encode("latin-1"))
+    stream.update({
+        NameObject("/Type"): NameObject("/XObject"),
+        NameObject("/Subtype"): NameObject("/Form"),
+        NameObject("/BBox"): ArrayObject([FloatObject(0), FloatObject(0), FloatObject(ancho), FloatObject(alto)]),
+        NameObject("/Resources"): recursos,
+    })
+    return writer._add_object(stream)
+
+
+def _estado_on(annot):
+    """Nombre del estado activado de un checkbox (/On, /Yes, ...)"""
+    normal = annot.get("/AP", DictionaryObject()).get_object().get("/N", DictionaryObject())
+    for estado in normal.get_object().keys():
+        if estado != "/Off":
+            return estado
+    return "/On"
+
+
+def _aplicar_checkbox(annot, valor):
+    """Fijar /V y /AS de un checkbox con nombres PDF válidos"""
+    activo = valor not in (None, "", False, "/Off", "Off")
+    estado = NameObject(_estado_on(annot) if activo else "/Off")
+    campo = annot if "/T" in annot else annot.get("/Parent", DictionaryObject()).get_object()
+    campo[NameObject("/V")] = estado
+    annot[NameObject("/AS")] = estado
+
+
+# ==========================================
+# API PÚBLICA
+# ==========================================
+
+def rellenar_campos(writer, campos, plantilla, modo=MODO_GENERAR, plan=None):
+    """
+    Rellenar campos generando sus streams de apariencia
+
+    En MODO_GENERAR deja /NeedAppearances en false; en MODO_APLANAR además
+    convierte los widgets en contenido estático de la página.
+    """
+    acroform = writer.root_object["/AcroForm"].get_object()
+    acroform[NameObject("/NeedAppearances")] = BooleanObject(False)
+    if plan is None:
+        plan = construir_plan_campos(writer)
+
+    for nombre, valor in campos.items():
+        if valor is None:
+            valor = ""
+        for _pagina, annot in plan.get(nombre, []):
+            tipo = _heredado(annot, "/FT")
+            if tipo == "/Btn":
+                _aplicar_checkbox(annot, valor)
+                continue
+            if tipo not in ("/Tx", "/Ch"):
+                continue
+            texto = str(valor)
+            campo = annot if "/T" in annot else annot.get("/Parent", DictionaryObject()).get_object()
+            campo[NameObject("/V")] = TextStringObject(texto)
+            ap = DictionaryObject()
+            ap[NameObject("/N")] = _apariencia_texto(writer, annot, texto, acroform, plantilla)
+            annot[NameObject("/AP")] = ap
+
+    if modo == MODO_APLANAR:
+        aplanar_formulario(writer)
+
+
+def _apariencia_visible(annot):
+    """Stream de apariencia normal que corresponde al estado actual del widget"""
+    ap = annot.get("/AP")
+    if ap is None:
+        return None
+    normal = ap.get_object().get("/N")
+    if normal is None:
+        return None
+    normal_obj = normal.get_object()
+    if isinstance(normal_obj, DictionaryObject) and not hasattr(normal_obj, "get_data"):
+        estado = annot.get("/AS")
+        if estado is None or estado not in normal_obj:
+            return None
+        return normal_obj.raw_get(estado) if hasattr(normal_obj, "raw_get") else normal_obj[estado]
+    return normal
+
+
+def aplanar_formulario(writer):
+    """Dibujar las apariencias de los widgets en la página y eliminar el formulario"""
+    for pagina in writer.pages:
+        annots = pagina.get("/Annots")
+        if not annots:
+            continue
+        restantes = ArrayObject()
+        comandos = []
+        recursos = pagina.get("/Resources", DictionaryObject()).get_object()
+        xobjects = recursos.get("/XObject", DictionaryObject()).get_object()
+
+        for i, ref in enumerate(annots.get_object()):
+            annot = ref.get_object()
+            if annot.get("/Subtype") != "/Widget":
+                restantes.append(ref)
+                continue
+            if int(annot.get("/F", 0)) & _FLAG_OCULTO:
+                continue
+            stream_ref = _apariencia_visible(annot)
+            if stream_ref is None:
+                continue
+            stream = stream_ref.get_object()
+            rect = [float(x) for x in annot["/Rect"]]
+            bbox = [float(x) for x in stream.get("/BBox", [0, 0, rect[2] - rect[0], rect[3] - rect[1]])]
+            bw, bh = (bbox[2] - bbox[0]) or 1, (bbox[3] - bbox[1]) or 1
+            sx = (rect[2] - rect[0]) / bw
+            sy = (rect[3] - rect[1]) / bh
+            nombre = f"/FlatW{i}"
+            xobjects[NameObject(nombre)] = stream_ref
+            comandos.append(
+                f"q {sx:.4f} 0 0 {sy:.4f} {min(rect[0], rect[2]) - bbox[0] * sx:.2f} "
+                f"{min(rect[1], rect[3]) - bbox[1] * sy:.2f} cm {nombre} Do Q"
+            )
+
+        if comandos:
+            recursos[NameObject("/XObject")] = xobjects
+            pagina[NameObject("/Resources")] = recursos
+            # Aislar el contenido original (q ... Q) para que su CTM no afecte a los widgets
+            apertura = DecodedStreamObject()
+            apertura.set_data(b"q\n")
+            contenido = DecodedStreamObject()
+            contenido.set_data(("Q\n" + "\n".join(comandos) + "\n").encode("latin-1"))
+            previo = pagina.get("/Contents")
+            nuevo = ArrayObject([writer._add_object(apertura)])
+            if previo is not None:
+                previo_obj = previo.get_object()
+                if isinstance(previo_obj, ArrayObject):
+                    nuevo.extend(previo_obj)
+                else:
+                    nuevo.append(previo)
+            nuevo.append(writer._add_object(contenido))
+            pagina[NameObject("/Contents")] = nuevo
+
+        if restantes:
+            pagina[NameObject("/Annots")] = restantes
+        else:
+            del pagina["/Annots"]
+
+    if "/AcroForm" in writer.root_object:
+        del writer.root_object["/AcroForm"]
@@ -2,134 +2,316 @@
 Módulo de generación de PDFs FDNY
 Adaptado de main.py para funcionar como API
 """
-import json
 import datetime
-import requests
+import io
+import threading
 import os
+from collections import OrderedDict
 from pypdf import PdfReader, PdfWriter
-from pypdf.generic import NameObject, BooleanObject, NumberObject
+from pypdf.generic import (
+    NameObject, BooleanObject, TextStringObject,
+    DictionaryObject, DecodedStreamObject
+)
+
+from api import pdf_appearance, pdf_incremental
+# Configuración de la empresa: instantánea por request (se recarga sin reiniciar)
+from api.config_provider import config_provider
+# Agregación de dispositivos (las listas maestras viven en device_aggregation)
+from api.device_aggregation import agregar_dispositivos, rangos_pisos, hojas_a433
 
 # Configuración (se carga desde variables de entorno en producción)
 API_KEY_NYC = os.environ.get('NYC_API_KEY', 'd5e07d1f59074591b9e1a70610ed8069')
 APP_TOKEN_SOCRATA = os.environ.get('SOCRATA_TOKEN', 'CKHVd7U76JgGB0kTjH0WCA2G8')
 
-# Cargar configuración desde archivo
-import os
-CONFIG_PATH = os.path.join(os.path.dirname(__file__), '../config.json')
-
-def load_config():
-    if os.path.exists(CONFIG_PATH):
-        with open(CONFIG_PATH, 'r') as f:
-            return json.load(f)
-    return {}
-
-CONFIG = load_config()
-
-COMPANY = CONFIG.get("fire_alarm_company", {})
-ARCHITECT = CONFIG.get("architect_applicant", {})
-ELECTRICIAN = CONFIG.get("electrical_contractor", {})
-TECH_DEFAULTS = CONFIG.get("technical_defaults", {})
-CENTRAL_STATION = CONFIG.get("central_station", {})
-
-fecha_hoy = datetime.date.today().strftime("%m/%d/%Y")
-
-# Listas maestras (copiadas de tu main.py)
-FULL_FLOOR_LIST = [
-    "Sub Cellar", "Cellar", "Basement", "Ground Floor", "1st Floor", "2nd Floor", 
-    "3rd Floor", "4th Floor", "5th Floor", "6th Floor", "7th Floor", "8th Floor",
-    "9th Floor", "10th Floor", "Roof", "Penthouse"
-]
-
-MASTER_DEVICE_LIST = {
-    "Initiating": ["Manual Pull Station", "Smoke Detector", "Heat Detector"],
-    "Supervisory": ["Valve Tamper Switch", "Pump Running"],
-    "Control": ["Fire Door Holder", "HVAC Shut Down"],
-    "Signals": ["Horn", "Strobe", "Horn Strobe"],
-    "Communication": ["Warden Telephone"],
-    "Firepanel": ["Fire Alarm Control"]
+# Opciones de salida: la variable de entorno tiene prioridad sobre config.json
+# - appearance_mode: 'need_appearances' (el visor re-dibuja los campos),
+#   'generate' (streams /AP pre-renderizados) o 'flatten' (contenido estático)
+# - profile: perfil de salida (ver pdf_output.PERFILES_SALIDA)
+# - fill_engine: 'rewrite' (PdfWriter re-serializa todo el documento) o
+#   'incremental' (plantilla intacta + sección de actualización con los campos)
+# - static_overlay: pre-rellenar los datos fijos una sola vez por plantilla
+MOTORES_RELLENO = ('rewrite', 'incremental')
+_OPCIONES_SALIDA = {
+    'appearance_mode': ('PDF_APPEARANCE_MODE', pdf_appearance.MODO_NEED_APPEARANCES),
+    'profile': ('PDF_OUTPUT_PROFILE', 'standard'),
+    'fill_engine': ('PDF_FILL_ENGINE', 'rewrite'),
+    'static_overlay': ('PDF_STATIC_OVERLAY', False),
 }
+_ENTORNO_SALIDA = {clave: os.environ.get(variable) for clave, (variable, _) in _OPCIONES_SALIDA.items()}
+
+def opcion_salida(config, clave):
+    """Valor de una opción de pdf_output para una versión de la configuración"""
+    valor = _ENTORNO_SALIDA[clave]
+    if valor is None:
+        valor = config.pdf_output.get(clave, _OPCIONES_SALIDA[clave][1])
+    if clave == 'static_overlay':
+        return str(valor).lower() in ('1', 'true', 'yes')
+    return valor
+
+class ContextoGeneracion:
+    """
+    Configuración y fecha fijadas al empezar un request
+    Todos los documentos de un filing usan la misma versión y el mismo día,
+    aunque la configuración se recargue o cambie el día a mitad de la generación.
+    """
+    
+    def __init__(self, config=None, fecha=None):
+        self.config = config or config_provider.actual()
+        self.fecha = fecha or datetime.date.today()
+    
+    @property
+    def fecha_formulario(self):
+        return self.fecha.strftime("%m/%d/%Y")
+    
+    @property
+    def appearance_mode(self):
+        return opcion_salida(self.config, 'appearance_mode')
+    
+    @property
+    def output_profile(self):
+        return opcion_salida(self.config, 'profile')
+    
+    @property
+    def fill_engine(self):
+        return opcion_salida(self.config, 'fill_engine')
+    
+    @property
+    def static_overlay(self):
+        return opcion_salida(self.config, 'static_overlay')
+
+# ==========================================
+# GENERADORES DE PDF
+# ==========================================
+
+# {ruta: (mtime, bytes)} - plantillas leídas una vez (compartidas por los workers tras el fork)
+_PLANTILLAS = {}
+
+def _bytes_plantilla(ruta):
+    """Contenido de una plantilla en disco, cacheado en memoria mientras no cambie"""
+    mtime = os.path.getmtime(ruta)
+    cacheada = _PLANTILLAS.get(ruta)
+    if cacheada and cacheada[0] == mtime:
+        return cacheada[1]
+    with open(ruta, "rb") as f:
+        contenido = f.read()
+    _PLANTILLAS[ruta] = (mtime, contenido)
+    return contenido
+
+def _abrir_plantilla(input_pdf):
+    """Clonar la plantilla (ruta o stream) en un PdfWriter nuevo"""
+    if isinstance(input_pdf, str):
+        input_pdf = io.BytesIO(_bytes_plantilla(input_pdf))
+    reader = PdfReader(input_pdf)
+    return PdfWriter(clone_from=reader)
+
+def _rellenar(writer, campos, input_pdf, modo):
+    """Rellenar campos según el modo de apariencia"""
+    if modo not in pdf_appearance.MODOS_APARIENCIA:
+        raise ValueError(f"Invalid appearance mode: {modo}")
+    
+    if modo == pdf_appearance.MODO_NEED_APPEARANCES:
+        writer.root_object["/AcroForm"][NameObject("/NeedAppearances")] = BooleanObject(True)
+        for i in range(len(writer.pages)):
+            writer.update_page_form_field_values(writer.pages[i], campos)
+    else:
+        pdf_appearance.rellenar_campos(writer, campos, input_pdf, modo)
 
 # ==========================================
-# API NYC OPEN DATA
+# OVERLAY ESTÁTICO (DATOS FIJOS DE LA EMPRESA)
 # ==========================================
 
-def obtener_datos_completos(bin_number):
+def _campos_fijos_tm1(config):
+    """Campos del TM-1 que solo dependen de config.json"""
+    arq = config.architect
+    
+    return {
+        "lastName": arq.get("Last Name", ""),
+        "firstName": arq.get("First Name", ""),
+        "businessName": arq.get("Company Name", ""),
+        "licenseNumber": arq.get("License No", ""),
+        "businessTel": arq.get("Phone", ""),
+        "email": arq.get("Email", "")
+    }
+
+def _campos_fijos_a433(config):
+    """Campos del A-433 que solo dependen de config.json"""
+    elec = config.electrician
+    emp = config.company
+    cs = config.central_station
+    
+    return {
+        "New": "/On",
+        # Datos de contratistas
+        "First Name_2": elec.get("First Name"),
+        "Last Name_2": elec.get("Last Name"),
+        "Business Name_2": elec.get("Company Name"),
+        "License Number": elec.get("License No"),
+        "First Name_3": emp.get("First Name"),
+        "Last Name_3": emp.get("Last Name"),
+        "Business Name_3": emp.get("Company Name"),
+        "COF S97": emp.get("COF S97"),
+        "Business Name_4": cs.get("Company Name"),
+        "Station Code": cs.get("CS Code")
+    }
+
+def _campos_fijos_b45(config):
+    """Campos del B-45 que solo dependen de config.json"""
+    emp = config.company
+    
+    return {
+        "name": f"{emp.get('First Name')} {emp.get('Last Name')}",
+        "company": emp.get("Company Name"),
+        "cphone": emp.get("Phone"),
+        "email": emp.get("Email")
+    }
+
+CAMPOS_FIJOS = {
+    'tm1': _campos_fijos_tm1,
+    'a433': _campos_fijos_a433,
+    'b45': _campos_fijos_b45
+}
+
+def campos_compilados(config):
+    """{formulario: campos fijos} de una configuración (global o de un perfil), mapeados una vez"""
+    return config.derivado('campos_fijos', lambda c: {f: mapear(c) for f, mapear in CAMPOS_FIJOS.items()})
+
+# Overlays en memoria (uno por plantilla y versión de configuración / perfil)
+PDF_OVERLAY_CACHE_SIZE = int(os.environ.get('PDF_OVERLAY_CACHE_SIZE', '32'))
+
+# LRU {(input_pdf, versión de config): (versión de la plantilla, bytes)}
+# Los datos fijos salen solo de la configuración: su versión identifica el overlay
+_OVERLAYS = OrderedDict()
+_OVERLAYS_LOCK = threading.Lock()
+
+def _plantilla_prerrellenada(input_pdf, formulario, config):
+    """Bytes de la plantilla con los campos fijos de esta versión ya rellenados (cacheados)"""
+    clave = (input_pdf, config.version)
+    version_plantilla = os.path.getmtime(input_pdf)
+    
+    with _OVERLAYS_LOCK:
+        cacheado = _OVERLAYS.get(clave)
+        if cacheado and cacheado[0] == version_plantilla:
+            _OVERLAYS.move_to_end(clave)
+            return cacheado[1]
+        
+        # Siempre con apariencias generadas: sirve para cualquier modo final
+        writer = _abrir_plantilla(input_pdf)
+        pdf_appearance.rellenar_campos(
+            writer, campos_compilados(config)[formulario], input_pdf, pdf_appearance.MODO_GENERAR
+        )
+        buffer = io.BytesIO()
+        writer.write(buffer)
+        contenido = buffer.getvalue()
+        
+        # Las versiones de configuración que ya no se piden salen por LRU
+        _OVERLAYS[clave] = (version_plantilla, contenido)
+        _OVERLAYS.move_to_end(clave)
+        while len(_OVERLAYS) > PDF_OVERLAY_CACHE_SIZE:
+            _OVERLAYS.popitem(last=False)
+        return contenido
+
+def precalentar_overlays(plantillas, config=None):
     """
-    Obtener datos completos del BIN desde NYC Open Data
+    Construir los overlays de una versión de la configuración (por defecto la vigente)
+    plantillas: {'tm1': ruta, 'a433': ruta, 'b45': ruta}
     """
-    try:
-        # BIS API
-        url_bis = f"https://data.cityofnewyork.us/resource/ipu4-2q9a.json?bin={bin_number}"
-        headers = {"X-App-Token": APP_TOKEN_SOCRATA}
-        response_bis = requests.get(url_bis, headers=headers, timeout=10)
-        
-        if response_bis.status_code != 200 or not response_bis.json():
-            return None
-        
-        data_bis = response_bis.json()[0]
-        
-        # Extraer datos básicos
-        result = {
-            "bin": bin_number,
-            "house": data_bis.get("house", ""),
-            "street": data_bis.get("street_name", ""),
-            "borough": data_bis.get("boro", ""),
-            "zip": data_bis.get("postcode", ""),
-            "construction_class": data_bis.get("cnstrct_yr", ""),
-            "occupancy_group": data_bis.get("occupancy", ""),
-            "owner_first": "",
-            "owner_last": "",
-            "owner_business": data_bis.get("owner_name", ""),
-            "owner_address": data_bis.get("owner_stname", ""),
-            "owner_city": data_bis.get("owner_city", ""),
-            "owner_state": data_bis.get("owner_state", ""),
-            "owner_zip": data_bis.get("owner_zip", ""),
-            "owner_phone": data_bis.get("owner_phone", ""),
-            "owner_email": ""
-        }
-        
-        return result
-        
-    except Exception as e:
-        print(f"Error obteniendo datos BIN: {e}")
-        return None
+    config = config or config_provider.actual()
+    for formulario, ruta in plantillas.items():
+        if formulario not in CAMPOS_FIJOS or not os.path.exists(ruta):
+            continue
+        _plantilla_prerrellenada(ruta, formulario, config)
+
+def precargar_plantillas(plantillas):
+    """
+    Cargar en memoria todo lo que se puede preparar antes de servir requests:
+    bytes de las plantillas, métricas de sus fuentes y overlays de datos fijos
+    plantillas: {'tm1': ruta, 'a433': ruta, 'b45': ruta}
+    """
+    for formulario, ruta in plantillas.items():
+        if not os.path.exists(ruta):
+            print(f"   ⚠️ Template not found: {ruta}")
+            continue
+        pdf_appearance.precalentar_metricas(_abrir_plantilla(ruta), ruta)
+    
+    contexto = ContextoGeneracion()
+    if contexto.static_overlay:
+        precalentar_overlays(plantillas, contexto.config)
+
+def _anadir_continuacion(writer, plantilla, pagina, prefijo):
+    """
+    Añadir una copia de una página de la plantilla como hoja de continuación
+    Los campos de la copia se prefijan para no chocar con los originales.
+    """
+    reader = PdfReader(io.BytesIO(plantilla))
+    for ref in reader.pages[pagina].get("/Annots", []) or []:
+        campo = ref.get_object()
+        while "/Parent" in campo:
+            campo = campo["/Parent"].get_object()
+        if "/T" in campo and not str(campo["/T"]).startswith(prefijo + "_"):
+            campo[NameObject("/T")] = TextStringObject(f"{prefijo}_{campo['/T']}")
+    
+    nueva = writer.add_page(reader.pages[pagina])
+    campos = writer.root_object["/AcroForm"].get_object()[NameObject("/Fields")]
+    registrados = set()
+    for ref in nueva.get("/Annots", []) or []:
+        campo = ref.get_object()
+        while "/Parent" in campo:
+            ref = campo.raw_get("/Parent")
+            campo = ref.get_object()
+        if "/T" in campo and ref.idnum not in registrados:
+            registrados.add(ref.idnum)
+            campos.append(ref)
+
+def _preparar_formulario(formulario, input_pdf, campos, contexto, modo_apariencia=None, continuaciones=()):
+    """
+    Abrir la plantilla y rellenar los campos del formulario
+    Con static_overlay solo se rellenan los campos variables por request
+    continuaciones: [(página_plantilla, prefijo)] copias añadidas antes de rellenar
+    """
+    campos_fijos = {}
+    modo = modo_apariencia or contexto.appearance_mode
+    if contexto.static_overlay:
+        base = _plantilla_prerrellenada(input_pdf, formulario, contexto.config)
+    else:
+        base = None
+        campos_fijos = campos_compilados(contexto.config)[formulario]
+    
+    # Incremental: no aplica si cambian las páginas (continuaciones, aplanado)
+    if contexto.fill_engine == 'incremental' and not continuaciones and modo != pdf_appearance.MODO_APLANAR:
+        base = base or _bytes_plantilla(input_pdf)
+        return pdf_incremental.rellenar(base, {**campos, **campos_fijos}, input_pdf, modo)
+    
+    writer = _abrir_plantilla(io.BytesIO(base) if base else input_pdf)
+    
+    if continuaciones:
+        plantilla = _bytes_plantilla(input_pdf)
+        for pagina, prefijo in continuaciones:
+            _anadir_continuacion(writer, plantilla, pagina, prefijo)
+    
+    # Un solo relleno para todas las páginas (el plan de campos se construye una vez)
+    _rellenar(writer, {**campos, **campos_fijos}, input_pdf, modo)
+    
+    return writer
 
 # ==========================================
-# GENERADORES DE PDF
+# GENERADORES
 # ==========================================
 
-def generar_tm1(datos, input_pdf, output_pdf):
+def generar_tm1(datos, input_pdf, output_pdf, modo_apariencia=None, contexto=None):
     """Generar formulario TM-1"""
     print("📄 Generating TM-1...")
     try:
-        reader = PdfReader(input_pdf)
-        writer = PdfWriter()
-        
-        for page in reader.pages:
-            writer.add_page(page)
-        
-        if "/AcroForm" in reader.root_object:
-            writer.root_object[NameObject("/AcroForm")] = reader.root_object["/AcroForm"]
-        
-        writer.root_object["/AcroForm"][NameObject("/NeedAppearances")] = BooleanObject(True)
-        
         # Campos del formulario
         campos = {
             "buildingNo": datos.get("house", ""),
             "streetName": datos.get("street", ""),
             "borough": datos.get("borough", ""),
             "zip": datos.get("zip", ""),
-            "bin": datos.get("bin", ""),
-            "lastName": ARCHITECT.get("Last Name", ""),
-            "firstName": ARCHITECT.get("First Name", ""),
-            "businessName": ARCHITECT.get("Company Name", ""),
-            "licenseNumber": ARCHITECT.get("License No", ""),
-            "businessTel": ARCHITECT.get("Phone", ""),
-            "email": ARCHITECT.get("Email", "")
+            "bin": datos.get("bin", "")
         }
         
-        for i in range(len(writer.pages)):
-            writer.update_page_form_field_values(writer.pages[i], campos)
+        writer = _preparar_formulario('tm1', input_pdf, campos, contexto or ContextoGeneracion(),
+                                      modo_apariencia)
         
         with open(output_pdf, "wb") as f:
             writer.write(f)
@@ -141,98 +323,56 @@ def generar_tm1(datos, input_pdf, output_pdf):
         print(f"   ❌ TM-1 Error: {e}")
         return False
 
-def generar_a433(datos, input_pdf, output_pdf):
+def generar_a433(datos, input_pdf, output_pdf, modo_apariencia=None, contexto=None):
     """Generar formulario A-433"""
     print("📄 Generating A-433...")
     try:
-        reader = PdfReader(input_pdf)
-        writer = PdfWriter()
-        
-        for page in reader.pages:
-            writer.add_page(page)
-        
-        if "/AcroForm" in reader.root_object:
-            writer.root_object[NameObject("/AcroForm")] = reader.root_object["/AcroForm"]
-        
-        writer.root_object["/AcroForm"][NameObject("/NeedAppearances")] = BooleanObject(True)
-        
-        datos_instalacion = datos.get("devices", [])
-        pisos_trabajados = sorted(list(set(d['floor'] for d in datos_instalacion)))
+        agregado = agregar_dispositivos(datos.get("devices", []))
+        hojas = hojas_a433(agregado)
         
         campos = {
             "Building No": datos.get("house", ""),
             "Street Name": datos.get("street", ""),
             "Borough": datos.get("borough", ""),
             "ZIP": datos.get("zip", ""),
-            "Work on floor(s)": ", ".join(pisos_trabajados),
-            "New": "/On"
+            "Work On Floors": rangos_pisos(agregado["floors"]),
+            "Page_1": "1",
+            "Page_2": str(1 + len(hojas)),
+            **hojas[0]
         }
         
-        # Datos de contratistas
-        elec = ELECTRICIAN
-        emp = COMPANY
-        cs = CENTRAL_STATION
-        
-        campos.update({
-            "First Name_2": elec.get("First Name"),
-            "Last Name_2": elec.get("Last Name"),
-            "Business Name_2": elec.get("Company Name"),
-            "License Number": elec.get("License No")
-        })
-        
-        campos.update({
-            "First Name_3": emp.get("First Name"),
-            "Last Name_3": emp.get("Last Name"),
-            "Business Name_3": emp.get("Company Name"),
-            "COF S97": emp.get("COF S97")
-        })
+        # Instalaciones grandes: copias de la tabla de dispositivos (página 2)
+        # con el resto de pisos/tipos
+        continuaciones = []
+        for numero, hoja in enumerate(hojas[1:], start=2):
+            prefijo = f"CONT{numero}"
+            continuaciones.append((1, prefijo))
+            campos.update({f"{prefijo}_{campo}": valor for campo, valor in hoja.items()})
         
-        campos.update({
-            "Business Name_4": cs.get("Company Name"),
-            "Station Code": cs.get("CS Code")
-        })
-        
-        for i in range(len(writer.pages)):
-            writer.update_page_form_field_values(writer.pages[i], campos)
+        writer = _preparar_formulario('a433', input_pdf, campos, contexto or ContextoGeneracion(),
+                                      modo_apariencia, continuaciones)
         
         with open(output_pdf, "wb") as f:
             writer.write(f)
         
-        print("   ✅ A-433 Generated")
+        print(f"   ✅ A-433 Generated ({agregado['total']} devices, {len(hojas)} sheet(s))")
         return True
         
     except Exception as e:
         print(f"   ❌ A-433 Error: {e}")
         return False
 
-def generar_b45(datos, input_pdf, output_pdf):
+def generar_b45(datos, input_pdf, output_pdf, modo_apariencia=None, contexto=None):
     """Generar formulario B-45"""
     print("📄 Generating B-45...")
     try:
-        reader = PdfReader(input_pdf)
-        writer = PdfWriter()
-        
-        for page in reader.pages:
-            writer.add_page(page)
-        
-        if "/AcroForm" in reader.root_object:
-            writer.root_object[NameObject("/AcroForm")] = reader.root_object["/AcroForm"]
-        
-        writer.root_object["/AcroForm"][NameObject("/NeedAppearances")] = BooleanObject(True)
-        
-        emp = COMPANY
-        
+        contexto = contexto or ContextoGeneracion()
         campos = {
             "adress": f"{datos['house']} {datos['street']}, {datos['borough']}, NY {datos['zip']}",
-            "name": f"{emp.get('First Name')} {emp.get('Last Name')}",
-            "company": emp.get("Company Name"),
-            "cphone": emp.get("Phone"),
-            "email": emp.get("Email"),
-            "date1": fecha_hoy
+            "date1": contexto.fecha_formulario
         }
         
-        for i in range(len(writer.pages)):
-            writer.update_page_form_field_values(writer.pages[i], campos)
+        writer = _preparar_formulario('b45', input_pdf, campos, contexto, modo_apariencia)
         
         with open(output_pdf, "wb") as f:
             writer.write(f)
@@ -244,17 +384,29 @@ def generar_b45(datos, input_pdf, output_pdf):
         print(f"   ❌ B-45 Error: {e}")
         return False
 
-def generar_reporte_auditoria(datos, output_file):
+def _lineas_reporte(datos, contexto):
+    """Líneas del reporte de auditoría (texto plano y página PDF)"""
+    agregado = agregar_dispositivos(datos.get("devices", []))
+    lineas = [
+        "AUTOMATED GENERATION REPORT - FDNY SYSTEM",
+        "=" * 60,
+        f"DATE: {contexto.fecha_formulario}",
+        f"BIN: {datos.get('bin')}",
+        f"ADDRESS: {datos.get('house')} {datos.get('street')}",
+    ]
+    if agregado["total"]:
+        lineas += ["", f"WORK ON FLOORS: {rangos_pisos(agregado['floors'])}",
+                   f"DEVICES: {agregado['total']}"]
+        lineas += [f"  {categoria}: {total}" for categoria, total in agregado["category_totals"].items()]
+    return lineas + ["", "Generated via Web Application"]
+
+def generar_reporte_auditoria(datos, output_file, contexto=None):
     """Generar reporte de auditoría"""
     print("📄 Generating Audit Report...")
     try:
         with open(output_file, "w", encoding="utf-8") as f:
-            f.write("AUTOMATED GENERATION REPORT - FDNY SYSTEM\n")
-            f.write("=" * 60 + "\n")
-            f.write(f"DATE: {fecha_hoy}\n")
-            f.write(f"BIN: {datos.get('bin')}\n")
-            f.write(f"ADDRESS: {datos.get('house')} {datos.get('street')}\n\n")
-            f.write("Generated via Web Application\n")
+            for linea in _lineas_reporte(datos, contexto or ContextoGeneracion()):
+                f.write(linea + "\n")
         
         print("   ✅ Report Generated")
         return True
@@ -262,3 +414,89 @@ def generar_reporte_auditoria(datos, output_file):
     except Exception as e:
         print(f"   ❌ Report Error: {e}")
         return False
+
+# ==========================================
+# PAQUETE COMBINADO
+# ==========================================
+
+def _renombrar_campos(reader, prefijo):
+    """Prefijar los campos raíz del AcroForm para que no choquen al combinar"""
+    if "/AcroForm" not in reader.root_object:
+        return
+    for ref in reader.root_object["/AcroForm"].get("/Fields", []):
+        campo = ref.get_object()
+        if "/T" in campo:
+            campo[NameObject("/T")] = TextStringObject(f"{prefijo}_{campo['/T']}")
+
+def _pagina_reporte(writer, datos, fuente, contexto):
+    """Añadir el reporte de auditoría como página PDF (Letter)"""
+    pagina = writer.add_blank_page(612, 792)
+    
+    lineas = []
+    for linea in _lineas_reporte(datos, contexto) + ["", "DOCUMENTS INCLUDED:"] + [
+        f"  - {titulo}" for titulo in datos.get("_documentos", [])
+    ]:
+        lineas.append(b"(" + pdf_appearance.escapar_texto_pdf(linea) + b") Tj T*")
+    
+    contenido = DecodedStreamObject()
+    contenido.set_data(b"BT /F1 11 Tf 14 TL 54 738 Td\n" + b"\n".join(lineas) + b"\nET\n")
+    pagina[NameObject("/Contents")] = writer._add_object(contenido)
+    pagina[NameObject("/Resources")] = DictionaryObject({
+        NameObject("/Font"): DictionaryObject({NameObject("/F1"): fuente})
+    })
+    return pagina
+
+def generar_paquete(documentos, datos, output_pdf, contexto=None):
+    """
+    Combinar los formularios rellenados y el reporte en un solo PDF
+    documentos: [(prefijo, titulo, ruta_pdf), ...] en el orden del paquete
+    """
+    print("📄 Generating Filing Packet...")
+    try:
+        writer = PdfWriter()
+        need_appearances = False
+        
+        for prefijo, titulo, ruta in documentos:
+            reader = PdfReader(ruta)
+            _renombrar_campos(reader, prefijo)
+            acroform = reader.root_object.get("/AcroForm")
+            acroform = acroform.get_object() if acroform is not None else None
+            if acroform is not None and acroform.get("/NeedAppearances"):
+                need_appearances = True
+            writer.append(reader, outline_item=titulo)
+            
+            # Fuentes del /DR que falten en el AcroForm combinado
+            if acroform is not None and "/AcroForm" in writer.root_object and "/DR" in acroform:
+                dr = writer.root_object["/AcroForm"].get_object().setdefault(
+                    NameObject("/DR"), DictionaryObject()
+                ).get_object()
+                fuentes = dr.setdefault(NameObject("/Font"), DictionaryObject()).get_object()
+                for nombre, fuente in acroform["/DR"].get_object().get("/Font", {}).items():
+                    if nombre not in fuentes:
+                        fuentes[NameObject(nombre)] = fuente.clone(writer)
+        
+        if "/AcroForm" in writer.root_object:
+            writer.root_object["/AcroForm"][NameObject("/NeedAppearances")] = BooleanObject(need_appearances)
+        
+        # Una única fuente Helvetica para la página del reporte
+        helvetica = writer._add_object(DictionaryObject({
+            NameObject("/Type"): NameObject("/Font"),
+            NameObject("/Subtype"): NameObject("/Type1"),
+            NameObject("/BaseFont"): NameObject("/Helvetica"),
+            NameObject("/Encoding"): NameObject("/WinAnsiEncoding")
+        }))
+        reporte = _pagina_reporte(
+            writer, {**datos, "_documentos": [titulo for _, titulo, _ in documentos]}, helvetica,
+            contexto or ContextoGeneracion()
+        )
+        writer.add_outline_item("Audit Report", reporte)
+        
+        with open(output_pdf, "wb") as f:
+            writer.write(f)
+        
+        print("   ✅ Filing Packet Generated")
+        return True
+        
+    except Exception as e:
+        print(f"   ❌ Packet Error: {e}")
+        return False
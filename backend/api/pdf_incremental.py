@@ -0,0 +1,201 @@
+"""
+Relleno de formularios por actualización incremental
+Los bytes de la plantilla se copian tal cual y se añade al final una sección de
+actualización (PDF 7.5.6) con solo los objetos modificados, una xref nueva y /Prev
+apuntando a la original: el coste depende de los campos rellenados, no de la plantilla.
+"""
+import hashlib
+import io
+import re
+import zlib
+
+from pypdf import PdfReader
+from pypdf.generic import (
+    ArrayObject,
+    BooleanObject,
+    ByteStringObject,
+    DictionaryObject,
+    IndirectObject,
+    NameObject,
+    NumberObject,
+)
+
+from api import pdf_appearance
+
+_RE_STARTXREF = re.compile(rb"startxref\s+(\d+)")
+
+
+class EscritorIncremental:
+    """
+    Vista mínima de "writer" sobre una plantilla ya serializada
+    Expone lo que usa pdf_appearance (root_object, pages, _add_object, get_object)
+    y escribe solo los objetos marcados y los nuevos.
+    """
+
+    def __init__(self, contenido):
+        self.original = contenido
+        self.reader = PdfReader(io.BytesIO(contenido))
+        if self.reader.is_encrypted:
+            raise ValueError("Incremental fill does not support encrypted templates")
+
+        self._siguiente = int(self.reader.trailer["/Size"])
+        self._nuevos = {}      # idnum -> objeto nuevo
+        self._marcados = {}    # (idnum, gen) -> objeto modificado
+
+        coincidencias = _RE_STARTXREF.findall(contenido[-2048:]) or _RE_STARTXREF.findall(contenido)
+        self._prev = int(coincidencias[-1])
+        self._xref_stream = not contenido[self._prev:self._prev + 4].startswith(b"xref")
+
+    @property
+    def root_object(self):
+        return self.reader.trailer["/Root"].get_object()
+
+    @property
+    def pages(self):
+        return self.reader.pages
+
+    def get_object(self, ref):
+        idnum = ref.idnum if isinstance(ref, IndirectObject) else ref
+        if idnum in self._nuevos:
+            return self._nuevos[idnum]
+        return self.reader.get_object(ref)
+
+    def _add_object(self, obj):
+        """Registrar un objeto nuevo (streams de apariencia) con el siguiente número libre"""
+        idnum = self._siguiente
+        self._siguiente += 1
+        self._nuevos[idnum] = obj
+        return IndirectObject(idnum, 0, self)
+
+    def marcar(self, obj, contenedor=None):
+        """
+        Incluir un objeto modificado en la actualización
+        Si es directo, se marca el objeto indirecto que lo contiene (contenedor).
+        """
+        ref = getattr(obj, "indirect_reference", None)
+        if ref is None or ref.pdf is not self.reader:
+            if contenedor is None:
+                raise ValueError("Modified direct object without an indirect container")
+            obj, ref = contenedor, contenedor.indirect_reference
+        self._marcados[(ref.idnum, ref.generation)] = obj
+
+    # ==========================================
+    # SERIALIZACIÓN
+    # ==========================================
+
+    def write(self, stream):
+        """Escribir plantilla original + sección de actualización"""
+        stream.write(self.original)
+        base = len(self.original)
+        if not self.original.endswith((b"\n", b"\r")):
+            stream.write(b"\n")
+            base += 1
+        seccion = io.BytesIO()
+
+        desplazamientos = {}
+        objetos = [(ref, obj) for ref, obj in self._marcados.items()]
+        objetos += [((idnum, 0), obj) for idnum, obj in self._nuevos.items()]
+        for (idnum, gen), obj in sorted(objetos, key=lambda item: item[0]):
+            desplazamientos[idnum] = (base + seccion.tell(), gen)
+            seccion.write(f"{idnum} {gen} obj\n".encode())
+            obj.write_to_stream(seccion)
+            seccion.write(b"\nendobj\n")
+
+        trailer = DictionaryObject()
+        for clave in ("/Root", "/Info"):
+            if clave in self.reader.trailer:
+                trailer[NameObject(clave)] = self.reader.trailer.raw_get(clave)
+        if "/ID" in self.reader.trailer:
+            # Primer ID permanente; el segundo identifica esta revisión
+            ids = self.reader.trailer["/ID"]
+            revision = hashlib.md5(seccion.getvalue()).digest()
+            trailer[NameObject("/ID")] = ArrayObject([ids[0], ByteStringObject(revision)])
+        trailer[NameObject("/Prev")] = NumberObject(self._prev)
+
+        if self._xref_stream:
+            self._escribir_xref_stream(seccion, base, desplazamientos, trailer)
+        else:
+            self._escribir_xref_tabla(seccion, base, desplazamientos, trailer)
+        stream.write(seccion.getvalue())
+
+    @staticmethod
+    def _subsecciones(numeros):
+        """[3, 4, 5, 9] -> [(3, 3), (9, 1)]"""
+        tramos = []
+        for n in sorted(numeros):
+            if tramos and n == tramos[-1][0] + tramos[-1][1]:
+                tramos[-1][1] += 1
+            else:
+                tramos.append([n, 1])
+        return [tuple(t) for t in tramos]
+
+    def _escribir_xref_tabla(self, seccion, base, desplazamientos, trailer):
+        inicio_xref = base + seccion.tell()
+        seccion.write(b"xref\n")
+        for primero, cantidad in self._subsecciones(desplazamientos):
+            seccion.write(f"{primero} {cantidad}\n".encode())
+            for idnum in range(primero, primero + cantidad):
+                offset, gen = desplazamientos[idnum]
+                seccion.write(f"{offset:010d} {gen:05d} n\r\n".encode())
+        trailer[NameObject("/Size")] = NumberObject(self._siguiente)
+        seccion.write(b"trailer\n")
+        trailer.write_to_stream(seccion)
+        seccion.write(f"\nstartxref\n{inicio_xref}\n%%EOF\n".encode())
+
+    def _escribir_xref_stream(self, seccion, base, desplazamientos, trailer):
+        # El propio stream de xref ocupa el siguiente número libre
+        idnum_xref = self._siguiente
+        inicio_xref = base + seccion.tell()
+        desplazamientos = {**desplazamientos, idnum_xref: (inicio_xref, 0)}
+
+        ancho = max(4, (inicio_xref.bit_length() + 7) // 8)
+        filas = bytearray()
+        indice = ArrayObject()
+        for primero, cantidad in self._subsecciones(desplazamientos):
+            indice.extend([NumberObject(primero), NumberObject(cantidad)])
+            for idnum in range(primero, primero + cantidad):
+                offset, gen = desplazamientos[idnum]
+                filas += b"\x01" + offset.to_bytes(ancho, "big") + gen.to_bytes(2, "big")
+        datos = zlib.compress(bytes(filas))
+
+        trailer.update({
+            NameObject("/Type"): NameObject("/XRef"),
+            NameObject("/Size"): NumberObject(idnum_xref + 1),
+            NameObject("/Index"): indice,
+            NameObject("/W"): ArrayObject([NumberObject(1), NumberObject(ancho), NumberObject(2)]),
+            NameObject("/Filter"): NameObject("/FlateDecode"),
+            NameObject("/Length"): NumberObject(len(datos)),
+        })
+        seccion.write(f"{idnum_xref} 0 obj\n".encode())
+        trailer.write_to_stream(seccion)
+        seccion.write(b"\nstream\n" + datos + b"\nendstream\nendobj\n")
+        seccion.write(f"startxref\n{inicio_xref}\n%%EOF\n".encode())
+
+
+def rellenar(contenido, campos, plantilla, modo):
+    """
+    Rellenar una plantilla (bytes) por actualización incremental
+    modo: MODO_NEED_APPEARANCES o MODO_GENERAR (aplanar reescribe las páginas: no aplica)
+    Devuelve el EscritorIncremental listo para write().
+    """
+    if modo not in (pdf_appearance.MODO_NEED_APPEARANCES, pdf_appearance.MODO_GENERAR):
+        raise ValueError(f"Incremental fill does not support mode: {modo}")
+
+    escritor = EscritorIncremental(contenido)
+    plan = pdf_appearance.construir_plan_campos(escritor)
+    pdf_appearance.rellenar_campos(escritor, campos, plantilla, pdf_appearance.MODO_GENERAR, plan=plan)
+
+    # Los visores que re-dibujan usan /V; las apariencias generadas quedan como respaldo
+    raiz = escritor.root_object
+    acroform = raiz["/AcroForm"].get_object()
+    if modo == pdf_appearance.MODO_NEED_APPEARANCES:
+        acroform[NameObject("/NeedAppearances")] = BooleanObject(True)
+    escritor.marcar(acroform, contenedor=raiz)
+
+    for nombre in campos:
+        for pagina, annot in plan.get(nombre, []):
+            escritor.marcar(annot, contenedor=pagina)
+            padre = annot.get("/Parent")
+            if "/T" not in annot and padre is not None:
+                escritor.marcar(padre.get_object(), contenedor=pagina)
+    return escritor
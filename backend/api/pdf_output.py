@@ -0,0 +1,264 @@
+"""
+Optimización del PDF de salida
+Compresión de streams, deduplicación de recursos y empaquetado en object streams
+"""
+import hashlib
+import io
+import zlib
+from pypdf import PdfReader
+from pypdf.generic import (
+    ArrayObject,
+    DictionaryObject,
+    IndirectObject,
+    NameObject,
+    NumberObject,
+    StreamObject,
+)
+
+# Perfiles de salida configurables
+PERFILES_SALIDA = {
+    # Bytes tal cual los escribe PdfWriter
+    'none': {'comprimir': False, 'deduplicar': False, 'object_streams': False},
+    # Compresión + recursos compartidos (compatible con cualquier visor)
+    'standard': {'comprimir': True, 'deduplicar': True, 'object_streams': False},
+    # Además empaqueta los objetos en object streams (PDF 1.5+)
+    'compact': {'comprimir': True, 'deduplicar': True, 'object_streams': True},
+}
+
+# Solo se deduplican recursos que pueden compartirse entre páginas sin efectos
+_TIPOS_COMPARTIBLES = ("/Font", "/FontDescriptor", "/Encoding", "/XObject", "/ExtGState")
+_OBJETOS_POR_STREAM = 100
+
+
+def _cargar_objetos(reader):
+    """Leer todos los objetos indirectos del documento: {(idnum, gen): objeto}"""
+    refs = set()
+    for gen, entradas in reader.xref.items():
+        for idnum in entradas:
+            refs.add((idnum, gen))
+    for idnum in reader.xref_objStm:
+        refs.add((idnum, 0))
+
+    objetos = {}
+    for idnum, gen in sorted(refs):
+        if idnum == 0:
+            continue
+        obj = reader.get_object(IndirectObject(idnum, gen, reader))
+        if obj is None:
+            continue
+        if isinstance(obj, DictionaryObject) and obj.get("/Type") in ("/ObjStm", "/XRef"):
+            continue
+        objetos[(idnum, gen)] = obj
+    return objetos
+
+
+def _remapear(obj, remap, reader):
+    """Reemplazar referencias duplicadas por la canónica (recursivo, in place)"""
+    if isinstance(obj, IndirectObject):
+        destino = remap.get((obj.idnum, obj.generation))
+        if destino is not None:
+            return IndirectObject(destino[0], destino[1], reader)
+        return obj
+    if isinstance(obj, DictionaryObject):
+        for k, v in list(obj.items()):
+            nuevo = _remapear(v, remap, reader)
+            if nuevo is not v:
+                obj[k] = nuevo
+    elif isinstance(obj, ArrayObject):
+        for i, v in enumerate(obj):
+            nuevo = _remapear(v, remap, reader)
+            if nuevo is not v:
+                obj[i] = nuevo
+    return obj
+
+
+def _serializar(obj):
+    """Bytes de un objeto (sin cabecera obj/endobj)"""
+    buffer = io.BytesIO()
+    obj.write_to_stream(buffer)
+    return buffer.getvalue()
+
+
+def _es_compartible(obj):
+    if isinstance(obj, StreamObject):
+        return True
+    return isinstance(obj, DictionaryObject) and obj.get("/Type") in _TIPOS_COMPARTIBLES
+
+
+def _deduplicar(objetos, reader):
+    """Fusionar objetos idénticos hasta que no queden duplicados"""
+    eliminados = 0
+    while True:
+        vistos = {}
+        remap = {}
+        for ref in sorted(objetos):
+            obj = objetos[ref]
+            if not _es_compartible(obj):
+                continue
+            huella = hashlib.sha256(_serializar(obj)).digest()
+            if huella in vistos:
+                remap[ref] = vistos[huella]
+            else:
+                vistos[huella] = ref
+        if not remap:
+            return eliminados
+        for ref in remap:
+            del objetos[ref]
+        for obj in objetos.values():
+            _remapear(obj, remap, reader)
+        _remapear(reader.trailer, remap, reader)
+        eliminados += len(remap)
+
+
+def _alcanzables(objetos, trailer):
+    """Referencias alcanzables desde /Root e /Info"""
+    vistos = set()
+    pendientes = [trailer.raw_get(k) for k in ("/Root", "/Info") if k in trailer]
+    while pendientes:
+        actual = pendientes.pop()
+        if isinstance(actual, IndirectObject):
+            ref = (actual.idnum, actual.generation)
+            if ref in vistos or ref not in objetos:
+                continue
+            vistos.add(ref)
+            actual = objetos[ref]
+        if isinstance(actual, DictionaryObject):
+            pendientes.extend(actual.raw_get(k) for k in actual)
+        elif isinstance(actual, ArrayObject):
+            pendientes.extend(actual)
+    return vistos
+
+
+def _entrada_trailer(trailer):
+    """Claves del trailer original que se conservan (/Root, /Info, /ID)"""
+    salida = DictionaryObject()
+    for clave in ("/Root", "/Info", "/ID"):
+        if clave in trailer:
+            salida[NameObject(clave)] = trailer.raw_get(clave)
+    return salida
+
+
+def _escribir(objetos, trailer, object_streams):
+    """Serializar el documento con xref clásica o xref stream"""
+    salida = io.BytesIO()
+    salida.write(b"%PDF-1.5\n%\xe2\xe3\xcf\xd3\n" if object_streams else b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    # entradas xref: {idnum: (tipo, campo2, campo3)}
+    xref = {}
+    empaquetables = []
+    for (idnum, gen), obj in sorted(objetos.items()):
+        if object_streams and gen == 0 and not isinstance(obj, StreamObject):
+            empaquetables.append((idnum, obj))
+            continue
+        xref[idnum] = (1, salida.tell(), gen)
+        salida.write(f"{idnum} {gen} obj\n".encode())
+        salida.write(_serializar(obj))
+        salida.write(b"\nendobj\n")
+
+    siguiente = max([idnum for idnum, _ in objetos] + [0]) + 1
+
+    for inicio in range(0, len(empaquetables), _OBJETOS_POR_STREAM):
+        grupo = empaquetables[inicio:inicio + _OBJETOS_POR_STREAM]
+        num_stream = siguiente
+        siguiente += 1
+        cabecera, cuerpo = [], io.BytesIO()
+        for indice, (idnum, obj) in enumerate(grupo):
+            cabecera.append(f"{idnum} {cuerpo.tell()}")
+            cuerpo.write(_serializar(obj))
+            cuerpo.write(b"\n")
+            xref[idnum] = (2, num_stream, indice)
+        cabecera = (" ".join(cabecera) + "\n").encode()
+        datos = zlib.compress(cabecera + cuerpo.getvalue())
+        xref[num_stream] = (1, salida.tell(), 0)
+        salida.write(
+            f"{num_stream} 0 obj\n<< /Type /ObjStm /N {len(grupo)} /First {len(cabecera)} "
+            f"/Filter /FlateDecode /Length {len(datos)} >>\nstream\n".encode()
+        )
+        salida.write(datos)
+        salida.write(b"\nendstream\nendobj\n")
+
+    trailer_dict = _entrada_trailer(trailer)
+    if object_streams:
+        num_xref = siguiente
+        inicio_xref = salida.tell()
+        xref[num_xref] = (1, inicio_xref, 0)
+        filas = io.BytesIO()
+        for idnum in range(num_xref + 1):
+            tipo, c2, c3 = xref.get(idnum, (0, 0, 65535 if idnum == 0 else 0))
+            filas.write(bytes([tipo]) + c2.to_bytes(4, "big") + c3.to_bytes(2, "big"))
+        datos = zlib.compress(filas.getvalue())
+        extras = _serializar(trailer_dict)[2:-2].decode("latin-1").strip()
+        salida.write(
+            f"{num_xref} 0 obj\n<< /Type /XRef /Size {num_xref + 1} /W [ 1 4 2 ] "
+            f"/Filter /FlateDecode /Length {len(datos)} {extras} >>\nstream\n".encode("latin-1")
+        )
+        salida.write(datos)
+        salida.write(b"\nendstream\nendobj\n")
+    else:
+        inicio_xref = salida.tell()
+        tamano = max(xref) + 1 if xref else 1
+        salida.write(f"xref\n0 {tamano}\n".encode())
+        salida.write(b"0000000000 65535 f \n")
+        for idnum in range(1, tamano):
+            if idnum in xref:
+                _, offset, gen = xref[idnum]
+                salida.write(f"{offset:010d} {gen:05d} n \n".encode())
+            else:
+                salida.write(b"0000000000 00000 f \n")
+        trailer_dict[NameObject("/Size")] = NumberObject(tamano)
+        salida.write(b"trailer\n")
+        salida.write(_serializar(trailer_dict))
+        salida.write(b"\n")
+
+    salida.write(f"startxref\n{inicio_xref}\n%%EOF\n".encode())
+    return salida.getvalue()
+
+
+def optimizar_pdf(datos, perfil='standard'):
+    """
+    Aplicar un perfil de salida a un PDF ya generado
+
+    Devuelve (bytes, informe) donde el informe incluye tamaños antes/después.
+    """
+    if perfil not in PERFILES_SALIDA:
+        raise ValueError(f"Invalid output profile: {perfil}")
+
+    opciones = PERFILES_SALIDA[perfil]
+    informe = {
+        'profile': perfil,
+        'size_before': len(datos),
+        'size_after': len(datos),
+        'duplicates_removed': 0,
+    }
+    if not any(opciones.values()):
+        return datos, informe
+
+    reader = PdfReader(io.BytesIO(datos))
+    objetos = _cargar_objetos(reader)
+    informe['objects_before'] = len(objetos)
+
+    if opciones['comprimir']:
+        for ref, obj in objetos.items():
+            if isinstance(obj, StreamObject) and "/Filter" not in obj:
+                objetos[ref] = obj.flate_encode(level=9)
+
+    # /Length directo para no arrastrar objetos de longitud huérfanos
+    for obj in objetos.values():
+        if isinstance(obj, StreamObject):
+            obj[NameObject("/Length")] = NumberObject(len(obj._data))
+
+    if opciones['deduplicar']:
+        informe['duplicates_removed'] = _deduplicar(objetos, reader)
+
+    vivos = _alcanzables(objetos, reader.trailer)
+    objetos = {ref: obj for ref, obj in objetos.items() if ref in vivos}
+    informe['objects_after'] = len(objetos)
+
+    resultado = _escribir(objetos, reader.trailer, opciones['object_streams'])
+
+    # Nunca devolver algo más grande que la entrada
+    if len(resultado) >= len(datos):
+        return datos, informe
+
+    informe['size_after'] = len(resultado)
+    return resultado, informe
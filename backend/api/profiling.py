@@ -0,0 +1,147 @@
+"""
+Perfilado bajo demanda de requests individuales (solo admin)
+Con el header `X-Profile` (o `?profile=`) y `X-Admin-Token` válido, el request
+se ejecuta bajo cProfile y/o tracemalloc y el resultado se guarda por request ID.
+Modos: `1`/`all` (ambos), `cpu` (solo cProfile), `memory` (solo tracemalloc);
+tracemalloc ralentiza mucho pypdf, así que `cpu` da tiempos más fieles.
+Sin ADMIN_TOKEN configurado el middleware no se instala: coste cero.
+"""
+import cProfile
+import hmac
+import io
+import json
+import os
+import pstats
+import re
+import threading
+import time
+import tracemalloc
+import uuid
+from urllib.parse import parse_qs
+
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')
+PROFILE_DIR = os.environ.get('PROFILE_DIR', '/tmp/fdny_profiles')
+PROFILE_TOP = 40  # funciones en el resumen de texto
+
+_RE_REQUEST_ID = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+# modo -> (cProfile, tracemalloc)
+MODOS_PERFIL = {
+    '1': (True, True),
+    'true': (True, True),
+    'all': (True, True),
+    'cpu': (True, False),
+    'memory': (False, True),
+}
+
+
+def es_admin(token, admin_token=None):
+    """Comparar el token recibido con ADMIN_TOKEN (desactivado si está vacío)"""
+    admin_token = ADMIN_TOKEN if admin_token is None else admin_token
+    return bool(admin_token) and bool(token) and hmac.compare_digest(token, admin_token)
+
+
+def valid_request_id(request_id):
+    return bool(request_id) and bool(_RE_REQUEST_ID.match(request_id))
+
+
+def ruta_perfil(request_id, extension, directorio=PROFILE_DIR):
+    """Ruta del artefacto de un request ('json' resumen, 'prof' datos de pstats)"""
+    return os.path.join(directorio, f"{request_id}.{extension}")
+
+
+class RequestProfiler:
+    """
+    Middleware WSGI: perfila los requests marcados por un admin
+    Solo un request perfilado a la vez (tracemalloc es global al proceso);
+    si ya hay uno en curso, el request se sirve sin perfilar.
+    """
+
+    def __init__(self, wsgi_app, admin_token=ADMIN_TOKEN, directorio=PROFILE_DIR):
+        self.wsgi_app = wsgi_app
+        self.admin_token = admin_token
+        self.directorio = directorio
+        self._lock = threading.Lock()
+
+    def _modo(self, environ):
+        modo = environ.get('HTTP_X_PROFILE', '')
+        query = environ.get('QUERY_STRING', '')
+        if not modo and 'profile=' in query:
+            modo = parse_qs(query).get('profile', [''])[0]
+        return MODOS_PERFIL.get(modo.lower()) if modo else None
+
+    def __call__(self, environ, start_response):
+        modo = self._modo(environ)
+        if not modo or not es_admin(environ.get('HTTP_X_ADMIN_TOKEN', ''), self.admin_token):
+            return self.wsgi_app(environ, start_response)
+        if not self._lock.acquire(blocking=False):
+            return self.wsgi_app(environ, start_response)
+        try:
+            return self._perfilar(environ, start_response, *modo)
+        finally:
+            self._lock.release()
+
+    def _perfilar(self, environ, start_response, con_cprofile, con_memoria):
+        request_id = environ.get('HTTP_X_REQUEST_ID', '')
+        if not valid_request_id(request_id):
+            request_id = uuid.uuid4().hex
+        estado = {}
+
+        def start_response_perfilado(status, headers, exc_info=None):
+            estado['status'] = status
+            headers = list(headers) + [('X-Profile-Id', request_id)]
+            return start_response(status, headers, exc_info)
+
+        profiler = cProfile.Profile() if con_cprofile else None
+        pico = None
+        if con_memoria:
+            tracemalloc.start()
+        inicio, inicio_cpu = time.perf_counter(), time.thread_time()
+        try:
+            if profiler:
+                profiler.enable()
+            try:
+                # El cuerpo se consume dentro del perfil (incluye respuestas en streaming)
+                respuesta = self.wsgi_app(environ, start_response_perfilado)
+                try:
+                    cuerpo = list(respuesta)
+                finally:
+                    if hasattr(respuesta, 'close'):
+                        respuesta.close()
+            finally:
+                if profiler:
+                    profiler.disable()
+            wall, cpu = time.perf_counter() - inicio, time.thread_time() - inicio_cpu
+            if con_memoria:
+                _, pico = tracemalloc.get_traced_memory()
+        finally:
+            if con_memoria:
+                tracemalloc.stop()
+
+        self._guardar(request_id, environ, estado.get('status', ''), profiler, wall, cpu, pico)
+        return cuerpo
+
+    def _guardar(self, request_id, environ, status, profiler, wall, cpu, pico):
+        os.makedirs(self.directorio, exist_ok=True)
+        texto = io.StringIO()
+        ruta_prof = ruta_perfil(request_id, 'prof', self.directorio)
+        if profiler:
+            profiler.dump_stats(ruta_prof)
+            pstats.Stats(profiler, stream=texto).sort_stats('cumulative').print_stats(PROFILE_TOP)
+        elif os.path.exists(ruta_prof):
+            os.remove(ruta_prof)  # no mezclar con el perfil de un request anterior con el mismo ID
+        resumen = {
+            'request_id': request_id,
+            'method': environ.get('REQUEST_METHOD'),
+            'path': environ.get('PATH_INFO'),
+            'status': status,
+            'wall_ms': round(wall * 1000, 2),
+            'cpu_ms': round(cpu * 1000, 2),
+            'peak_memory_bytes': pico,
+            'profiled_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'top': texto.getvalue()
+        }
+        with open(ruta_perfil(request_id, 'json', self.directorio), 'w') as f:
+            json.dump(resumen, f, indent=2)
+        print(f"   🔬 Profile {request_id}: {resumen['wall_ms']} ms wall, "
+              f"{resumen['cpu_ms']} ms CPU, peak memory {pico if pico is not None else '-'}")
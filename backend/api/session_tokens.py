@@ -0,0 +1,111 @@
+"""
+Tokens de sesión firmados (HMAC) emitidos tras /api/auth/verify
+Las rutas de solo lectura los validan en memoria sin consultar la base de datos
+"""
+import base64
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+
+from api.database import SECRET_KEY
+
+SESSION_TOKEN_TTL = int(os.environ.get('SESSION_TOKEN_TTL', '900'))  # 15 minutos
+# Cada cuánto se re-lee el epoch de revocación de una licencia
+SESSION_EPOCH_TTL = int(os.environ.get('SESSION_EPOCH_TTL', '30'))
+
+TOKEN_PREFIX = 'st1.'
+
+# Clave derivada: las firmas de sesión nunca coinciden con las de license keys
+_TOKEN_KEY = hmac.new(SECRET_KEY, b'session-token-v1', hashlib.sha256).digest()
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+class SessionTokens:
+    def __init__(self, db, ttl=SESSION_TOKEN_TTL, epoch_ttl=SESSION_EPOCH_TTL):
+        self.db = db
+        self.ttl = ttl
+        self.epoch_ttl = epoch_ttl
+        self._epochs = {}  # license_key -> (epoch, leído_en)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def is_token(value):
+        return bool(value) and value.startswith(TOKEN_PREFIX)
+
+    def issue(self, license_key, fingerprint, epoch):
+        """Emitir token para una licencia; devuelve (token, expira_en)"""
+        expires = int(time.time()) + self.ttl
+        payload = json.dumps({
+            'lk': license_key,
+            'fp': fingerprint or '',
+            'exp': expires,
+            'ep': epoch
+        }, separators=(',', ':')).encode()
+        body = _b64encode(payload)
+        signature = hmac.new(_TOKEN_KEY, body.encode(), hashlib.sha256).digest()
+
+        with self._lock:
+            self._epochs[license_key] = (epoch, time.time())
+
+        return f"{TOKEN_PREFIX}{body}.{_b64encode(signature)}", expires
+
+    def decode(self, token):
+        """Comprobar firma y expiración (sin base de datos)"""
+        if not self.is_token(token):
+            return None
+        try:
+            body, signature = token[len(TOKEN_PREFIX):].split('.', 1)
+            expected = hmac.new(_TOKEN_KEY, body.encode(), hashlib.sha256).digest()
+            if not hmac.compare_digest(expected, _b64decode(signature)):
+                return None
+            claims = json.loads(_b64decode(body))
+        except (ValueError, TypeError):
+            return None
+
+        if claims.get('exp', 0) < time.time():
+            return None
+        return claims
+
+    def _current_epoch(self, license_key):
+        """Epoch de revocación cacheado; se refresca desde la BD cada epoch_ttl segundos"""
+        now = time.time()
+        with self._lock:
+            cached = self._epochs.get(license_key)
+        if cached and now - cached[1] < self.epoch_ttl:
+            return cached[0]
+
+        epoch = self.db.get_revocation_epoch(license_key)
+        with self._lock:
+            self._epochs[license_key] = (epoch, now)
+        return epoch
+
+    def validate(self, token, fingerprint=''):
+        """
+        Claims del token si es válido, no ha sido revocado y se presenta desde el
+        mismo dispositivo (fingerprint) al que se emitió; si no None
+        """
+        claims = self.decode(token)
+        if not claims:
+            return None
+        if not hmac.compare_digest(claims.get('fp', '').encode(), (fingerprint or '').encode()):
+            return None
+
+        epoch = self._current_epoch(claims['lk'])
+        if epoch is None or epoch != claims.get('ep'):
+            return None
+        return claims
+
+    def forget(self, license_key):
+        """Descartar el epoch cacheado (tras revocar en este mismo proceso)"""
+        with self._lock:
+            self._epochs.pop(license_key, None)
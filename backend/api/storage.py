@@ -0,0 +1,321 @@
+"""
+Backends de almacenamiento de LicenseDB
+SQLite (un fichero, un nodo) o PostgreSQL (varios nodos comparten créditos,
+dispositivos y rate limits). LicenseDB escribe SQL en el dialecto de SQLite;
+el backend de PostgreSQL lo traduce y reparte conexiones de un pool.
+"""
+import os
+import re
+import sqlite3
+import threading
+from functools import lru_cache
+from urllib.parse import urlsplit, urlunsplit
+
+# Tamaño del pool de conexiones por proceso (PostgreSQL)
+DATABASE_POOL_MIN = int(os.environ.get('DATABASE_POOL_MIN', '1'))
+DATABASE_POOL_MAX = int(os.environ.get('DATABASE_POOL_MAX', '10'))
+DATABASE_POOL_TIMEOUT = float(os.environ.get('DATABASE_POOL_TIMEOUT', '30'))
+
+# Clave del advisory lock que serializa la creación del esquema entre nodos
+_LOCK_ESQUEMA = 0x46444E59
+
+
+class SQLiteStorage:
+    """Un fichero SQLite; las transacciones BEGIN IMMEDIATE serializan las escrituras"""
+
+    dialect = 'sqlite'
+    Error = sqlite3.Error
+    IntegrityError = sqlite3.IntegrityError
+
+    def __init__(self, path):
+        self.path = path
+
+    def describe(self):
+        return self.path
+
+    def connect(self):
+        conn = sqlite3.connect(self.path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def table_names(self, cursor):
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+        return {row['name'] for row in cursor.fetchall()}
+
+    def column_names(self, cursor, table):
+        cursor.execute(f'PRAGMA table_info({table})')
+        return {row['name'] for row in cursor.fetchall()}
+
+    def trigger_names(self, cursor):
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")
+        return {row['name'] for row in cursor.fetchall()}
+
+    def index_names(self, cursor):
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index'")
+        return {row['name'] for row in cursor.fetchall()}
+
+    def lock_schema(self, cursor):
+        """La creación del esquema ya es atómica con el lock de escritura del fichero"""
+
+    def lock_license(self, cursor, license_key):
+        """BEGIN IMMEDIATE ya bloquea toda la base de datos"""
+
+    def dispose(self):
+        pass
+
+
+# ============================================
+# POSTGRESQL
+# ============================================
+
+_FORMATO_FECHA = "'YYYY-MM-DD HH24:MI:SS'"
+_AHORA = "timezone('UTC', now())"
+
+# Literales de cadena e identificadores entre comillas: su contenido no se traduce
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"")
+
+# Funciones de fecha de SQLite (incluyen sus propios literales), sobre la sentencia completa
+_FUNCIONES = [
+    # datetime('now', '-10 minutes') con el intervalo como parámetro
+    (re.compile(r"\bdatetime\(\s*'now'\s*,\s*\?\s*\)", re.IGNORECASE),
+     f"to_char({_AHORA} + CAST(%s AS interval), {_FORMATO_FECHA})"),
+    # Edad en segundos de un timestamp
+    (re.compile(r"\(\s*julianday\(\s*'now'\s*\)\s*-\s*julianday\(\s*(\w+)\s*\)\s*\)\s*\*\s*86400\b",
+                re.IGNORECASE),
+     rf"CAST(EXTRACT(EPOCH FROM {_AHORA} - CAST(\1 AS timestamp)) AS DOUBLE PRECISION)"),
+    # date(col, '+1 month')
+    (re.compile(r"\bdate\(\s*(\w+)\s*,\s*'([^']+)'\s*\)", re.IGNORECASE),
+     r"to_char(CAST(\1 AS date) + interval '\2', 'YYYY-MM-DD')"),
+]
+
+# (patrón, reemplazo) del dialecto de SQLite al de PostgreSQL, solo fuera de literales
+_TRADUCCIONES = [
+    # Marcadores de parámetros (los % literales se escapan antes)
+    (re.compile(r'\?'), '%s'),
+    (re.compile(r'\binstr\(', re.IGNORECASE), 'strpos('),
+    (re.compile(r'\bCURRENT_TIMESTAMP\b', re.IGNORECASE), f"to_char({_AHORA}, {_FORMATO_FECHA})"),
+    # DDL
+    (re.compile(r'\bINTEGER PRIMARY KEY AUTOINCREMENT\b'), 'SERIAL PRIMARY KEY'),
+    (re.compile(r'\bBOOLEAN DEFAULT 1\b'), 'INTEGER DEFAULT 1'),
+    (re.compile(r'\bBLOB\b'), 'BYTEA'),
+    (re.compile(r'\bREAL\b'), 'DOUBLE PRECISION'),
+    (re.compile(r'\)\s*WITHOUT ROWID'), ')'),
+]
+
+# Funciones de SQLite que quedan sin traducir: error en vez de SQL que PostgreSQL rechaza
+_SIN_TRADUCCION = re.compile(r'\b(julianday|datetime|strftime|date)\s*\(', re.IGNORECASE)
+
+
+def _traducir_codigo(codigo):
+    for patron, reemplazo in _TRADUCCIONES:
+        codigo = patron.sub(reemplazo, codigo)
+    funcion = _SIN_TRADUCCION.search(codigo)
+    if funcion:
+        raise ValueError(f"No PostgreSQL translation for SQLite function {funcion.group(1)}()")
+    return codigo
+
+
+@lru_cache(maxsize=512)
+def traducir_sql(sql):
+    """SQL de LicenseDB (dialecto SQLite) -> PostgreSQL; las sentencias son constantes"""
+    # psycopg2 interpreta '%' en toda la sentencia, también dentro de literales
+    sql = sql.replace('%', '%%')
+    for patron, reemplazo in _FUNCIONES:
+        sql = patron.sub(reemplazo, sql)
+
+    partes = []
+    inicio = 0
+    for literal in _LITERAL.finditer(sql):
+        partes.append(_traducir_codigo(sql[inicio:literal.start()]))
+        partes.append(literal.group())
+        inicio = literal.end()
+    partes.append(_traducir_codigo(sql[inicio:]))
+    return ''.join(partes)
+
+
+class _CursorPG:
+    """Cursor con la interfaz que usa LicenseDB (BEGIN/COMMIT/ROLLBACK explícitos, '?')"""
+
+    def __init__(self, conexion, cursor):
+        self._conexion = conexion
+        self._cursor = cursor
+
+    def execute(self, sql, params=()):
+        orden = sql.strip().upper()
+        if orden.startswith('BEGIN'):
+            # psycopg2 abre la transacción con la primera sentencia
+            self._conexion.rollback()
+            return self
+        if orden == 'COMMIT':
+            self._conexion.commit()
+            return self
+        if orden == 'ROLLBACK':
+            self._conexion.rollback()
+            return self
+        self._cursor.execute(traducir_sql(sql), tuple(params))
+        return self
+
+    def executemany(self, sql, seq_params):
+        self._cursor.executemany(traducir_sql(sql), [tuple(p) for p in seq_params])
+        return self
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+
+class _ConexionPG:
+    """Conexión prestada del pool; close() la devuelve (deshaciendo lo no confirmado)"""
+
+    def __init__(self, storage, pool, raw):
+        self._storage = storage
+        self._pool = pool
+        self._raw = raw
+        self.isolation_level = None  # compatibilidad con sqlite3: aquí no tiene efecto
+
+    def cursor(self):
+        from psycopg2.extras import DictCursor
+        cursor = self._raw.cursor(cursor_factory=DictCursor)
+        self._storage.register_types(cursor)
+        return _CursorPG(self._raw, cursor)
+
+    def commit(self):
+        self._raw.commit()
+
+    def rollback(self):
+        self._raw.rollback()
+
+    def close(self):
+        if self._raw is not None:
+            raw, self._raw = self._raw, None
+            self._storage._devolver(self._pool, raw)
+
+
+class PostgresStorage:
+    """
+    PostgreSQL con un pool de conexiones por proceso
+    Las actualizaciones condicionales (UPDATE ... WHERE credits_used < credits_total)
+    son atómicas en el servidor; las que leen antes de escribir bloquean la fila
+    de la licencia (SELECT ... FOR UPDATE) en lugar de toda la base de datos.
+    """
+
+    dialect = 'postgresql'
+
+    def __init__(self, url, minconn=DATABASE_POOL_MIN, maxconn=DATABASE_POOL_MAX,
+                 timeout=DATABASE_POOL_TIMEOUT):
+        try:
+            import psycopg2
+        except ImportError as e:
+            raise RuntimeError("DATABASE_URL points to PostgreSQL but psycopg2 is not installed "
+                               "(pip install psycopg2-binary)") from e
+        self._psycopg2 = psycopg2
+        # BYTEA como bytes (igual que los BLOB de sqlite3), no memoryview
+        self._bytea = psycopg2.extensions.new_type(
+            psycopg2.BINARY.values, 'BYTEA_BYTES',
+            lambda valor, cursor: None if valor is None else bytes(psycopg2.BINARY(valor, cursor))
+        )
+        self.Error = psycopg2.Error
+        self.IntegrityError = psycopg2.IntegrityError
+        self.url = url
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self._pool = None
+        self._lock = threading.Lock()
+        self._huecos = threading.BoundedSemaphore(maxconn)
+        # Las conexiones no se comparten con procesos hijos (gunicorn preload)
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(before=self.dispose)
+
+    def describe(self):
+        """URL sin contraseña (para mensajes de error)"""
+        partes = urlsplit(self.url)
+        if partes.password:
+            host = partes.netloc.rsplit('@', 1)[1]
+            partes = partes._replace(netloc=f"{partes.username}:***@{host}")
+        return urlunsplit(partes)
+
+    def _obtener_pool(self):
+        with self._lock:
+            if self._pool is None:
+                from psycopg2.pool import ThreadedConnectionPool
+                self._pool = ThreadedConnectionPool(self.minconn, self.maxconn, self.url)
+            return self._pool
+
+    def connect(self):
+        # ThreadedConnectionPool falla si está agotado: esperar un hueco
+        if not self._huecos.acquire(timeout=self.timeout):
+            raise self._psycopg2.OperationalError("Timed out waiting for a database connection")
+        try:
+            pool = self._obtener_pool()
+            raw = pool.getconn()
+        except Exception:
+            self._huecos.release()
+            raise
+        return _ConexionPG(self, pool, raw)
+
+    def _devolver(self, pool, raw):
+        try:
+            cerrar = raw.closed or pool is not self._pool
+            if not cerrar:
+                try:
+                    raw.rollback()
+                except self._psycopg2.Error:
+                    cerrar = True
+            if not pool.closed:
+                pool.putconn(raw, close=cerrar)
+        finally:
+            self._huecos.release()
+
+    def register_types(self, cursor):
+        self._psycopg2.extensions.register_type(self._bytea, cursor)
+
+    def dispose(self):
+        """Cerrar el pool (se vuelve a abrir con la siguiente conexión)"""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.closeall()
+
+    def table_names(self, cursor):
+        cursor.execute("SELECT table_name FROM information_schema.tables WHERE table_schema = current_schema()")
+        return {row['table_name'] for row in cursor.fetchall()}
+
+    def column_names(self, cursor, table):
+        cursor.execute('''
+            SELECT column_name FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = ?
+        ''', (table,))
+        return {row['column_name'] for row in cursor.fetchall()}
+
+    def trigger_names(self, cursor):
+        cursor.execute('SELECT tgname FROM pg_trigger WHERE NOT tgisinternal')
+        return {row['tgname'] for row in cursor.fetchall()}
+
+    def index_names(self, cursor):
+        cursor.execute('SELECT indexname FROM pg_indexes WHERE schemaname = current_schema()')
+        return {row['indexname'] for row in cursor.fetchall()}
+
+    def lock_schema(self, cursor):
+        """Varios nodos arrancando a la vez no crean las tablas en paralelo"""
+        cursor.execute('SELECT pg_advisory_xact_lock(?)', (_LOCK_ESQUEMA,))
+
+    def lock_license(self, cursor, license_key):
+        """Serializar las transacciones de una licencia (leer y escribir sin carreras)"""
+        cursor.execute('SELECT 1 FROM licenses WHERE license_key = ? FOR UPDATE', (license_key,))
+
+
+def create_storage(url, path):
+    """PostgreSQL si url es postgres://..., si no SQLite en path"""
+    if url and url.startswith(('postgres://', 'postgresql://')):
+        return PostgresStorage(url)
+    return SQLiteStorage(path)
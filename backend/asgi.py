@@ -0,0 +1,11 @@
+"""
+Entry point for ASGI servers
+Lookup routes (/api/bin, /api/auth/verify) run on the event loop; the rest of
+the Flask app, PDF generation included, runs in a bounded thread pool
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5000 --workers 4
+"""
+
+from api.asgi import create_asgi_app
+
+app = create_asgi_app()
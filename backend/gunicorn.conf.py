@@ -0,0 +1,26 @@
+"""
+Configuración de gunicorn (servidor pre-fork de producción)
+
+    gunicorn -c gunicorn.conf.py index:app
+
+Con preload_app la app se construye una sola vez en el proceso maestro:
+plantillas, métricas de fuentes, overlays y configuración quedan en memoria
+antes del fork y los workers las comparten por copy-on-write.
+Cada worker abre sus propias conexiones SQLite (una por operación) y su
+propio pool de enriquecimiento tras el fork.
+"""
+import gc
+import multiprocessing
+import os
+
+bind = os.environ.get('BIND', f"0.0.0.0:{os.environ.get('PORT', '5000')}")
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+threads = int(os.environ.get('GUNICORN_THREADS', '2'))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '120'))
+preload_app = True
+
+
+def when_ready(server):
+    # Congelar el heap del maestro: el GC de los workers no recorre (ni copia) esas páginas
+    gc.freeze()
+    server.log.info("App preloaded; forking %s workers", workers)
@@ -1,9 +1,14 @@
 """
-Entry point for Vercel deployment
-Imports the Flask app from api/main.py
+Entry point for Vercel deployment and WSGI servers
+Builds the Flask app with the factory in api/main.py
+
+Production (pre-fork, one worker per core):
+    gunicorn -c gunicorn.conf.py index:app
 """
 
-from api.main import app
+from api.main import create_app
+
+app = create_app()
 
 # Vercel requires the app to be named 'app' or exported
 if __name__ == "__main__":
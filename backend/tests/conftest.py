@@ -0,0 +1,107 @@
+"""
+Fixtures comunes de los tests
+La base de datos, la caché de salida y las URLs de Open Data se configuran por
+entorno ANTES de importar api: db, bin_enricher y compañía son instancias globales.
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+_TMP = tempfile.mkdtemp(prefix='fdny_tests_')
+os.environ['DATABASE_PATH'] = os.path.join(_TMP, 'licenses.db')
+os.environ.pop('DATABASE_URL', None)
+os.environ['OUTPUT_CACHE_DIR'] = os.path.join(_TMP, 'output_cache')
+os.environ['PROFILE_DIR'] = os.path.join(_TMP, 'profiles')
+os.environ['ENRICHMENT_BASE_URL'] = 'http://127.0.0.1:9'
+os.environ['ENRICHMENT_WARM_INTERVAL'] = '0'
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEMPLATES_DIR = os.path.join(os.path.dirname(BACKEND_DIR), 'templates')
+sys.path.insert(0, BACKEND_DIR)
+
+from api.database import db  # noqa: E402
+
+TEMPLATES = {
+    'tm1': os.path.join(TEMPLATES_DIR, 'application-a-433-c.pdf'),
+    'a433': os.path.join(TEMPLATES_DIR, 'application-a-433-c.pdf'),
+    'b45': os.path.join(TEMPLATES_DIR, 'b45-inspection-request.pdf')
+}
+
+ADMIN_TOKEN = 'test-admin-token'
+
+
+@pytest.fixture(scope='session')
+def app():
+    from api.main import create_app
+    return create_app({'TEMPLATES': TEMPLATES, 'PRELOAD': True, 'ADMIN_TOKEN': ADMIN_TOKEN})
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def license_key(request):
+    """Licencia nueva por test (el email deriva del nombre del test)"""
+    credits = getattr(request, 'param', 5)
+    result = db.create_license(f'{request.node.name}-{id(request)}@example.com', 'Test Co', credits=credits)
+    assert result['success']
+    return result['license_key']
+
+
+class FakeSocrata:
+    """
+    Servidor local con la API de recursos de Socrata (/resource/<dataset>.json)
+    rows: {dataset: [filas]}; delay: {dataset: segundos}; status: {dataset: código HTTP}
+    """
+
+    def __init__(self):
+        import json
+        import threading
+        import time
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        from urllib.parse import urlparse, parse_qsl
+
+        self.rows = {}
+        self.delay = {}
+        self.status = {}
+        self.requests = []
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                dataset = url.path.rsplit('/', 1)[-1].removesuffix('.json')
+                fake.requests.append((dataset, dict(parse_qsl(url.query))))
+                time.sleep(fake.delay.get(dataset, 0))
+                body = json.dumps(fake.rows.get(dataset, [])).encode()
+                self.send_response(fake.status.get(dataset, 200))
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def fake_socrata(monkeypatch):
+    from api import enrichment
+    fake = FakeSocrata()
+    monkeypatch.setattr(enrichment, 'ENRICHMENT_BASE_URL', fake.url)
+    yield fake
+    fake.close()
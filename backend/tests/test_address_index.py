@@ -0,0 +1,100 @@
+"""Búsqueda de BINs por dirección: normalización, clave exacta y calles parecidas"""
+import pytest
+
+from api.address_index import AddressIndex, normalizar_calle, separar_direccion
+
+EDIFICIOS = [
+    ('1001001', '1515', 'BROADWAY', 'MANHATTAN', '10036'),
+    ('1001002', '1501', 'BROADWAY', 'MANHATTAN', '10036'),
+    ('1001003', '1700', 'BROADWAY', 'MANHATTAN', '10019'),
+    ('3001001', '1515', 'BROADWAY', 'BROOKLYN', '11221'),
+    ('1001004', '123', 'WEST 42ND STREET', 'MANHATTAN', '10036'),
+    ('1001005', '1515', 'BROAD ST', 'MANHATTAN', '10004'),
+    ('4001001', '12-34', 'JUNCTION BOULEVARD', 'QUEENS', '11372'),
+]
+
+
+class _SinCache:
+    """bin_cache vacío: el índice solo lleva la semilla"""
+
+    def bin_cache_changes(self, since=None):
+        return []
+
+
+@pytest.fixture
+def indice(tmp_path):
+    semilla = tmp_path / 'buildings.csv'
+    semilla.write_text('BIN,House_Number,Street_Name,Boro,ZipCode\n' +
+                       ''.join(','.join(fila) + '\n' for fila in EDIFICIOS))
+    indice = AddressIndex(_SinCache(), semilla=str(semilla))
+    assert indice.construir()['buildings'] == len(EDIFICIOS)
+    return indice
+
+
+@pytest.mark.parametrize('calle, normalizada', [
+    ('West 42nd Street', 'W 42 ST'),
+    ('w. 42 st', 'W 42 ST'),
+    ('Fifth Avenue', '5 AVE'),
+    ('St. Marks Pl', 'ST MARKS PL'),
+])
+def test_street_normalisation(calle, normalizada):
+    assert normalizar_calle(calle) == normalizada
+
+
+@pytest.mark.parametrize('texto, partes', [
+    ('123 W 42nd St, Manhattan NY 10036', ('123', 'W 42ND ST', 'MANHATTAN', '10036')),
+    ('1515 Broadway Brooklyn 11221', ('1515', 'BROADWAY', 'BROOKLYN', '11221')),
+    ('12 - 34 Junction Blvd, Queens', ('12-34', 'JUNCTION BLVD', 'QUEENS', '')),
+    ('Broadway', ('', 'BROADWAY', '', '')),
+])
+def test_split_free_text_address(texto, partes):
+    direccion = separar_direccion(texto)
+    assert (direccion['house'], direccion['street'], direccion['borough'], direccion['zip']) == partes
+
+
+def test_exact_address_resolves_by_key(indice):
+    resultados = indice.buscar('123', 'W 42nd St', 'Manhattan')
+    assert [(r['bin'], r['match'], r['score']) for r in resultados] == [('1001004', 'exact', 1.0)]
+
+    # Sin borough, la misma dirección en dos boroughs da los dos
+    assert {r['bin'] for r in indice.buscar('1515', 'Broadway')} == {'1001001', '3001001'}
+
+
+def test_typo_finds_street_and_ranks_by_house_number(indice):
+    resultados = indice.buscar('1515', 'Brodway', 'Manhattan', '10036')
+    assert all(r['match'] == 'fuzzy' and r['score'] < 1 for r in resultados)
+    # Mismo número primero, luego el número cercano; otro borough penaliza y un
+    # número lejano (1700) no se considera el mismo edificio
+    assert [r['bin'] for r in resultados] == ['1001001', '1001002', '3001001']
+    scores = [r['score'] for r in resultados]
+    assert scores == sorted(scores, reverse=True)
+
+
+def test_street_similarity_decides_candidates(indice):
+    assert [r['bin'] for r in indice.buscar('1515', 'Brod St', 'Manhattan')] == ['1001005']
+    # Broad St se parece a 'Broadwy', pero Broadway con el mismo número va antes
+    assert [r['bin'] for r in indice.buscar('1515', 'Broadwy', 'Manhattan')][:2] == ['1001001', '1001005']
+    assert indice.buscar('1515', 'Lexington Avenue') == []
+
+
+def test_reindexed_building_leaves_old_address(indice):
+    assert indice.anadir('1001004', '125', 'W 42 ST', 'MANHATTAN', '10036')
+    assert not indice.anadir('1001004', '125', 'West 42nd Street', '1', '10036')
+    assert indice.stats()['deleted'] == 1
+
+    assert indice.buscar('125', 'W 42 St', 'Manhattan')[0]['bin'] == '1001004'
+    assert all(r['match'] == 'fuzzy' for r in indice.buscar('123', 'W 42 St', 'Manhattan'))
+
+
+def test_search_endpoint_parses_free_text(client, license_key, indice, monkeypatch):
+    from api import main
+    monkeypatch.setattr(main, 'address_index', indice)
+    headers = {'Authorization': f'Bearer {license_key}'}
+
+    response = client.get('/api/search', query_string={'q': '1515 Brodway, Manhattan NY 10036'}, headers=headers)
+    assert response.status_code == 200, response.get_json()
+    data = response.get_json()
+    assert data['query'] == {'house': '1515', 'street': 'BRODWAY', 'borough': 'MANHATTAN', 'zip': '10036'}
+    assert data['results'][0]['bin'] == '1001001'
+
+    assert client.get('/api/search', query_string={'house': '1515'}, headers=headers).status_code == 400
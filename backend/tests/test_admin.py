@@ -0,0 +1,49 @@
+"""Endpoints de administración"""
+import argparse
+import json
+
+import admin
+from api.database import db
+from conftest import ADMIN_TOKEN
+
+
+def _crear_lote(client, token=None):
+    headers = {'X-Admin-Token': token} if token else {}
+    return client.post('/api/admin/create-licenses', json=[
+        {'email': 'bulk-1@example.com', 'credits': 10},
+        {'email': 'bulk-2@example.com', 'credits': 10}
+    ], headers=headers)
+
+
+def test_bulk_create_requires_admin_token(client):
+    for token in (None, 'wrong-token'):
+        response = _crear_lote(client, token)
+        assert response.status_code == 403
+        assert response.get_json() == {'error': 'Admin token required'}
+
+
+def test_bulk_create_with_admin_token(client):
+    response = _crear_lote(client, ADMIN_TOKEN)
+    assert response.status_code == 200
+    
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert lines[-1] == {'summary': True, 'total': 2, 'created': 2, 'failed': 0}
+
+
+def test_bulk_create_keeps_explicit_zero_credits():
+    results = db.create_licenses_bulk([
+        {'email': 'zero-credits@example.com', 'credits': 0},
+        {'email': 'zero-csv@example.com', 'credits': '0', 'months': '1'},
+        {'email': 'default-credits@example.com', 'credits': ''},
+        {'email': 'missing-credits@example.com'},
+    ])
+    assert [r['success'] for r in results] == [True] * 4
+    assert [db.verify_license(r['license_key'])['credits_total'] for r in results] == [0, 0, 50, 50]
+
+
+def test_read_keys_from_json_list(tmp_path):
+    archivo = tmp_path / 'keys.json'
+    archivo.write_text(json.dumps(['AAAA-BBBB-CCCC-DDDD', ' EEEE-FFFF-0000-1111 ']))
+    args = argparse.Namespace(keys=['9999-9999-9999-9999'], file=str(archivo))
+    
+    assert admin.read_keys(args) == ['9999-9999-9999-9999', 'AAAA-BBBB-CCCC-DDDD', 'EEEE-FFFF-0000-1111']
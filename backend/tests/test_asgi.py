@@ -0,0 +1,71 @@
+"""Rutas nativas del modo ASGI"""
+import asyncio
+import json
+import threading
+
+import pytest
+
+from api import main
+from api.asgi import AsgiApp
+
+
+def _llamar(asgi_app, method, path, body=b'', headers=()):
+    """Un request ASGI completo; devuelve (status, cabeceras, cuerpo)"""
+    mensajes = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+
+    async def send(mensaje):
+        mensajes.append(mensaje)
+
+    async def ejecutar():
+        scope = {
+            'type': 'http', 'method': method, 'path': path, 'query_string': b'',
+            'headers': [(k.lower().encode(), v.encode()) for k, v in headers],
+            'client': ('127.0.0.1', 50000), 'server': ('testserver', 80)
+        }
+        try:
+            await asgi_app(scope, receive, send)
+        finally:
+            await asgi_app._cerrar()
+
+    asyncio.run(ejecutar())
+    inicio = mensajes[0]
+    cuerpo = b''.join(m.get('body', b'') for m in mensajes[1:])
+    return inicio['status'], dict((k.decode(), v.decode()) for k, v in inicio['headers']), cuerpo
+
+
+@pytest.fixture
+def asgi_app(app):
+    return AsgiApp(app)
+
+
+def test_http_errors_keep_their_status(asgi_app):
+    status, _, cuerpo = _llamar(asgi_app, 'POST', '/api/auth/verify', b'{not json',
+                                [('Content-Type', 'application/json')])
+    assert status == 400
+
+
+def test_unexpected_errors_are_500(asgi_app, monkeypatch):
+    def falla():
+        raise RuntimeError('boom')
+    monkeypatch.setattr(main, 'verify_license', falla)
+    
+    status, _, cuerpo = _llamar(asgi_app, 'POST', '/api/auth/verify', b'{}',
+                                [('Content-Type', 'application/json')])
+    assert status == 500
+    assert json.loads(cuerpo) == {'error': 'Internal server error'}
+
+
+def test_bin_resolves_license_off_the_event_loop(asgi_app, monkeypatch):
+    hilos = []
+    
+    def resolve_license():
+        hilos.append(threading.current_thread())
+        return None, True
+    monkeypatch.setattr(main, 'resolve_license', resolve_license)
+    
+    status, _, _ = _llamar(asgi_app, 'GET', '/api/bin/1000001', headers=[('Authorization', 'Bearer st1.x')])
+    assert status == 401
+    assert hilos and hilos[0] is not threading.main_thread()
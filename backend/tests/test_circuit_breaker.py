@@ -0,0 +1,115 @@
+"""Cortacircuitos de las fuentes de Open Data y límite de llamadas en vuelo"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from api import enrichment
+from api.circuit_breaker import CircuitBreaker, SinHueco, ABIERTO
+from api.database import db
+from api.enrichment import BinEnricher, FRESCURA_FRESCA, FRESCURA_NO_DISPONIBLE
+
+LOOKUPS = 20
+
+
+def test_entrar_waits_for_a_free_slot():
+    breaker = CircuitBreaker('test', max_en_vuelo=1)
+    ticket = breaker.entrar()
+    threading.Timer(0.1, breaker.registrar, (ticket, 0.1, False)).start()
+    
+    inicio = time.monotonic()
+    assert breaker.entrar(espera=2) is not None
+    assert 0.05 < time.monotonic() - inicio < 1
+
+
+def test_entrar_gives_up_at_the_deadline():
+    breaker = CircuitBreaker('test', max_en_vuelo=1)
+    breaker.entrar()
+    with pytest.raises(SinHueco):
+        breaker.entrar(espera=0.05)
+
+
+def test_open_circuit_fails_fast():
+    breaker = CircuitBreaker('test', minimo=2, max_en_vuelo=1)
+    for _ in range(2):
+        breaker.registrar(breaker.entrar(), 0.01, True)
+    assert breaker.estado == ABIERTO
+    
+    inicio = time.monotonic()
+    assert breaker.entrar(espera=2) is None
+    assert time.monotonic() - inicio < 0.05
+
+
+def test_entrar_async_waits_without_blocking_the_loop():
+    breaker = CircuitBreaker('test', max_en_vuelo=1)
+    
+    async def ejecutar():
+        ticket = breaker.entrar()
+        asyncio.get_running_loop().call_later(0.1, breaker.registrar, ticket, 0.1, False)
+        return await breaker.entrar_async(espera=2)
+    
+    assert asyncio.run(ejecutar()) is not None
+
+
+@pytest.fixture
+def socrata_sano(fake_socrata):
+    """Todas las fuentes responden (con algo de latencia) para cualquier BIN"""
+    fake_socrata.rows.update({
+        'ipu4-2q9a': [{'house': '1', 'street_name': 'BROADWAY', 'boro': 'MANHATTAN'}],
+        'ic3t-wcy2': [{'house__': '1', 'borough': 'MANHATTAN', 'block': '1', 'lot': '1'}],
+        'tesw-yqqr': [{'housenumber': '1', 'registrationid': '7', 'boroid': '1', 'block': '1', 'lot': '1'}],
+        'feu5-w2e2': [{'type': 'CorporateOwner', 'corporationname': 'OWNER LLC'}],
+        '64uk-42ks': [{'bldgclass': 'O4', 'numfloors': '10'}],
+    })
+    for dataset in fake_socrata.rows:
+        fake_socrata.delay[dataset] = 0.05
+    return fake_socrata
+
+
+@pytest.fixture
+def enricher(monkeypatch):
+    """BinEnricher propio (circuitos limpios) con menos huecos que lookups simultáneos"""
+    nuevo = BinEnricher(db, workers=16)
+    for breaker in nuevo.breakers.values():
+        breaker.max_en_vuelo = 2
+    monkeypatch.setattr(enrichment, 'bin_enricher', nuevo)
+    return nuevo
+
+
+def test_burst_of_uncached_lookups_is_served(client, license_key, socrata_sano, enricher):
+    def consultar(i):
+        return client.get(f'/api/bin/{2000000 + i}', headers={'Authorization': f'Bearer {license_key}'})
+    
+    with ThreadPoolExecutor(LOOKUPS) as pool:
+        respuestas = list(pool.map(consultar, range(LOOKUPS)))
+    
+    assert [r.status_code for r in respuestas] == [200] * LOOKUPS
+    assert all(r.get_json()['_freshness'] == FRESCURA_FRESCA for r in respuestas)
+    assert all(b.en_vuelo == 0 for b in enricher.breakers.values())
+
+
+def test_burst_of_uncached_lookups_is_served_async(socrata_sano, enricher):
+    async def ejecutar():
+        enricher.iniciar_async()
+        try:
+            return await asyncio.gather(*(enricher.enriquecer_async(str(3000000 + i)) for i in range(LOOKUPS)))
+        finally:
+            await enricher.cerrar_async()
+    
+    resultados = asyncio.run(ejecutar())
+    assert all(r['_freshness'] == FRESCURA_FRESCA for r in resultados)
+    assert all(r['owner_business'] == 'OWNER LLC' for r in resultados)
+
+
+def test_open_circuit_is_unavailable(client, license_key, socrata_sano, enricher):
+    for breaker in enricher.breakers.values():
+        breaker.minimo = 1
+        breaker.registrar(breaker.entrar(), 0.01, True)
+    
+    response = client.get('/api/bin/4000000', headers={'Authorization': f'Bearer {license_key}'})
+    assert response.status_code == 503
+    assert response.get_json()['_freshness'] == FRESCURA_NO_DISPONIBLE
+    assert int(response.headers['Retry-After']) >= 1
+    assert socrata_sano.requests == []
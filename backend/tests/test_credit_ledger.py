@@ -0,0 +1,102 @@
+"""Ledger de créditos: el saldo materializado y los snapshots cuadran con los movimientos"""
+from api.database import db, CREDIT_GRANT, CREDIT_CONSUME, CREDIT_REFUND, CREDIT_RESET
+
+
+def _saldo(license_key):
+    licencia = db.verify_license(license_key)
+    return licencia['credits_total'] - licencia['credits_used']
+
+
+def _ledger(license_key):
+    conn = db.get_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT id, entry_type, amount, balance_after FROM credit_ledger
+        WHERE license_key = ? ORDER BY id
+    ''', (license_key,))
+    entries = [dict(row) for row in cursor.fetchall()]
+    conn.close()
+    return entries
+
+
+def _snapshots(license_key):
+    conn = db.get_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT * FROM credit_snapshots WHERE license_key = ? ORDER BY ledger_id', (license_key,))
+    snapshots = [dict(row) for row in cursor.fetchall()]
+    conn.close()
+    return snapshots
+
+
+def _totales(entries):
+    por_tipo = lambda tipo: sum(e['amount'] for e in entries if e['entry_type'] == tipo)
+    return {
+        'granted': por_tipo(CREDIT_GRANT),
+        'consumed': -por_tipo(CREDIT_CONSUME),
+        'refunded': por_tipo(CREDIT_REFUND),
+        'restored': por_tipo(CREDIT_RESET),
+        'balance': sum(e['amount'] for e in entries)
+    }
+
+
+def _movimientos(license_key):
+    assert db.consume_credit(license_key, 'job 1')
+    assert db.consume_credit(license_key, 'job 2')
+    assert db.refund_credit(license_key, note='rejected filing')
+    assert db.grant_credits(license_key, 10, 'top-up')
+    assert db.consume_credit(license_key)
+
+
+def test_balance_equals_sum_of_entries(license_key):
+    _movimientos(license_key)
+    db.reset_credits_bulk([license_key])
+    assert db.consume_credit(license_key)
+
+    entries = _ledger(license_key)
+    assert [e['entry_type'] for e in entries] == [
+        CREDIT_GRANT, CREDIT_CONSUME, CREDIT_CONSUME, CREDIT_REFUND, CREDIT_GRANT, CREDIT_CONSUME,
+        CREDIT_RESET, CREDIT_CONSUME
+    ]
+    # Cada movimiento anota el saldo acumulado hasta él
+    acumulado = 0
+    for entry in entries:
+        acumulado += entry['amount']
+        assert entry['balance_after'] == acumulado
+    assert _saldo(license_key) == acumulado == 14
+    assert db.credit_summary(license_key) == _totales(entries)
+
+
+def test_rejected_movements_leave_no_entry(license_key):
+    assert not db.refund_credit(license_key)
+    for _ in range(5):
+        assert db.consume_credit(license_key)
+    assert not db.consume_credit(license_key)
+
+    entries = _ledger(license_key)
+    assert len(entries) == 6
+    assert _saldo(license_key) == sum(e['amount'] for e in entries) == 0
+
+
+def test_summary_from_snapshot_matches_ledger(license_key):
+    _movimientos(license_key)
+    db.snapshot_credit_balances()
+    snapshot, = _snapshots(license_key)
+    antes = _ledger(license_key)
+    assert snapshot['ledger_id'] == antes[-1]['id']
+    assert {k: snapshot[k] for k in _totales(antes)} == _totales(antes)
+
+    # Sin movimientos nuevos no se repite el snapshot
+    db.snapshot_credit_balances()
+    assert len(_snapshots(license_key)) == 1
+
+    # Después del snapshot el resumen suma solo los movimientos posteriores
+    assert db.consume_credit(license_key)
+    assert db.refund_credit(license_key, 2)
+    entries = _ledger(license_key)
+    assert db.credit_summary(license_key) == _totales(entries)
+    assert db.credit_summary(license_key)['balance'] == _saldo(license_key)
+
+    db.snapshot_credit_balances()
+    ultimo = _snapshots(license_key)[-1]
+    assert ultimo['ledger_id'] == entries[-1]['id']
+    assert ultimo['balance'] == _saldo(license_key)
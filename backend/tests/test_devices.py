@@ -0,0 +1,34 @@
+"""Login: admisión de dispositivos y auditoría en una sola transacción"""
+from api.database import db
+
+
+def _login(client, license_key, fingerprint):
+    return client.post('/api/auth/verify', json={'license_key': license_key, 'fingerprint': fingerprint})
+
+
+def _logins(license_key):
+    conn = db.get_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT fingerprint FROM usage_log WHERE license_key = ? AND action = 'LOGIN'
+    ''', (license_key,))
+    fingerprints = [row['fingerprint'] for row in cursor.fetchall()]
+    conn.close()
+    return fingerprints
+
+
+def test_repeat_login_only_writes_audit_entry(client, license_key):
+    assert _login(client, license_key, 'device-a').status_code == 200
+    row_version = db.get_license_version(license_key)[0]
+    
+    assert _login(client, license_key, 'device-a').status_code == 200
+    assert db.get_license_version(license_key)[0] == row_version
+    assert _logins(license_key) == ['device-a', 'device-a']
+
+
+def test_rejected_device_is_not_logged(client, license_key):
+    for fingerprint in ('device-a', 'device-b', 'device-c'):
+        assert _login(client, license_key, fingerprint).status_code == 200
+    
+    assert _login(client, license_key, 'device-d').status_code == 403
+    assert 'device-d' not in _logins(license_key)
@@ -0,0 +1,78 @@
+"""Enriquecimiento de BINs contra un Socrata falso"""
+import time
+
+import pytest
+
+from api.enrichment import BinEnricher, FRESCURA_FRESCA, FRESCURA_OBSOLETA, ESTADO_OK, ESTADO_ERROR, ESTADO_PENDIENTE
+
+BIN = '1000001'
+
+
+@pytest.fixture
+def edificio(fake_socrata):
+    """Un edificio con datos en todas las fuentes"""
+    fake_socrata.rows.update({
+        'ipu4-2q9a': [{
+            'house': '1515', 'street_name': 'BROADWAY', 'boro': 'MANHATTAN', 'postcode': '10036',
+            'cnstrct_yr': '1985', 'occupancy': 'B', 'owner_name': 'BIS OWNER'
+        }],
+        'ic3t-wcy2': [{
+            'house__': '1515', 'street_name': 'BROADWAY', 'borough': 'MANHATTAN', 'zip': '10036',
+            'block': '1016', 'lot': '29', 'existingno_of_stories': '54',
+            'owner_s_business_name': 'DOB OWNER LLC'
+        }],
+        'tesw-yqqr': [{
+            'housenumber': '1515', 'streetname': 'BROADWAY', 'zip': '10036',
+            'registrationid': '42', 'boroid': '1', 'block': '1016', 'lot': '29'
+        }],
+        'feu5-w2e2': [
+            {'type': 'Agent', 'corporationname': 'AGENT INC'},
+            {'type': 'CorporateOwner', 'corporationname': 'HPD CORP', 'businesscity': 'NEW YORK'}
+        ],
+        '64uk-42ks': [{'bldgclass': 'O4', 'numfloors': '53', 'yearbuilt': '1972', 'bbl': '1010160029'}],
+    })
+    return fake_socrata
+
+
+def test_merge_precedence(edificio):
+    datos = BinEnricher(None).enriquecer(BIN)
+    
+    assert datos['_freshness'] == FRESCURA_FRESCA
+    assert all(e['status'] == ESTADO_OK for e in datos['_sources'].values())
+    # Propietario: HPD (contacto de tipo propietario) antes que DOB, PLUTO y BIS
+    assert datos['owner_business'] == 'HPD CORP'
+    assert datos['owner_city'] == 'NEW YORK'
+    # Resto de campos: BIS primero, luego DOB y PLUTO
+    assert datos['year_built'] == '1985'
+    # El año de construcción no se cuela como clase de construcción
+    assert datos['construction_class'] == ''
+    assert datos['stories'] == '54'
+    assert datos['building_class'] == 'O4'
+    # PLUTO se consulta con el BBL que aportan las otras fuentes
+    assert ('64uk-42ks', {'bbl': '1010160029'}) in edificio.requests
+
+
+def test_partial_failure(edificio):
+    edificio.status['ic3t-wcy2'] = 500
+    
+    datos = BinEnricher(None).enriquecer(BIN)
+    
+    assert datos['_sources']['dob_jobs']['status'] == ESTADO_ERROR
+    assert datos['_freshness'] == FRESCURA_OBSOLETA
+    # Lo demás llega igual; el BBL sale del registro HPD
+    assert datos['house'] == '1515'
+    assert datos['stories'] == '53'
+    assert datos['_sources']['pluto']['status'] == ESTADO_OK
+
+
+def test_budget_timeout(edificio):
+    edificio.delay['64uk-42ks'] = 1.5
+    
+    inicio = time.monotonic()
+    datos = BinEnricher(None, presupuesto=0.5).enriquecer(BIN)
+    
+    assert time.monotonic() - inicio < 1.0
+    assert datos['_sources']['pluto']['status'] == ESTADO_PENDIENTE
+    assert datos['_pending'] == ['pluto']
+    assert datos['owner_business'] == 'HPD CORP'
+    assert datos['building_class'] == ''
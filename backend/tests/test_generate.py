@@ -0,0 +1,114 @@
+"""Cobro, rate limit y caché de /api/generate"""
+import os
+
+import pytest
+
+from api.database import db
+from api.output_cache import output_cache, clave_filing
+
+
+def _generar(client, license_key, bin_number='1000001', **opciones):
+    return client.post('/api/generate', json={
+        'bin': bin_number,
+        'bin_data': {'address': '1 Test Street', 'borough': 'MANHATTAN'},
+        'devices': [],
+        'output_profile': 'none',
+        **opciones
+    }, headers={'Authorization': f'Bearer {license_key}'})
+
+
+def test_generate_consumes_one_credit(client, license_key):
+    response = _generar(client, license_key)
+    assert response.status_code == 200, response.get_json()
+    assert response.get_json()['credits_used'] == 1
+
+
+@pytest.mark.parametrize('license_key', [1], indirect=True)
+def test_cache_hit_requires_credits(client, license_key):
+    assert _generar(client, license_key).status_code == 200
+    
+    response = _generar(client, license_key)
+    assert response.status_code == 429
+    assert response.get_json()['credits_used'] == 1
+
+
+def test_cache_hit_reserves_rate_limit(client, license_key, monkeypatch):
+    assert _generar(client, license_key).status_code == 200
+    
+    monkeypatch.setattr(db, 'reserve_rate_limit', lambda *args, **kwargs: None)
+    response = _generar(client, license_key)
+    assert response.status_code == 429
+    assert response.get_json()['error'] == 'Rate limit exceeded'
+
+
+@pytest.mark.parametrize('license_key', [1], indirect=True)
+def test_failed_consume_is_not_cached(client, license_key, monkeypatch):
+    guardados = []
+    monkeypatch.setattr(output_cache, 'put', lambda key, value: guardados.append(key))
+    
+    # Otro request gasta el último crédito entre la verificación y el cobro
+    consume_credit = db.consume_credit
+    def consumo_concurrente(key, note=None):
+        consume_credit(key, note='other request')
+        return consume_credit(key, note=note)
+    monkeypatch.setattr(db, 'consume_credit', consumo_concurrente)
+    
+    response = _generar(client, license_key)
+    assert response.status_code == 429
+    assert response.get_json()['credits_used'] == 1
+    assert guardados == []
+
+
+def _clave(**entradas):
+    filing = {
+        'bin': '1000001',
+        'devices': [{'type': 'Smoke detector', 'floor': '1'}, {'type': 'Pull station', 'floor': '2'}],
+        'bin_data': {'owner_last': 'McDonald', '_sources': {'bis': {'status': 'ok', 'ms': 120}}}
+    }
+    filing.update(entradas)
+    return clave_filing('KEY', filing, {}, 'v1', '2026-01-01')
+
+
+def test_cache_key_uses_submitted_text():
+    clave = _clave()
+    # Lo que se imprime en los PDFs cuenta tal cual: mayúsculas, espacios y orden
+    assert _clave(bin_data={'owner_last': 'MCDONALD'}) != clave
+    assert _clave(devices=[{'type': 'Smoke  Detector', 'floor': '1'}, {'type': 'Pull station', 'floor': '2'}]) != clave
+    assert _clave(devices=[{'type': 'Pull station', 'floor': '2'}, {'type': 'Smoke detector', 'floor': '1'}]) != clave
+    # Los metadatos de la consulta no
+    assert _clave(bin_data={'owner_last': 'McDonald', '_sources': {}, '_freshness': 'stale'}) == clave
+
+
+EDIFICIO = {'house': '1515', 'street': 'BROADWAY', 'borough': 'MANHATTAN', 'zip': '10036'}
+
+
+def test_packet_contains_every_form(client, license_key):
+    response = _generar(client, license_key, '1000011', bin_data=EDIFICIO, packet=True)
+    assert response.status_code == 200, response.get_json()
+    assert list(response.get_json()['files']) == ['packet']
+    assert response.get_json()['credits_used'] == 1
+
+
+def test_packet_with_failed_form_is_not_charged(client, license_key):
+    # Sin número de casa el B-45 no se puede rellenar
+    response = _generar(client, license_key, '1000012', packet=True)
+    assert response.status_code == 500
+    assert response.get_json()['failed'] == ['B-45']
+    assert db.verify_license(license_key)['credits_used'] == 0
+
+
+def test_failed_packet_does_not_serve_stale_file(client, license_key, monkeypatch):
+    from api import pdf_generator
+    # PDF que dejó otro request del mismo BIN con el esquema de nombres anterior
+    obsoleto = '/tmp/PACKET_1000013.pdf'
+    with open(obsoleto, 'wb') as f:
+        f.write(b'%PDF-1.4 stale')
+    monkeypatch.setattr(pdf_generator, 'generar_paquete', lambda *args: False)
+    
+    try:
+        response = _generar(client, license_key, '1000013', bin_data=EDIFICIO, packet=True)
+    finally:
+        os.remove(obsoleto)
+    assert response.status_code == 500
+    assert response.get_json()['failed'] == ['Packet']
+    assert db.verify_license(license_key)['credits_used'] == 0
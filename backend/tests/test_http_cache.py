@@ -0,0 +1,39 @@
+"""ETag de /api/auth/info: cambia con la licencia, sus dispositivos o su uso reciente"""
+from api.database import db
+
+
+def _info(client, license_key, etag=None):
+    headers = {'Authorization': f'Bearer {license_key}'}
+    if etag:
+        headers['If-None-Match'] = etag
+    return client.get('/api/auth/info', headers=headers)
+
+
+def test_unchanged_license_is_not_modified(client, license_key):
+    etag = _info(client, license_key).headers['ETag']
+    
+    assert _info(client, license_key, etag).status_code == 304
+
+
+def test_usage_log_invalidates_etag(client, license_key):
+    etag = _info(client, license_key).headers['ETag']
+    
+    # recent_usage forma parte del cuerpo: un uso nuevo no puede dar 304
+    db.log_usage(license_key, 'device-a', '127.0.0.1', 'BIN_LOOKUP:1000001')
+    response = _info(client, license_key, etag)
+    assert response.status_code == 200
+    assert response.get_json()['recent_usage'][0]['action'] == 'BIN_LOOKUP:1000001'
+    assert _info(client, license_key, response.headers['ETag']).status_code == 304
+
+
+def test_state_change_invalidates_etag(client, license_key):
+    etag = _info(client, license_key).headers['ETag']
+    
+    assert db.consume_credit(license_key, note='test')
+    response = _info(client, license_key, etag)
+    assert response.status_code == 200
+    assert response.get_json()['credits_used'] == 1
+    
+    etag = response.headers['ETag']
+    db.admit_device(license_key, 'device-a')
+    assert _info(client, license_key, etag).status_code == 200
@@ -0,0 +1,68 @@
+"""Idempotency-Key en /api/generate: un solo cobro por clave"""
+import threading
+import time
+
+from api import main
+from api.database import db
+
+CUERPO = {
+    'bin': '1000001',
+    'bin_data': {'address': '1 Test Street', 'borough': 'MANHATTAN'},
+    'devices': [],
+    'output_profile': 'none'
+}
+
+
+def _generar(client, license_key, key, cuerpo=CUERPO):
+    return client.post('/api/generate', json=cuerpo, headers={
+        'Authorization': f'Bearer {license_key}', 'Idempotency-Key': key
+    })
+
+
+def test_concurrent_requests_with_same_key_charge_once(app, license_key, monkeypatch):
+    # El primero tarda en generar: los duplicados llegan con la clave reservada
+    generar_documentos = main._generar_documentos
+    def generacion_lenta(*args):
+        time.sleep(0.5)
+        return generar_documentos(*args)
+    monkeypatch.setattr(main, '_generar_documentos', generacion_lenta)
+
+    salida = threading.Barrier(4)
+    respuestas = []
+    def cliente():
+        client = app.test_client()
+        salida.wait()
+        respuestas.append(_generar(client, license_key, 'job-concurrent'))
+    hilos = [threading.Thread(target=cliente) for _ in range(4)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+
+    assert [r.status_code for r in respuestas] == [200] * 4
+    assert sorted(r.headers.get('Idempotent-Replayed', '') for r in respuestas) == ['', 'true', 'true', 'true']
+    assert len({r.get_data() for r in respuestas}) == 1
+    assert db.verify_license(license_key)['credits_used'] == 1
+
+
+def test_retry_replays_and_new_key_charges(client, license_key):
+    primera = _generar(client, license_key, 'job-1')
+    assert primera.status_code == 200
+    assert primera.get_json()['credits_used'] == 1
+
+    reintento = _generar(client, license_key, 'job-1')
+    assert reintento.headers['Idempotent-Replayed'] == 'true'
+    assert reintento.get_data() == primera.get_data()
+
+    # Otra clave es otro filing (otro BIN: no sale de la caché de salida)
+    nueva = _generar(client, license_key, 'job-2', dict(CUERPO, bin='1000002'))
+    assert nueva.get_json()['credits_used'] == 2
+    assert db.verify_license(license_key)['credits_used'] == 2
+
+
+def test_same_key_with_different_body_is_rejected(client, license_key):
+    assert _generar(client, license_key, 'job-1').status_code == 200
+
+    response = _generar(client, license_key, 'job-1', dict(CUERPO, bin='1000002'))
+    assert response.status_code == 422
+    assert db.verify_license(license_key)['credits_used'] == 1
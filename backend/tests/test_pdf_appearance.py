@@ -0,0 +1,49 @@
+"""Streams de apariencia y aplanado de formularios"""
+import io
+
+from pypdf import PdfReader, PdfWriter
+
+from api import pdf_appearance
+from conftest import TEMPLATES
+
+CAMPOS = {'r1c1': '1515 BROADWAY', 'r1c2': '10036', 'New': True, 'Repair': False}
+
+
+def _rellenar(modo):
+    plantilla = TEMPLATES['a433']
+    writer = PdfWriter(clone_from=PdfReader(plantilla))
+    pdf_appearance.rellenar_campos(writer, CAMPOS, plantilla, modo)
+    salida = io.BytesIO()
+    writer.write(salida)
+    return PdfReader(io.BytesIO(salida.getvalue()))
+
+
+def _widgets(reader, nombre):
+    return [annot.get_object() for pagina in reader.pages for annot in pagina.get('/Annots', [])
+            if annot.get_object().get('/T') == nombre]
+
+
+def test_generate_keeps_values_and_appearances():
+    reader = _rellenar(pdf_appearance.MODO_GENERAR)
+    campos = reader.get_fields()
+    
+    assert reader.trailer['/Root']['/AcroForm']['/NeedAppearances'].value is False
+    assert campos['r1c1']['/V'] == '1515 BROADWAY'
+    assert campos['r1c2']['/V'] == '10036'
+    assert campos['New']['/V'] != '/Off'
+    assert campos['Repair']['/V'] == '/Off'
+    for nombre in ('r1c1', 'r1c2'):
+        for widget in _widgets(reader, nombre):
+            contenido = widget['/AP']['/N'].get_object().get_data()
+            assert f"({CAMPOS[nombre]}) Tj".encode() in contenido
+
+
+def test_flatten_draws_values_and_removes_widgets():
+    reader = _rellenar(pdf_appearance.MODO_APLANAR)
+    
+    assert not reader.get_fields()
+    assert all(annot.get_object().get('/Subtype') != '/Widget'
+               for pagina in reader.pages for annot in pagina.get('/Annots', []))
+    texto = ''.join(pagina.extract_text() for pagina in reader.pages)
+    assert '1515 BROADWAY' in texto
+    assert '10036' in texto
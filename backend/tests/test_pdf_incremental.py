@@ -0,0 +1,70 @@
+"""Relleno incremental: la revisión añadida (/Prev) se abre con los mismos valores"""
+import io
+import re
+
+import pytest
+from pypdf import PdfReader
+
+from api import pdf_appearance, pdf_incremental
+from conftest import TEMPLATES
+
+# A-433 termina en xref stream, B-45 en tabla xref; los campos del B-45 se leen como '.application'
+CASOS = {
+    'xref_stream': ('a433', {'r1c1': '1515 BROADWAY', 'r1c2': '10036', 'New': True}, ''),
+    'xref_table': ('b45', {'application': 'A-12345', 'project': 'Fire alarm upgrade'}, '.')
+}
+
+
+def _startxref(datos):
+    return int(re.findall(rb'startxref\s+(\d+)', datos)[-1])
+
+
+def _rellenar(plantilla, campos, modo=pdf_appearance.MODO_GENERAR):
+    with open(plantilla, 'rb') as f:
+        contenido = f.read()
+    salida = io.BytesIO()
+    pdf_incremental.rellenar(contenido, campos, plantilla, modo).write(salida)
+    return contenido, salida.getvalue()
+
+
+def _valores(reader):
+    return {nombre: campo.get('/V') for nombre, campo in reader.get_fields().items()}
+
+
+@pytest.mark.parametrize('caso', CASOS)
+def test_update_reopens_with_same_values(caso):
+    clave, campos, prefijo = CASOS[caso]
+    original, datos = _rellenar(TEMPLATES[clave], campos)
+
+    # La plantilla queda intacta y la revisión nueva apunta a su xref
+    assert datos.startswith(original)
+    seccion = datos[len(original):]
+    assert re.findall(rb'/Prev (\d+)', seccion) == [str(_startxref(original)).encode()]
+    assert _startxref(datos) > len(original)
+
+    reader = PdfReader(io.BytesIO(datos), strict=True)
+    anterior = PdfReader(io.BytesIO(original))
+    assert len(reader.pages) == len(anterior.pages)
+    valores = _valores(reader)
+    for nombre, valor in campos.items():
+        if valor is True:
+            assert valores[prefijo + nombre] not in (None, '/Off')
+        else:
+            assert valores[prefijo + nombre] == valor
+    # Los campos no rellenados conservan su valor
+    rellenados = {prefijo + nombre for nombre in campos}
+    assert {k: v for k, v in valores.items() if k not in rellenados} == \
+        {k: v for k, v in _valores(anterior).items() if k not in rellenados}
+
+
+def test_need_appearances_mode_sets_flag():
+    clave, campos, _ = CASOS['xref_stream']
+    _, datos = _rellenar(TEMPLATES[clave], campos, pdf_appearance.MODO_NEED_APPEARANCES)
+    reader = PdfReader(io.BytesIO(datos), strict=True)
+    assert reader.trailer['/Root']['/AcroForm']['/NeedAppearances'].value is True
+
+
+def test_flatten_mode_is_rejected():
+    clave, campos, _ = CASOS['xref_table']
+    with pytest.raises(ValueError):
+        _rellenar(TEMPLATES[clave], campos, pdf_appearance.MODO_APLANAR)
@@ -0,0 +1,51 @@
+"""Perfiles de salida: el PDF reescrito se abre igual y conserva los valores"""
+import io
+
+import pytest
+from pypdf import PdfReader, PdfWriter
+
+from api import pdf_appearance
+from api.pdf_output import optimizar_pdf
+from conftest import TEMPLATES
+
+# Los campos del B-45 cuelgan de un padre sin nombre: en pypdf son '.application', ...
+CAMPOS = {'application': 'A-12345', 'project': 'Fire alarm upgrade', 'time': '10:30'}
+
+
+@pytest.fixture(scope='module')
+def formulario():
+    plantilla = TEMPLATES['b45']
+    writer = PdfWriter(clone_from=PdfReader(plantilla))
+    pdf_appearance.rellenar_campos(writer, CAMPOS, plantilla, pdf_appearance.MODO_GENERAR)
+    salida = io.BytesIO()
+    writer.write(salida)
+    return salida.getvalue()
+
+
+def _valores(datos):
+    reader = PdfReader(io.BytesIO(datos), strict=True)
+    return len(reader.pages), {nombre: campo.get('/V') for nombre, campo in reader.get_fields().items()}
+
+
+@pytest.mark.parametrize('perfil', ['standard', 'compact'])
+def test_optimized_pdf_reopens_with_same_values(formulario, perfil):
+    datos, informe = optimizar_pdf(formulario, perfil)
+    
+    assert informe['size_after'] == len(datos) < len(formulario)
+    paginas, valores = _valores(datos)
+    assert (paginas, valores) == _valores(formulario)
+    for nombre, valor in CAMPOS.items():
+        assert valores['.' + nombre] == valor
+
+
+def test_compact_uses_object_streams(formulario):
+    datos, _ = optimizar_pdf(formulario, 'compact')
+    
+    reader = PdfReader(io.BytesIO(datos), strict=True)
+    assert reader.xref_objStm
+    assert b'/ObjStm' in datos
+    assert b'/ObjStm' not in optimizar_pdf(formulario, 'standard')[0]
+
+
+def test_none_profile_returns_input(formulario):
+    assert optimizar_pdf(formulario, 'none')[0] is formulario
@@ -0,0 +1,27 @@
+"""Tokens de sesión ligados al fingerprint del dispositivo"""
+import pytest
+
+
+@pytest.fixture
+def token(client, license_key):
+    response = client.post('/api/auth/verify', json={'license_key': license_key, 'fingerprint': 'device-a'})
+    assert response.status_code == 200
+    return response.get_json()['token']
+
+
+def _info(client, token, fingerprint=None):
+    headers = {'Authorization': f'Bearer {token}'}
+    if fingerprint is not None:
+        headers['X-Fingerprint'] = fingerprint
+    return client.get('/api/auth/info', headers=headers)
+
+
+def test_token_accepted_from_same_device(client, token):
+    assert _info(client, token, 'device-a').status_code == 200
+
+
+@pytest.mark.parametrize('fingerprint', ['device-b', '', None])
+def test_token_rejected_from_other_device(client, token, fingerprint):
+    response = _info(client, token, fingerprint)
+    assert response.status_code == 401
+    assert response.get_json()['error'] == 'Session expired or revoked'
@@ -0,0 +1,192 @@
+"""
+Traducción del SQL de LicenseDB a PostgreSQL
+Con TEST_DATABASE_URL (p. ej. postgresql://postgres@/postgres?host=/tmp) las mismas
+operaciones se ejecutan también contra PostgreSQL en un esquema desechable.
+"""
+import os
+import re
+import uuid
+
+import pytest
+
+from api.database import LicenseDB
+from api.storage import SQLiteStorage, PostgresStorage, traducir_sql
+
+TEST_DATABASE_URL = os.environ.get('TEST_DATABASE_URL', '')
+
+AHORA = "to_char(timezone('UTC', now()), 'YYYY-MM-DD HH24:MI:SS')"
+
+
+@pytest.mark.parametrize('sqlite, postgres', [
+    ('SELECT * FROM licenses WHERE license_key = ? AND active = 1',
+     'SELECT * FROM licenses WHERE license_key = %s AND active = 1'),
+    # '?' y palabras clave dentro de literales no se tocan; '%' se escapa siempre
+    ("SELECT 'why?', \"col?\" FROM t WHERE note = ? AND action LIKE 'BIN:%'",
+     "SELECT 'why?', \"col?\" FROM t WHERE note = %s AND action LIKE 'BIN:%%'"),
+    ("SELECT 'it''s CURRENT_TIMESTAMP?' WHERE x = ?",
+     "SELECT 'it''s CURRENT_TIMESTAMP?' WHERE x = %s"),
+    ('UPDATE licenses SET last_used = CURRENT_TIMESTAMP WHERE id = ?',
+     f'UPDATE licenses SET last_used = {AHORA} WHERE id = %s'),
+    ("WHERE timestamp > datetime('now', ?)",
+     "WHERE timestamp > to_char(timezone('UTC', now()) + CAST(%s AS interval), 'YYYY-MM-DD HH24:MI:SS')"),
+    ("WHERE timestamp > DATETIME( 'now' , ? )",
+     "WHERE timestamp > to_char(timezone('UTC', now()) + CAST(%s AS interval), 'YYYY-MM-DD HH24:MI:SS')"),
+    ("SELECT (julianday('now') - julianday(fetched_at)) * 86400 AS age",
+     "SELECT CAST(EXTRACT(EPOCH FROM timezone('UTC', now()) - CAST(fetched_at AS timestamp)) "
+     "AS DOUBLE PRECISION) AS age"),
+    ("SET reset_date = date(reset_date, '+1 month')",
+     "SET reset_date = to_char(CAST(reset_date AS date) + interval '+1 month', 'YYYY-MM-DD')"),
+    ("SELECT substr(action, instr(action, ':') + 1)",
+     "SELECT substr(action, strpos(action, ':') + 1)"),
+    ('CREATE TABLE t (id INTEGER PRIMARY KEY AUTOINCREMENT, data BLOB, at REAL) WITHOUT ROWID',
+     'CREATE TABLE t (id SERIAL PRIMARY KEY, data BYTEA, at DOUBLE PRECISION)'),
+])
+def test_traducir_sql(sqlite, postgres):
+    assert traducir_sql(sqlite) == postgres
+
+
+@pytest.mark.parametrize('sqlite', [
+    "SELECT julianday(created_at) FROM licenses",
+    "SELECT strftime('%Y', created_at) FROM licenses",
+    "WHERE timestamp > datetime('now', '-1 hours')",
+])
+def test_traducir_sql_rejects_untranslated_functions(sqlite):
+    with pytest.raises(ValueError):
+        traducir_sql(sqlite)
+
+
+class _CursorGrabado:
+    def __init__(self, cursor, sentencias):
+        self._cursor = cursor
+        self._sentencias = sentencias
+
+    def execute(self, sql, *args):
+        self._sentencias.add(sql)
+        self._cursor.execute(sql, *args)
+        return self
+
+    def executemany(self, sql, *args):
+        self._sentencias.add(sql)
+        self._cursor.executemany(sql, *args)
+        return self
+
+    def __getattr__(self, nombre):
+        return getattr(self._cursor, nombre)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+
+class _ConexionGrabada:
+    def __init__(self, conexion, sentencias):
+        self.__dict__['_conexion'] = conexion
+        self.__dict__['_sentencias'] = sentencias
+
+    def cursor(self):
+        return _CursorGrabado(self._conexion.cursor(), self._sentencias)
+
+    def __getattr__(self, nombre):
+        return getattr(self._conexion, nombre)
+
+    def __setattr__(self, nombre, valor):
+        setattr(self._conexion, nombre, valor)
+
+
+class _SQLiteGrabado(SQLiteStorage):
+    """SQLite que anota cada sentencia que ejecuta LicenseDB"""
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.sentencias = set()
+
+    def connect(self):
+        return _ConexionGrabada(super().connect(), self.sentencias)
+
+
+def _operaciones(db):
+    """Todas las operaciones de LicenseDB; devuelve lo observable (sin timestamps)"""
+    key = db.create_license('storage@example.com', 'Storage Co', credits=3)['license_key']
+    r = {'verify': bool(db.verify_license(key))}
+    r['device'] = db.admit_device(key, 'fp-a', action='LOGIN', ip_address='127.0.0.1')['allowed']
+    r['device_limit'] = db.check_device_limit(key, 'fp-b', max_devices=1)
+    r['rate_ok'] = db.check_rate_limit(key)
+    slot = db.reserve_rate_limit(key, max_per_hour=1)
+    r['rate_full'] = db.reserve_rate_limit(key, max_per_hour=1)
+    db.release_rate_limit(slot)
+    db.log_request(key)
+    r['consumed'] = [db.consume_credit(key, note='GENERATE:1') for _ in range(4)]
+    r['credits'] = db.check_credits(key)
+    db.grant_credits(key, 2, note='grant')
+    db.refund_credit(key, note='refund')
+    db.snapshot_credit_balances()
+    r['history'] = [(e['entry_type'], e['amount'], e['balance_after']) for e in db.credit_history(key)]
+    r['summary'] = db.credit_summary(key)
+    r['usage'] = db.credit_usage(key, '2000-01-01')
+    db.log_usage(key, 'fp-a', '127.0.0.1', 'BIN_LOOKUP:1000001')
+    db.log_usage(key, 'fp-a', '127.0.0.1', 'BIN_LOOKUP:1000001')
+    r['info'] = {k: v for k, v in db.get_license_info(key).items()
+                 if k in ('credits_total', 'credits_used', 'credits_remaining')}
+    r['version'] = db.get_license_version(key)[0] > 0
+    r['licenses_version'] = db.get_licenses_version()[0]
+    r['epoch'] = (db.get_revocation_epoch(key), db.bump_revocation_epoch(key), db.get_revocation_epoch(key))
+    r['profile'] = (db.set_company_profile(key, {'company': {'name': 'X'}}), db.get_company_profile(key))
+    db.put_bin_cache('1000001', 'bis', {'campos': {'house': '1'}})
+    r['bin_cache'] = {s: (v[0], v[1] < 60) for s, v in db.get_bin_cache('1000001').items()}
+    r['bin_changes'] = [c['bin'] for c in db.bin_cache_changes()]
+    r['frequent'] = [(b['bin'], b['uses']) for b in db.frequent_bins(1, min_uses=2)]
+    r['recent'] = db.recent_usage_count(10, 100)
+    r['idempotency'] = [
+        db.claim_idempotency_key(key, 'k1', 'h', 60, 30)[0],
+        db.claim_idempotency_key(key, 'k1', 'h', 60, 30)[0],
+        db.claim_idempotency_key(key, 'k1', 'other', 60, 30)[0],
+    ]
+    db.complete_idempotency_key(key, 'k1', 200, b'{}')
+    r['idempotency'].append(db.claim_idempotency_key(key, 'k1', 'h', 60, 30)[:2])
+    db.claim_idempotency_key(key, 'k2', 'h', 60, 30)
+    db.release_idempotency_key(key, 'k2')
+    bulk = db.create_licenses_bulk([{'email': 'bulk-a@example.com'}, {'email': 'storage@example.com'}])
+    r['bulk'] = [row['success'] for row in bulk]
+    keys = [row['license_key'] for row in bulk if row['success']]
+    r['bulk_updates'] = (db.reset_credits_bulk(keys), db.reset_devices_bulk(keys), db.deactivate_licenses_bulk(keys))
+    r['listed'] = len(db.list_licenses())
+    r['stats'] = db.get_stats()['usage_last_30_days']
+    r['reset'] = db.reset_monthly_credits()
+    r['deactivated'] = db.deactivate_license(key)
+    db.health_check()
+    return r
+
+
+def test_every_statement_translates(tmp_path):
+    storage = _SQLiteGrabado(str(tmp_path / 'licenses.db'))
+    _operaciones(LicenseDB(storage))
+    
+    assert len(storage.sentencias) > 50
+    for sql in storage.sentencias:
+        traducido = traducir_sql(sql)
+        # Tantos parámetros %s como marcadores '?' fuera de literales
+        fuera = re.sub(r"'(?:[^']|'')*'", '', sql)
+        assert traducido.count('%s') == fuera.count('?'), sql
+
+
+@pytest.fixture
+def postgres_db():
+    if not TEST_DATABASE_URL:
+        pytest.skip('TEST_DATABASE_URL not set')
+    import psycopg2
+    esquema = f'test_{uuid.uuid4().hex[:12]}'
+    admin = psycopg2.connect(TEST_DATABASE_URL)
+    admin.autocommit = True
+    admin.cursor().execute(f'CREATE SCHEMA {esquema}')
+    separador = '&' if '?' in TEST_DATABASE_URL else '?'
+    storage = PostgresStorage(f'{TEST_DATABASE_URL}{separador}options=-csearch_path%3D{esquema}')
+    try:
+        yield LicenseDB(storage)
+    finally:
+        storage.dispose()
+        admin.cursor().execute(f'DROP SCHEMA {esquema} CASCADE')
+        admin.close()
+
+
+def test_postgres_matches_sqlite(tmp_path, postgres_db):
+    sqlite = _operaciones(LicenseDB(SQLiteStorage(str(tmp_path / 'licenses.db'))))
+    assert _operaciones(postgres_db) == sqlite
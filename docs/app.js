@@ -7,15 +7,23 @@ const API_URL = 'http://localhost:5000/api';
 // GLOBAL STATE
 // ============================================
 let currentLicense = null;
+let sessionToken = null;
 let currentFingerprint = null;
 let binData = null;
 let devices = [];
 
 // Device catalog
+function ordinal(n) {
+    const resto = n % 100;
+    if (resto >= 10 && resto <= 20) return n + "th";
+    return n + ({ 1: "st", 2: "nd", 3: "rd" }[n % 10] || "th");
+}
+
+// Mismo orden que FULL_FLOOR_LIST en el backend (120 pisos numerados)
 const FLOOR_LIST = [
-    "Sub Cellar", "Cellar", "Basement", "Ground Floor", "1st Floor", "2nd Floor", 
-    "3rd Floor", "4th Floor", "5th Floor", "6th Floor", "7th Floor", "8th Floor", 
-    "9th Floor", "10th Floor", "Roof", "Penthouse", "Mechanical Floor"
+    "Sub Cellar", "Cellar", "Basement", "Ground Floor",
+    ...Array.from({ length: 120 }, (_, i) => ordinal(i + 1) + " Floor"),
+    "Roof", "Penthouse", "Mechanical Floor"
 ];
 
 const DEVICE_CATALOG = {
@@ -97,6 +105,7 @@ async function handleLogin(e) {
         
         if (response.ok) {
             currentLicense = licenseKey;
+            sessionToken = data.token || null;
             localStorage.setItem('fdny_license', licenseKey);
             
             updateCreditsDisplay(data.credits_used, data.credits_total);
@@ -132,6 +141,7 @@ async function verifyAndLoadSession(license) {
         if (response.ok) {
             const data = await response.json();
             currentLicense = license;
+            sessionToken = data.token || null;
             updateCreditsDisplay(data.credits_used, data.credits_total);
             
             document.getElementById('loginScreen').classList.remove('active');
@@ -150,6 +160,7 @@ async function verifyAndLoadSession(license) {
 function logout() {
     if (confirm('Are you sure you want to logout?')) {
         currentLicense = null;
+        sessionToken = null;
         localStorage.removeItem('fdny_license');
         devices = [];
         binData = null;
@@ -165,6 +176,34 @@ function logout() {
     }
 }
 
+// Token de sesión para lecturas; la clave de licencia solo si no hay token
+function readAuthHeader() {
+    return 'Bearer ' + (sessionToken || currentLicense);
+}
+
+// Renovar el token de sesión (expirado o revocado)
+async function refreshSessionToken() {
+    const response = await fetch(API_URL + '/auth/verify', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json'
+        },
+        body: JSON.stringify({
+            license_key: currentLicense,
+            fingerprint: currentFingerprint
+        })
+    });
+    
+    if (!response.ok) {
+        sessionToken = null;
+        return false;
+    }
+    
+    const data = await response.json();
+    sessionToken = data.token || null;
+    return true;
+}
+
 // ============================================
 // FINGERPRINTING
 // ============================================
@@ -202,18 +241,31 @@ async function loadBINData() {
     log('Loading data for BIN: ' + binInput + '...');
     
     try {
-        const response = await fetch(API_URL + '/bin/' + binInput, {
+        let response = await fetch(API_URL + '/bin/' + binInput, {
             headers: {
-                'Authorization': 'Bearer ' + currentLicense
+                'Authorization': readAuthHeader(),
+                'X-Fingerprint': currentFingerprint
             }
         });
         
+        if (response.status === 401 && await refreshSessionToken()) {
+            response = await fetch(API_URL + '/bin/' + binInput, {
+                headers: {
+                    'Authorization': readAuthHeader(),
+                    'X-Fingerprint': currentFingerprint
+                }
+            });
+        }
+        
         const data = await response.json();
         
         if (response.ok) {
             binData = data;
             displayBINInfo(data);
             log('BIN data loaded successfully', 'success');
+            if (data._freshness === 'stale') {
+                log('NYC Open Data is slow or down: some fields come from an older copy', 'warning');
+            }
         } else {
             log(data.error || 'Failed to load BIN data', 'error');
             alert(data.error || 'Failed to load BIN data');
@@ -321,6 +373,45 @@ function updateDeviceTable() {
 // ============================================
 // DOCUMENT GENERATION
 // ============================================
+// Último intento de generación sin respuesta del servidor: un reintento con
+// los mismos datos reutiliza su Idempotency-Key (no se re-genera ni se re-cobra)
+let pendingGeneration = null;
+const GENERATE_RETRIES = 2;
+
+function newIdempotencyKey() {
+    if (window.crypto && crypto.randomUUID) {
+        return crypto.randomUUID();
+    }
+    return Date.now().toString(36) + '-' + Math.random().toString(36).slice(2);
+}
+
+async function postGenerate(body, idempotencyKey) {
+    for (let attempt = 0; ; attempt++) {
+        try {
+            const response = await fetch(API_URL + '/generate', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                    'Authorization': 'Bearer ' + currentLicense,
+                    'X-Fingerprint': currentFingerprint,
+                    'Idempotency-Key': idempotencyKey
+                },
+                body: body
+            });
+            // 409: el intento anterior sigue en curso en el servidor
+            if (response.status !== 409 || attempt >= GENERATE_RETRIES) {
+                return response;
+            }
+        } catch (error) {
+            if (attempt >= GENERATE_RETRIES) {
+                throw error;
+            }
+            log('Connection lost, retrying...', 'warning');
+        }
+        await new Promise(function(resolve) { setTimeout(resolve, 1000 * (attempt + 1)); });
+    }
+}
+
 async function generateDocuments() {
     if (!binData) {
         alert('Please load BIN data first (Step 1)');
@@ -338,20 +429,20 @@ async function generateDocuments() {
     log('Starting document generation...');
     showLoading(true);
     
+    const body = JSON.stringify({
+        bin: binData.bin,
+        devices: devices,
+        bin_data: binData
+    });
+    if (!pendingGeneration || pendingGeneration.body !== body) {
+        pendingGeneration = { body: body, key: newIdempotencyKey() };
+    }
+    
     try {
-        const response = await fetch(API_URL + '/generate', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-                'Authorization': 'Bearer ' + currentLicense,
-                'X-Fingerprint': currentFingerprint
-            },
-            body: JSON.stringify({
-                bin: binData.bin,
-                devices: devices,
-                bin_data: binData
-            })
-        });
+        const response = await postGenerate(body, pendingGeneration.key);
+        if (response.status !== 409) {
+            pendingGeneration = null;
+        }
         
         const data = await response.json();
         